@@ -0,0 +1,242 @@
+"""generate_clustering
+
+Creates a synthetic .clustering file for benchmarking. The same parameters
+(including the seed) always create the identical file.
+
+Usage:
+  generate_clustering.py --output=<synthetic.clustering> [--n_clusters=<n>] [--min_size=<size>]
+                         [--max_size=<size>] [--size_exponent=<exponent>] [--ptm_density=<density>]
+                         [--n_peaks=<peaks>] [--identified=<fraction>] [--seed=<seed>]
+  generate_clustering.py (--help | --version)
+
+Options:
+  -o, --output=<synthetic.clustering>  Path to the .clustering file to create.
+  -n, --n_clusters=<n>                 Number of clusters to create [default: 10000].
+  --min_size=<size>                    Minimum number of spectra per cluster [default: 1].
+  --max_size=<size>                    Maximum number of spectra per cluster [default: 500].
+  --size_exponent=<exponent>           Exponent of the power law the cluster sizes follow. Larger values
+                                       create more small clusters, 0 creates uniformly distributed
+                                       sizes [default: 2.0].
+  --ptm_density=<density>              Fraction of identifications that carry PTMs [default: 0.1].
+  --n_peaks=<peaks>                    Number of consensus peaks per cluster [default: 50].
+  --identified=<fraction>              Fraction of identified spectra [default: 0.7].
+  --seed=<seed>                        Seed of the random number generator [default: 42].
+  -h, --help                           Displays this help.
+  -v, --version                        Displays the tool's version.
+"""
+
+import sys
+import uuid
+import random
+from docopt import docopt
+
+AMINO_ACID_MASSES = {"A": 71.03711, "R": 156.10111, "N": 114.04293, "D": 115.02694, "C": 103.00919,
+                     "E": 129.04259, "Q": 128.05858, "G": 57.02146, "H": 137.05891, "I": 113.08406,
+                     "L": 113.08406, "K": 128.09496, "M": 131.04049, "F": 147.06841, "P": 97.05276,
+                     "S": 87.03203, "T": 101.04768, "W": 186.07931, "Y": 163.06333, "V": 99.06841}
+
+WATER_MASS = 18.01056
+PROTON_MASS = 1.00728
+
+# PSI-MOD accessions of common modifications
+PTM_ACCESSIONS = ("MOD:00719", "MOD:00397", "MOD:00046", "MOD:00394", "MOD:00400")
+
+HEADER = "name=SyntheticClustering\nsimilarity_method=CombinedFisherIntensityTest\nversion=1.0\n" \
+         "threshold=0.99\nfdr=0\ndescription=Synthetic benchmark result\n\n"
+
+
+def generate_peptides(rng, n_peptides):
+    """
+    Creates random tryptic peptides.
+
+    :param rng: The random.Random object to use
+    :param n_peptides: Number of peptides to create
+    :return: A list of peptide sequences
+    """
+    amino_acids = "".join(sorted(AMINO_ACID_MASSES.keys()))
+    peptides = list()
+
+    for i in range(n_peptides):
+        length = rng.randint(6, 24)
+        peptides.append("".join(rng.choice(amino_acids) for j in range(length)) + rng.choice("KR"))
+
+    return peptides
+
+
+def get_precursor_mz(sequence, charge):
+    """
+    Calculates the precursor m/z of an (unmodified) peptide.
+
+    :param sequence: The peptide's sequence
+    :param charge: The precursor charge
+    :return: The m/z value
+    """
+    mass = sum(AMINO_ACID_MASSES[amino_acid] for amino_acid in sequence) + WATER_MASS
+
+    return (mass + charge * PROTON_MASS) / charge
+
+
+def get_cluster_size(rng, min_size, max_size, size_exponent):
+    """
+    Draws a cluster size from a (continuous) power law distribution.
+
+    :param rng: The random.Random object to use
+    :param min_size: The minimum size
+    :param max_size: The maximum size
+    :param size_exponent: The distribution's exponent, 0 creates uniformly distributed sizes
+    :return: The cluster size
+    """
+    u = rng.random()
+
+    if size_exponent == 1:
+        size = min_size * (max_size / min_size) ** u
+    else:
+        lower = min_size ** (1 - size_exponent)
+        upper = (max_size + 1) ** (1 - size_exponent)
+        size = (lower + (upper - lower) * u) ** (1 / (1 - size_exponent))
+
+    return max(min_size, min(max_size, int(size)))
+
+
+def create_ptm_string(rng, sequence):
+    """
+    Creates the PTM definition of a modified peptide.
+
+    :param rng: The random.Random object to use
+    :param sequence: The peptide's sequence
+    :return: The PTM string in the .clustering file's format
+    """
+    positions = sorted(rng.sample(range(1, len(sequence) + 1), min(len(sequence), rng.randint(1, 2))))
+
+    return ",".join(str(position) + "-" + rng.choice(PTM_ACCESSIONS) for position in positions)
+
+
+def create_cluster(rng, peptides, spectrum_index, min_size, max_size, size_exponent, ptm_density, n_peaks,
+                   identified):
+    """
+    Creates the lines of a single cluster.
+
+    :param rng: The random.Random object to use
+    :param peptides: The peptides to draw the identifications from
+    :param spectrum_index: Index of the cluster's first spectrum
+    :param min_size: Minimum number of spectra per cluster
+    :param max_size: Maximum number of spectra per cluster
+    :param size_exponent: The size distribution's exponent
+    :param ptm_density: Fraction of identifications that carry PTMs
+    :param n_peaks: Number of consensus peaks
+    :param identified: Fraction of identified spectra
+    :return: Tuple of (the cluster's lines as string, number of spectra)
+    """
+    cluster_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    size = get_cluster_size(rng, min_size, max_size, size_exponent)
+    charge = rng.choice((2, 2, 2, 3, 3, 4))
+    main_peptide = rng.choice(peptides)
+    cluster_mz = get_precursor_mz(main_peptide, charge)
+    retention_time = rng.uniform(300, 7200)
+
+    spec_lines = list()
+    sequence_counts = dict()
+    precursor_mzs = list()
+
+    for i in range(size):
+        sequence = ""
+        ptm_string = ""
+
+        if rng.random() < identified:
+            # most spectra are identified as the cluster's main peptide
+            sequence = main_peptide if rng.random() < 0.9 else rng.choice(peptides)
+
+            if rng.random() < ptm_density:
+                ptm_string = create_ptm_string(rng, sequence)
+
+            sequence_counts[sequence] = sequence_counts.get(sequence, 0) + 1
+
+        precursor_mz = cluster_mz + rng.gauss(0, 0.005)
+        precursor_mzs.append(precursor_mz)
+        index = spectrum_index + i
+        mgf_file = "synthetic_" + str(index % 20) + ".mgf"
+
+        spec_lines.append("SPEC\t#file=" + mgf_file + "#id=index=" + str(index) + "#title=id=PXD000000;" +
+                          mgf_file + ";spectrum=" + str(index) + "\ttrue\t" + sequence + "\t" +
+                          "{:.4f}".format(precursor_mz) + "\t" + str(charge) + "\t" +
+                          ("9606" if sequence else "") + "\t" + ptm_string + "\t" +
+                          "{:.3f}".format(rng.random()) + "\t" +
+                          '{"RT": "' + "{:.3f}".format(retention_time + rng.gauss(0, 10)) + '"}')
+
+    peaks = sorted(rng.uniform(100, 2000) for i in range(n_peaks))
+
+    lines = ["=Cluster=",
+             "id=" + cluster_id,
+             "av_precursor_mz=" + "{:.3f}".format(sum(precursor_mzs) / size),
+             "av_precursor_intens=1.0",
+             "sequence=[" + ",".join(sequence + ":" + str(count) for sequence, count in sequence_counts.items()) + "]",
+             "consensus_mz=" + ",".join("{:.3f}".format(mz) for mz in peaks),
+             "consensus_intens=" + ",".join("{:.2f}".format(rng.uniform(1, 5000)) for i in range(n_peaks)),
+             "consensus_count=" + ",".join(str(rng.randint(1, size)) for i in range(n_peaks))]
+
+    return "\n".join(lines + spec_lines) + "\n", size
+
+
+def write_clustering_file(filename, n_clusters=10000, min_size=1, max_size=500, size_exponent=2.0,
+                          ptm_density=0.1, n_peaks=50, identified=0.7, seed=42):
+    """
+    Writes a synthetic .clustering file. The same parameters always create
+    the identical file.
+
+    :param filename: Path to the file to create
+    :param n_clusters: Number of clusters to create
+    :param min_size: Minimum number of spectra per cluster
+    :param max_size: Maximum number of spectra per cluster
+    :param size_exponent: Exponent of the power law the cluster sizes follow. 0 creates
+                          uniformly distributed sizes.
+    :param ptm_density: Fraction of identifications that carry PTMs
+    :param n_peaks: Number of consensus peaks per cluster
+    :param identified: Fraction of identified spectra
+    :param seed: Seed of the random number generator
+    :return: The total number of spectra
+    """
+    if min_size < 1 or max_size < min_size:
+        raise Exception("Invalid cluster size range")
+
+    rng = random.Random(seed)
+    peptides = generate_peptides(rng, max(10, n_clusters // 2))
+    n_spectra = 0
+
+    with open(filename, "w", newline="\n") as writer:
+        writer.write(HEADER)
+
+        for i in range(n_clusters):
+            cluster, size = create_cluster(rng, peptides, n_spectra, min_size, max_size, size_exponent, ptm_density,
+                                           n_peaks, identified)
+            writer.write(cluster)
+            n_spectra += size
+
+    return n_spectra
+
+
+def main():
+    arguments = docopt(__doc__, version="generate_clustering 1.0")
+
+    n_clusters = int(arguments["--n_clusters"])
+    min_size = int(arguments["--min_size"])
+    max_size = int(arguments["--max_size"])
+
+    if n_clusters < 1:
+        print("Error: At least one cluster must be created")
+        sys.exit(1)
+
+    if min_size < 1 or max_size < min_size:
+        print("Error: Invalid cluster size range")
+        sys.exit(1)
+
+    n_spectra = write_clustering_file(arguments["--output"], n_clusters=n_clusters, min_size=min_size,
+                                      max_size=max_size, size_exponent=float(arguments["--size_exponent"]),
+                                      ptm_density=float(arguments["--ptm_density"]),
+                                      n_peaks=int(arguments["--n_peaks"]),
+                                      identified=float(arguments["--identified"]), seed=int(arguments["--seed"]))
+
+    print("Created " + str(n_clusters) + " clusters with " + str(n_spectra) + " spectra")
+
+
+if __name__ == "__main__":
+    main()
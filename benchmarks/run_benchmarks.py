@@ -0,0 +1,487 @@
+"""run_benchmarks
+
+Measures the performance of the parsers, analysers, and command line tools
+on a (synthetic) .clustering file. Every benchmark is run in a separate
+process and reported as clusters/s, MB/s, and the peak resident memory
+(RSS) of the largest process.
+
+If no input file is set, a synthetic file is created using generate_clustering.
+
+Usage:
+  run_benchmarks.py [--input=<file.clustering>] [--output=<results.json>] [--n_clusters=<n>] [--seed=<seed>]
+                    [--processes=<n>] [--repeat=<n>] [BENCHMARK...]
+  run_benchmarks.py --list
+  run_benchmarks.py --run=<benchmark> --input=<file.clustering> [--processes=<n>]
+  run_benchmarks.py (--help | --version)
+
+Options:
+  -i, --input=<file.clustering>  The .clustering file to use. If not set, a synthetic file is created.
+  -o, --output=<results.json>    If set, the results are written to this file in JSON format.
+  -n, --n_clusters=<n>           Number of clusters of the synthetic file [default: 10000].
+  --seed=<seed>                  Seed used to create the synthetic file [default: 42].
+  -p, --processes=<n>            Number of processes used by the parallel benchmarks and tools [default: 4].
+  -r, --repeat=<n>               Number of times every benchmark is run. The fastest run is
+                                 reported [default: 1].
+  -l, --list                     Lists all available benchmarks.
+  --run=<benchmark>              Runs a single benchmark in this process and prints the result as
+                                 JSON (used internally).
+  -h, --help                     Displays this help.
+  -v, --version                  Displays the tool's version.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import datetime
+import tempfile
+import importlib
+import contextlib
+import subprocess
+from docopt import docopt
+
+# the benchmarks always measure the source tree they are part of
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import spectra_cluster
+from spectra_cluster import objects
+from spectra_cluster import clustering_parser
+from spectra_cluster.analyser.common import process_clustering_file
+
+import generate_clustering
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident memory of this process and of its largest
+    (finished) child process.
+
+    :return: The peak RSS in MB or None if it cannot be determined
+    """
+    if resource is None:
+        return None
+
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # macOS reports bytes, Linux kB
+    if sys.platform == "darwin":
+        return peak_rss / 1024 / 1024
+
+    return peak_rss / 1024
+
+
+def parse_all(clustering_file, work_dir, processes, **parser_arguments):
+    """
+    Iterates over all clusters using the ClusteringParser.
+
+    :param clustering_file: Path to the .clustering file
+    :param work_dir: Temporary directory for the benchmark's output
+    :param processes: Number of processes to use (ignored)
+    :param parser_arguments: Additional arguments passed to the ClusteringParser
+    :return: The benchmark function
+    """
+    parser = clustering_parser.ClusteringParser(clustering_file, **parser_arguments)
+
+    def run():
+        for cluster in parser:
+            pass
+
+    return run
+
+
+def parse_parallel(clustering_file, work_dir, processes):
+    """
+    Iterates over all clusters using the ParallelClusteringParser.
+
+    :param clustering_file: Path to the .clustering file
+    :param work_dir: Temporary directory for the benchmark's output
+    :param processes: Number of processes to use
+    :return: The benchmark function
+    """
+    parser = clustering_parser.ParallelClusteringParser(clustering_file, processes=processes)
+
+    def run():
+        for cluster in parser:
+            pass
+
+    return run
+
+
+def construct_clusters(clustering_file, work_dir, processes):
+    """
+    Creates Cluster objects from already parsed spectra. Only the creation
+    of the Cluster objects is measured.
+
+    :param clustering_file: Path to the .clustering file
+    :param work_dir: Temporary directory for the benchmark's output
+    :param processes: Number of processes to use (ignored)
+    :return: The benchmark function
+    """
+    cluster_data = list()
+
+    for cluster in clustering_parser.ClusteringParser(clustering_file):
+        cluster_data.append((cluster.id, cluster.precursor_mz, cluster.consensus_mz, cluster.consensus_intens,
+                             cluster.get_spectra()))
+
+    def run():
+        for cluster_id, precursor_mz, consensus_mz, consensus_intens, spectra in cluster_data:
+            objects.Cluster(cluster_id, precursor_mz, consensus_mz, consensus_intens, spectra)
+
+    return run
+
+
+def run_analyser(create_analyser):
+    """
+    Creates a benchmark that processes the file using the analyser
+    returned by create_analyser.
+
+    :param create_analyser: Function that takes an opened result file and returns the analyser
+    :return: The benchmark's setup function
+    """
+    def setup(clustering_file, work_dir, processes):
+        def run():
+            with open(os.path.join(work_dir, "analyser_result.txt"), "w") as result_file:
+                process_clustering_file(clustering_file, create_analyser(result_file))
+
+        return run
+
+    return setup
+
+
+def create_cluster_features(result_file):
+    from spectra_cluster.analyser.cluster_features import ClusterAsFeatures
+
+    return ClusterAsFeatures(result_file)
+
+
+def create_cluster_table_builder(result_file):
+    from spectra_cluster.analyser.cluster_table_builder import ClusterTableBuilder
+
+    return ClusterTableBuilder()
+
+
+def create_clustering_stats(result_file):
+    from spectra_cluster.analyser.clustering_stats import ClusteringStatsAnalyser
+
+    return ClusteringStatsAnalyser()
+
+
+def create_id_transferer(result_file):
+    from spectra_cluster.analyser.id_transferer import IdTransferer
+
+    return IdTransferer()
+
+
+def create_spectra_in_cluster(result_file):
+    from spectra_cluster.analyser.spectra_in_cluster import SpectraInClusterExporter
+
+    return SpectraInClusterExporter(result_file)
+
+
+def create_mgf_exporter(result_file):
+    from spectra_cluster.analyser.exporter.mgf_exporter import MgfExporter
+
+    return MgfExporter(result_file)
+
+
+def create_pipeline(result_file):
+    from spectra_cluster.analyser.pipeline import AnalyserPipeline
+
+    return AnalyserPipeline([create_cluster_features(result_file), create_clustering_stats(result_file),
+                             create_id_transferer(result_file)])
+
+
+def get_first_peptide(clustering_file):
+    """
+    Returns the first peptide of the file's "sequence=" lines.
+
+    :param clustering_file: Path to the .clustering file
+    :return: The peptide sequence or None if no cluster is identified
+    """
+    with open(clustering_file, "r") as reader:
+        for line in reader:
+            if not line.startswith("sequence=["):
+                continue
+
+            for entry in line.strip()[10:-1].split(","):
+                peptide = entry[:entry.rfind(":")]
+
+                if len(peptide) > 0:
+                    return peptide
+
+    return None
+
+
+def run_tool(module_name, create_arguments):
+    """
+    Creates a benchmark that runs the main function of a command line tool.
+
+    :param module_name: Name of the tool's module
+    :param create_arguments: Function that takes the clustering file, the work directory, and
+                             the number of processes and returns the tool's arguments
+    :return: The benchmark's setup function
+    """
+    def setup(clustering_file, work_dir, processes):
+        module = importlib.import_module(module_name)
+        arguments = [module_name.split(".")[-1]] + create_arguments(clustering_file, work_dir, processes)
+
+        def run():
+            sys.argv = arguments
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                try:
+                    module.main()
+                except SystemExit as e:
+                    if e.code not in (None, 0):
+                        raise Exception(module_name + " failed with exit code " + str(e.code))
+
+        return run
+
+    return setup
+
+
+BENCHMARKS = {
+    "parser": parse_all,
+    "parser_lazy": lambda clustering_file, work_dir, processes: parse_all(clustering_file, work_dir, processes,
+                                                                          lazy=True),
+    "parser_parallel": parse_parallel,
+    "cluster_construction": construct_clusters,
+    "analyser_cluster_features": run_analyser(create_cluster_features),
+    "analyser_cluster_table_builder": run_analyser(create_cluster_table_builder),
+    "analyser_clustering_stats": run_analyser(create_clustering_stats),
+    "analyser_id_transferer": run_analyser(create_id_transferer),
+    "analyser_spectra_in_cluster": run_analyser(create_spectra_in_cluster),
+    "analyser_mgf_exporter": run_analyser(create_mgf_exporter),
+    "analyser_pipeline": run_analyser(create_pipeline),
+    "cli_cluster_features": run_tool(
+        "spectra_cluster.ui.cluster_features_cli",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "features.tsv"),
+                                        "--processes", str(processes)]),
+    "cli_cluster_parameter_extractor": run_tool(
+        "spectra_cluster.ui.cluster_parameter_extractor",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "parameters.tsv")]),
+    "cli_cluster_result_comparator": run_tool(
+        "spectra_cluster.ui.cluster_result_comparator",
+        lambda f, work_dir, processes: ["--output", os.path.join(work_dir, "network.xml"), f, f]),
+    "cli_cluster_table_exporter": run_tool(
+        "spectra_cluster.ui.cluster_table_exporter",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "table"),
+                                        "--processes", str(processes)]),
+    "cli_clustering_stats": run_tool(
+        "spectra_cluster.ui.clustering_stats",
+        lambda f, work_dir, processes: ["--output", os.path.join(work_dir, "stats.tsv"), "--min_size", "3", f]),
+    "cli_consensus_spectrum_exporter": run_tool(
+        "spectra_cluster.ui.consensus_spectrum_exporter",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "spectra.mgf"),
+                                        "--processes", str(processes)]),
+    "cli_id_transferer": run_tool(
+        "spectra_cluster.ui.id_transferer_cli",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "identifications.tsv"),
+                                        "--processes", str(processes)]),
+    "cli_peptide_finder": run_tool(
+        "spectra_cluster.ui.peptide_finder",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "clusters.tsv"),
+                                        "--rebuild", get_first_peptide(f)]),
+    "cli_pipeline": run_tool(
+        "spectra_cluster.ui.pipeline_cli",
+        lambda f, work_dir, processes: ["--input", f, "--features", os.path.join(work_dir, "features.tsv"),
+                                        "--consensus_spectra", os.path.join(work_dir, "spectra.mgf"),
+                                        "--identifications", os.path.join(work_dir, "identifications.tsv"),
+                                        "--stats", os.path.join(work_dir, "stats.tsv"),
+                                        "--spectra_in_cluster", os.path.join(work_dir, "spectra_in_cluster.tsv"),
+                                        "--processes", str(processes)]),
+    "cli_spectra_in_cluster": run_tool(
+        "spectra_cluster.tools.spectra_in_cluster",
+        lambda f, work_dir, processes: ["--input", f, "--output", os.path.join(work_dir, "spectra_in_cluster.tsv")])
+}
+
+
+def run_benchmark(name, clustering_file, processes):
+    """
+    Runs a single benchmark in the current process.
+
+    :param name: The benchmark's name
+    :param clustering_file: Path to the .clustering file
+    :param processes: Number of processes to use
+    :return: A dict with the benchmark's runtime ("seconds") and peak memory usage
+    """
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        run = BENCHMARKS[name](clustering_file, work_dir, processes)
+        setup_peak_rss = get_peak_rss()
+
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir)
+
+    return {"seconds": seconds, "peak_rss_mb": get_peak_rss(), "setup_peak_rss_mb": setup_peak_rss}
+
+
+def run_in_process(name, clustering_file, processes):
+    """
+    Runs a benchmark in a new process so that the peak memory usage
+    is not influenced by other benchmarks.
+
+    :param name: The benchmark's name
+    :param clustering_file: Path to the .clustering file
+    :param processes: Number of processes to use
+    :return: The benchmark's result as returned by run_benchmark or a dict with
+             the "error" if the benchmark failed.
+    """
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--run=" + name,
+                             "--input=" + clustering_file, "--processes=" + str(processes)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    if result.returncode != 0:
+        error_lines = result.stderr.strip().split("\n")
+
+        return {"error": error_lines[-1] if len(error_lines[-1]) > 0 else "Exit code " + str(result.returncode)}
+
+    return json.loads(result.stdout.strip().split("\n")[-1])
+
+
+def get_file_stats(clustering_file):
+    """
+    Determines the size and the number of clusters of a .clustering file.
+
+    :param clustering_file: Path to the .clustering file
+    :return: Tuple of (size in bytes, number of clusters)
+    """
+    n_clusters = 0
+
+    with open(clustering_file, "rb") as reader:
+        for line in reader:
+            if line.startswith(b"=Cluster="):
+                n_clusters += 1
+
+    return os.path.getsize(clustering_file), n_clusters
+
+
+def run_benchmarks(names, clustering_file, processes, repeat=1):
+    """
+    Runs the benchmarks and calculates their throughput. Every benchmark
+    is run in a separate process.
+
+    :param names: Names of the benchmarks to run
+    :param clustering_file: Path to the .clustering file
+    :param processes: Number of processes used by parallel benchmarks
+    :param repeat: Number of times every benchmark is run. The fastest run is reported.
+    :return: A dict with the benchmark's name as key and its results (dict) as value
+    """
+    file_size, n_clusters = get_file_stats(clustering_file)
+    results = dict()
+
+    for name in names:
+        print("Running " + name + "...", end="", flush=True)
+
+        runs = [run_in_process(name, clustering_file, processes) for i in range(repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+
+        if len(errors) > 0:
+            results[name] = {"error": errors[0]}
+            print(" failed: " + errors[0])
+            continue
+
+        seconds = min(run["seconds"] for run in runs)
+        peak_rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+        setup_peak_rss = [run["setup_peak_rss_mb"] for run in runs if run["setup_peak_rss_mb"] is not None]
+
+        # the memory used by the benchmark's setup is reported separately
+        results[name] = {"seconds": seconds,
+                         "clusters_per_second": n_clusters / seconds,
+                         "mb_per_second": file_size / 1024 / 1024 / seconds,
+                         "peak_rss_mb": max(peak_rss) if len(peak_rss) > 0 else None,
+                         "setup_peak_rss_mb": max(setup_peak_rss) if len(setup_peak_rss) > 0 else None}
+
+        print(" {:.2f} s, {:.0f} clusters/s, {:.2f} MB/s".format(seconds, results[name]["clusters_per_second"],
+                                                                 results[name]["mb_per_second"]))
+
+    return results
+
+
+def main():
+    arguments = docopt(__doc__, version="run_benchmarks 1.0")
+
+    if arguments["--list"]:
+        print("\n".join(sorted(BENCHMARKS.keys())))
+        return
+
+    processes = int(arguments["--processes"])
+
+    if arguments["--run"] is not None:
+        if arguments["--run"] not in BENCHMARKS:
+            print("Error: Unknown benchmark '" + arguments["--run"] + "'")
+            sys.exit(1)
+
+        result = run_benchmark(arguments["--run"], arguments["--input"], processes)
+        print(json.dumps(result))
+        return
+
+    names = arguments["BENCHMARK"] if len(arguments["BENCHMARK"]) > 0 else sorted(BENCHMARKS.keys())
+
+    for name in names:
+        if name not in BENCHMARKS:
+            print("Error: Unknown benchmark '" + name + "'")
+            sys.exit(1)
+
+    if arguments["--output"] is not None and os.path.isfile(arguments["--output"]):
+        print("Error: Output file exists")
+        sys.exit(1)
+
+    temp_dir = None
+    generator_parameters = None
+
+    try:
+        if arguments["--input"] is None:
+            temp_dir = tempfile.mkdtemp()
+            clustering_file = os.path.join(temp_dir, "synthetic.clustering")
+            generator_parameters = {"n_clusters": int(arguments["--n_clusters"]), "seed": int(arguments["--seed"])}
+
+            print("Creating synthetic .clustering file...")
+            generate_clustering.write_clustering_file(clustering_file, **generator_parameters)
+        else:
+            clustering_file = arguments["--input"]
+
+            if not os.path.isfile(clustering_file):
+                print("Error: Cannot find input file '" + clustering_file + "'")
+                sys.exit(1)
+
+        file_size, n_clusters = get_file_stats(clustering_file)
+        results = run_benchmarks(names, clustering_file, processes, repeat=int(arguments["--repeat"]))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    if arguments["--output"] is not None:
+        report = {"version": spectra_cluster.__version__,
+                  "date": datetime.datetime.now().isoformat(),
+                  "python": platform.python_version(),
+                  "platform": platform.platform(),
+                  "cpu_count": os.cpu_count(),
+                  "processes": processes,
+                  "input": {"file": None if generator_parameters is not None else os.path.abspath(clustering_file),
+                            "generator": generator_parameters,
+                            "size_bytes": file_size,
+                            "n_clusters": n_clusters},
+                  "benchmarks": results}
+
+        with open(arguments["--output"], "w") as writer:
+            json.dump(report, writer, indent=2, sort_keys=True)
+
+        print("Results written to " + arguments["--output"])
+
+
+if __name__ == "__main__":
+    main()
@@ -94,6 +94,7 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
         'dev': ['pyinstaller'],
+        'compression': ['isal', 'zstandard'],
         #'test': ['coverage'],
     },
 
@@ -126,7 +127,10 @@ setup(
             'spectra_in_cluster=spectra_cluster.tools.spectra_in_cluster:main',
             'fasta_species_filter=spectra_cluster.ui.fasta_species_filter:main',
             'clustering_stats=spectra_cluster.ui.clustering_stats:main',
-            'cluster_result_comparator=spectra_cluster.ui.cluster_result_comparator:main'
+            'cluster_result_comparator=spectra_cluster.ui.cluster_result_comparator:main',
+            'pipeline_cli=spectra_cluster.ui.pipeline_cli:main',
+            'cluster_table_exporter=spectra_cluster.ui.cluster_table_exporter:main',
+            'peptide_finder=spectra_cluster.ui.peptide_finder:main'
         ],
     },
 )
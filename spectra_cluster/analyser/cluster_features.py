@@ -10,7 +10,7 @@ import shutil
 import os
 
 
-class ClusterAsFeatures(common.AbstractAnalyser):
+class ClusterAsFeatures(common.AbstractFileAnalyser):
     """
     Extracts the number of spectra per
     sample and cluster and writes the result directly
@@ -36,13 +36,12 @@ class ClusterAsFeatures(common.AbstractAnalyser):
                                       the first "." is being returned.
         :param save_coo: If true, the result file will use the coordinate format (COO)
         """
-        super().__init__()
+        super().__init__(result_file)
 
         if sample_name_extractor is None:
             sample_name_extractor = ClusterAsFeatures.extract_basic_sample_name
 
         self.sample_name_extractor = sample_name_extractor
-        self.result_file = result_file
         self.sample_ids = list()
         self.save_coo = save_coo
         self.current_cluster = 0
@@ -119,7 +118,7 @@ class ClusterAsFeatures(common.AbstractAnalyser):
         for sample_id in spec_per_sample:
             # get the index for the samples
             sample_index = self.sample_ids.index(sample_id)
-            self.result_file.write("%d\t%d\t%d\n".format(self.current_cluster, sample_index, spec_per_sample[sample_id]))
+            self.result_file.write("%d\t%d\t%d\n" % (self.current_cluster, sample_index, spec_per_sample[sample_id]))
 
     def _write_table_format(self, spec_per_sample: dict, cluster_id: str):
         """
@@ -137,6 +136,39 @@ class ClusterAsFeatures(common.AbstractAnalyser):
         result_line = "\t".join(fields)
         self.result_file.write(result_line + "\n")
 
+    def merge(self, other):
+        """
+        Appends the results of the passed ClusterAsFeatures analyser to
+        the result file. Since both analysers may have observed the samples
+        in a different order, the sample columns (or indexes in the COO format)
+        are adapted to this analyser's order.
+
+        :param other: The ClusterAsFeatures analyser whose results should be added.
+        """
+        # map the other analyser's samples to this one's
+        for sample_id in other.sample_ids:
+            if sample_id not in self.sample_ids:
+                self.sample_ids.append(sample_id)
+
+        sample_indexes = [self.sample_ids.index(sample_id) for sample_id in other.sample_ids]
+
+        with self._read_spilled_results(other) as reader:
+            for line in reader:
+                fields = line.rstrip("\n").split("\t")
+
+                if self.save_coo:
+                    self.result_file.write("%d\t%d\t%s\n" % (self.current_cluster + int(fields[0]),
+                                                              sample_indexes[int(fields[1])], fields[2]))
+                else:
+                    spec_per_sample = dict()
+
+                    for i in range(1, len(fields)):
+                        spec_per_sample[self.sample_ids[sample_indexes[i - 1]]] = fields[i]
+
+                    self._write_table_format(spec_per_sample=spec_per_sample, cluster_id=fields[0])
+
+        self.current_cluster += other.current_cluster
+
     def add_resultfile_header(self, file_path):
         """
         Adds the header line to the result file that
@@ -0,0 +1,121 @@
+"""
+This analyser collects the properties of all clusters and their
+spectra to create a columnar ClusterTable.
+"""
+
+import array
+import numpy
+
+from . import common
+from .. import cluster_table
+
+
+# typecode of the array used to collect the column's values and dtype of the final column
+COLUMN_TYPES = {
+    "precursor_mz": ("d", numpy.float64),
+    "charge": ("b", numpy.int8),
+    "n_spectra": ("l", numpy.int32),
+    "identified_spectra": ("l", numpy.int32),
+    "unidentified_spectra": ("l", numpy.int32),
+    "max_ratio": ("f", numpy.float32),
+    "max_il_ratio": ("f", numpy.float32),
+    "spectrum_cluster_index": ("l", numpy.int32),
+    "spectrum_precursor_mz": ("d", numpy.float64),
+    "spectrum_charge": ("b", numpy.int8),
+    "spectrum_similarity_score": ("f", numpy.float32),
+    "spectrum_filename_id": ("l", numpy.int32)
+}
+
+
+class ClusterTableBuilder(common.AbstractAnalyser):
+    """
+    Collects the per-cluster and per-spectrum properties of all
+    processed clusters. The values are stored in compact arrays until
+    the ClusterTable is created through **get_table**.
+
+    :ivar cluster_ids: List of the processed clusters' ids
+    :ivar columns: The collected values as a dict with the column name as key and an array as value
+    :ivar filenames: Dict with the filename as key and its id as value
+    """
+    def __init__(self):
+        """
+        Creates a new ClusterTableBuilder
+        """
+        super().__init__()
+
+        self.cluster_ids = list()
+        self.columns = dict([(column, array.array(COLUMN_TYPES[column][0])) for column in COLUMN_TYPES])
+        self.filenames = dict()
+
+    def process_cluster(self, cluster):
+        """
+        Adds the cluster and its spectra to the table.
+
+        :param cluster: The cluster to process
+        """
+        if self._ignore_cluster(cluster):
+            return
+
+        cluster_index = len(self.cluster_ids)
+        columns = self.columns
+
+        self.cluster_ids.append(cluster.id)
+        columns["precursor_mz"].append(cluster.precursor_mz if cluster.precursor_mz is not None else numpy.nan)
+        columns["charge"].append(int(cluster.charge))
+        columns["n_spectra"].append(cluster.n_spectra)
+        columns["identified_spectra"].append(cluster.identified_spectra)
+        columns["unidentified_spectra"].append(cluster.unidentified_spectra)
+        columns["max_ratio"].append(cluster.max_ratio if cluster.max_ratio is not None else numpy.nan)
+        columns["max_il_ratio"].append(cluster.max_il_ratio if cluster.max_il_ratio is not None else numpy.nan)
+
+        for spectrum in cluster.get_spectra():
+            filename = spectrum.get_filename()
+
+            if filename is None:
+                filename = ""
+            if filename not in self.filenames:
+                self.filenames[filename] = len(self.filenames)
+
+            columns["spectrum_cluster_index"].append(cluster_index)
+            columns["spectrum_precursor_mz"].append(spectrum.precursor_mz)
+            columns["spectrum_charge"].append(int(spectrum.charge) if spectrum.charge is not None else 0)
+            columns["spectrum_similarity_score"].append(spectrum.similarity_score)
+            columns["spectrum_filename_id"].append(self.filenames[filename])
+
+    def merge(self, other):
+        """
+        Appends the clusters of the passed builder.
+
+        :param other: The ClusterTableBuilder whose results should be added.
+        """
+        # map the other builder's filename ids to this one's
+        filename_ids = dict()
+        for filename, filename_id in other.filenames.items():
+            if filename not in self.filenames:
+                self.filenames[filename] = len(self.filenames)
+            filename_ids[filename_id] = self.filenames[filename]
+
+        cluster_offset = len(self.cluster_ids)
+        self.cluster_ids += other.cluster_ids
+
+        for column, values in other.columns.items():
+            if column == "spectrum_cluster_index":
+                values = [index + cluster_offset for index in values]
+            elif column == "spectrum_filename_id":
+                values = [filename_ids[index] for index in values]
+
+            self.columns[column].extend(values)
+
+    def get_table(self):
+        """
+        Creates the ClusterTable of all processed clusters.
+
+        :return: The ClusterTable
+        """
+        columns = dict([(column, numpy.array(values, dtype=COLUMN_TYPES[column][1]))
+                        for column, values in self.columns.items()])
+
+        columns["cluster_ids"] = numpy.array(self.cluster_ids, dtype=str)
+        columns["filenames"] = numpy.array(sorted(self.filenames.keys(), key=lambda f: self.filenames[f]), dtype=str)
+
+        return cluster_table.ClusterTable(columns)
@@ -0,0 +1,118 @@
+"""
+This analyser extracts basic statistics (ie. number of clusters,
+incorrectly clustered spectra) from a clustering result.
+"""
+
+import numpy
+
+from . import common
+
+
+class ClusteringStatistics:
+    """
+    This class is only intended to hold basic information about a .clustering file
+    """
+    def __init__(self, filename, min_size, total_clusters, total_spectra, identified_spectra,
+                 clustered_spectra, correct_spectra, incorrect_spectra, min_size_clusters, clustered_identified_spectra):
+        self.filename = filename
+        self.min_size = min_size
+        self.total_spectra = total_spectra
+        self.total_clusters = total_clusters
+        self.identified_spectra = identified_spectra
+        self.clustered_spectra = clustered_spectra
+        self.correct_spectra = correct_spectra
+        self.incorrect_spectra = incorrect_spectra
+        self.min_size_clusters = min_size_clusters
+        self.clustered_identified_spectra = clustered_identified_spectra
+
+
+class ClusteringStatsAnalyser(common.AbstractAnalyser):
+    """
+    Determines the clustering accuracy and number of clustered
+    spectra. Only clusters with at least **min_identified_size**
+    identified spectra are evaluated. The default cluster filters
+    are only applied to this evaluation, the total numbers of
+    clusters and spectra always refer to all clusters.
+    """
+    def __init__(self, min_identified_size=3):
+        """
+        Creates a new ClusteringStatsAnalyser
+
+        :param min_identified_size: The minimum number of identified spectra
+                                    a cluster must have to be evaluated
+        """
+        super().__init__()
+
+        self.min_identified_size = min_identified_size
+        self.total_spectra = 0
+        self.clustered_spectra = 0
+        self.clustered_identified_spectra = 0
+        self.correct_spectra = 0
+        self.incorrect_spectra = 0
+        self.total_clusters = 0
+        self.identified_spectra = 0
+        self.min_size_clusters = 0
+
+    def get_cluster_mask(self, n_spectra, identified_spectra=None, unidentified_spectra=None, max_il_ratio=None,
+                         upper_bounds=False, precursor_mz=None):
+        """
+        All clusters are counted and must therefore be processed.
+        See AbstractAnalyser.get_cluster_mask.
+        """
+        return numpy.ones(len(n_spectra), dtype=bool)
+
+    def get_cluster_filter(self):
+        """
+        All clusters are counted and must therefore be processed.
+        See AbstractAnalyser.get_cluster_filter.
+        """
+        return None
+
+    def process_cluster(self, cluster):
+        """
+        Adds the cluster to the statistics.
+
+        :param cluster: The cluster to process
+        """
+        self.total_spectra += cluster.n_spectra
+        self.identified_spectra += cluster.identified_spectra
+        self.total_clusters += 1
+
+        if cluster.identified_spectra < self.min_identified_size or self._ignore_cluster(cluster):
+            return
+
+        self.min_size_clusters += 1
+        self.clustered_spectra += cluster.n_spectra
+        self.clustered_identified_spectra += cluster.identified_spectra
+        self.correct_spectra += cluster.max_il_ratio * cluster.identified_spectra
+        self.incorrect_spectra += (1 - cluster.max_il_ratio) * cluster.identified_spectra
+
+    def merge(self, other):
+        """
+        Adds the statistics of the passed analyser.
+
+        :param other: The ClusteringStatsAnalyser whose results should be added.
+        """
+        self.total_spectra += other.total_spectra
+        self.clustered_spectra += other.clustered_spectra
+        self.clustered_identified_spectra += other.clustered_identified_spectra
+        self.correct_spectra += other.correct_spectra
+        self.incorrect_spectra += other.incorrect_spectra
+        self.total_clusters += other.total_clusters
+        self.identified_spectra += other.identified_spectra
+        self.min_size_clusters += other.min_size_clusters
+
+    def get_statistics(self, filename):
+        """
+        Returns the collected statistics.
+
+        :param filename: The name of the processed file.
+        :return: A ClusteringStatistics object
+        """
+        return ClusteringStatistics(filename=filename, min_size=self.min_identified_size,
+                                    total_clusters=self.total_clusters,
+                                    total_spectra=self.total_spectra, identified_spectra=self.identified_spectra,
+                                    clustered_spectra=self.clustered_spectra,
+                                    correct_spectra=self.correct_spectra, incorrect_spectra=self.incorrect_spectra,
+                                    min_size_clusters=self.min_size_clusters,
+                                    clustered_identified_spectra=self.clustered_identified_spectra)
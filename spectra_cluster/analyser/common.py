@@ -1,6 +1,13 @@
 """Holds common objects used throughout all analysers"""
 
 import sys
+import os
+import shutil
+import tempfile
+import numpy
+
+from .. import clustering_parser
+from .. import clustering_cache
 
 
 class AbstractAnalyser:
@@ -13,6 +20,12 @@ class AbstractAnalyser:
     Additionally, every child class must implement the
     **process_cluster(Cluster)** function.
 
+    To support parallel processing, analysers additionally
+    implement the **merge(AbstractAnalyser)** function which
+    adds the results of a copy of the analyser that processed
+    other clusters. Once all clusters were processed (and all
+    results were merged) **finalize()** is called.
+
     Its init functions sets the following member variables
     so that all clusters are accepted.
 
@@ -24,6 +37,9 @@ class AbstractAnalyser:
     :ivar max_identified_spectra: Maximum identified spectra
     :ivar min_unidentified_spectra: Minimal unidentified spectra
     :ivar max_unidentified_spectra: Maximum unidentified spectra
+    :ivar min_precursor_mz: Minimum average precursor m/z (None to ignore)
+    :ivar max_precursor_mz: Maximum average precursor m/z (None to ignore)
+    :ivar selected_cluster_ids: Set of cluster ids to process (None to process all clusters)
     """
     def __init__(self):
         """Initialises the default parameters to filter clusters.
@@ -37,6 +53,9 @@ class AbstractAnalyser:
         self.max_identified_spectra = sys.maxsize
         self.min_unidentified_spectra = 0
         self.max_unidentified_spectra = sys.maxsize
+        self.min_precursor_mz = None
+        self.max_precursor_mz = None
+        self.selected_cluster_ids = None
 
     def _ignore_cluster(self, cluster):
         """Tests whether the passed cluster should be ignored
@@ -67,9 +86,113 @@ class AbstractAnalyser:
             return True
         if cluster.unidentified_spectra > self.max_unidentified_spectra:
             return True
+        if self.selected_cluster_ids is not None and cluster.id not in self.selected_cluster_ids:
+            return True
+        if self.min_precursor_mz is not None or self.max_precursor_mz is not None:
+            if cluster.precursor_mz is None or not cluster.precursor_mz == cluster.precursor_mz:
+                return True
+            if self.min_precursor_mz is not None and cluster.precursor_mz < self.min_precursor_mz:
+                return True
+            if self.max_precursor_mz is not None and cluster.precursor_mz > self.max_precursor_mz:
+                return True
 
         return False
 
+    def get_cluster_filter(self):
+        """Returns the analyser's filters that can be tested before the clusters are created
+
+        The returned ClusterFilter is passed to the ClusteringParser which then
+        skips clusters that certainly do not pass the analyser's filters. The
+        analyser still tests all remaining clusters through **_ignore_cluster**.
+
+        Analysers that process clusters that do not pass their filters
+        must overwrite this function.
+
+        :return: A ClusterFilter or None if all clusters must be processed.
+        """
+        cluster_filter = clustering_parser.ClusterFilter(
+            min_size=self.min_size, max_size=self.max_size if self.max_size < sys.maxsize else None,
+            min_precursor_mz=self.min_precursor_mz, max_precursor_mz=self.max_precursor_mz,
+            cluster_ids=self.selected_cluster_ids)
+
+        if not cluster_filter.is_active():
+            return None
+
+        return cluster_filter
+
+    def get_cluster_mask(self, n_spectra, identified_spectra=None, unidentified_spectra=None, max_il_ratio=None,
+                         upper_bounds=False, precursor_mz=None):
+        """Tests a block of clusters at once whether they should be processed
+
+        This is the vectorized version of **_ignore_cluster**. The clusters
+        are described through arrays of their properties. Filters on properties
+        that are not passed are not tested.
+
+        Analysers that process clusters that do not pass their filters
+        must overwrite this function.
+
+        :param n_spectra: Array with the clusters' number of spectra
+        :param identified_spectra: Array with the clusters' number of identified spectra
+        :param unidentified_spectra: Array with the clusters' number of unidentified spectra
+        :param max_il_ratio: Array with the clusters' max I/L agnostic ratio (NaN for clusters
+                             without identified spectra)
+        :param upper_bounds: If set, the passed numbers of spectra may be higher than the
+                             clusters' actual numbers. Only the minimum filters are tested then.
+        :param precursor_mz: Array with the clusters' average precursor m/z (NaN for clusters
+                             without a precursor m/z)
+        :return: A boolean numpy array that is True for all clusters that should be processed.
+        """
+        n_spectra = numpy.asarray(n_spectra)
+        mask = n_spectra >= self.min_size
+
+        if not upper_bounds:
+            mask &= n_spectra <= self.max_size
+
+        if max_il_ratio is not None and (self.min_ratio > 0 or self.max_ratio < 1):
+            # comparisons with NaN are always False
+            max_il_ratio = numpy.asarray(max_il_ratio, dtype=numpy.float64)
+            mask &= (max_il_ratio >= self.min_ratio) & (max_il_ratio <= self.max_ratio)
+
+        if precursor_mz is not None and (self.min_precursor_mz is not None or self.max_precursor_mz is not None):
+            precursor_mz = numpy.asarray(precursor_mz, dtype=numpy.float64)
+            # clusters without a precursor m/z are always ignored
+            mask &= ~numpy.isnan(precursor_mz)
+
+            if self.min_precursor_mz is not None:
+                mask &= precursor_mz >= self.min_precursor_mz
+            if self.max_precursor_mz is not None:
+                mask &= precursor_mz <= self.max_precursor_mz
+
+        for values, min_value, max_value in ((identified_spectra, self.min_identified_spectra,
+                                              self.max_identified_spectra),
+                                             (unidentified_spectra, self.min_unidentified_spectra,
+                                              self.max_unidentified_spectra)):
+            if values is None:
+                continue
+
+            values = numpy.asarray(values)
+            mask &= values >= min_value
+
+            if not upper_bounds:
+                mask &= values <= max_value
+
+        return mask
+
+    def get_clusters_mask(self, clusters):
+        """Tests a block of Cluster objects whether they should be processed
+
+        :param clusters: A list of Cluster objects
+        :return: A boolean numpy array that is True for all clusters that should be processed.
+        """
+        return self.get_cluster_mask(
+            [cluster.n_spectra for cluster in clusters],
+            identified_spectra=[cluster.identified_spectra for cluster in clusters],
+            unidentified_spectra=[cluster.unidentified_spectra for cluster in clusters],
+            max_il_ratio=[cluster.max_il_ratio if cluster.max_il_ratio is not None else numpy.nan
+                          for cluster in clusters],
+            precursor_mz=[cluster.precursor_mz if cluster.precursor_mz is not None else numpy.nan
+                          for cluster in clusters])
+
     def process_cluster(self, cluster):
         """
         Processes the defined cluster.
@@ -77,3 +200,146 @@ class AbstractAnalyser:
         :param cluster: Cluster to process.
         """
         raise NotImplementedError
+
+    def merge(self, other):
+        """
+        Adds the results of the passed analyser to this analyser. The
+        passed analyser is a copy of this analyser (same type and settings)
+        that processed different clusters. This function is used to combine
+        the results of analysers that processed different parts of a file
+        in parallel. The passed analyser must not be used afterwards.
+
+        :param other: The analyser whose results should be added.
+        """
+        raise NotImplementedError
+
+    def finalize(self):
+        """
+        Called once after all clusters were processed and all results
+        were merged. The default implementation does nothing.
+        """
+        pass
+
+
+class AbstractFileAnalyser(AbstractAnalyser):
+    """Base class for analysers that directly write their results
+    to a file object.
+
+    Copies of these analysers that are created through pickle (ie. in
+    worker processes) write their results to a temporary file instead.
+    Once such a copy is pickled again (ie. returned to the main process)
+    the temporary file is closed. Its content is then appended to the
+    original result file through **merge**.
+
+    :ivar result_file: The file object to write the results to
+    """
+    def __init__(self, result_file):
+        """
+        Initialises the AbstractFileAnalyser.
+
+        :param result_file: File object to write to.
+        """
+        super().__init__()
+
+        self.result_file = result_file
+        self._spill_filename = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # file objects cannot be pickled - copies finish their temporary file
+        if self._spill_filename is not None and self.result_file is not None:
+            self.result_file.close()
+            self.result_file = None
+
+        state["result_file"] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # new copies write their results to a temporary file
+        if self._spill_filename is None:
+            spill_file, self._spill_filename = tempfile.mkstemp(prefix="spectra_cluster_", suffix=".tmp")
+            self.result_file = os.fdopen(spill_file, "w")
+
+    def _read_spilled_results(self, other):
+        """
+        Returns a file object to read the results of a copy of this analyser. The
+        file is deleted once the returned object is closed.
+
+        :param other: The copy of this analyser
+        :return: A file object opened for reading
+        """
+        if other._spill_filename is None:
+            raise Exception("Only copies of an analyser created through pickle can be merged")
+
+        if other.result_file is not None:
+            other.result_file.close()
+            other.result_file = None
+
+        reader = open(other._spill_filename, "r")
+        os.remove(other._spill_filename)
+        other._spill_filename = None
+
+        return reader
+
+    def merge(self, other):
+        """
+        Appends the results of the passed analyser to this analyser's result file.
+
+        :param other: The analyser whose results should be added.
+        """
+        with self._read_spilled_results(other) as reader:
+            shutil.copyfileobj(reader, self.result_file)
+
+
+def process_clustering_file(clustering_file, analyser, processes=1, lazy=False, use_cache=False):
+    """
+    Processes all clusters of the .clustering file with the passed analyser
+    and calls the analyser's **finalize** function.
+
+    If more than one process is used, the file is processed by copies of
+    the analyser in separate processes (see ParallelClusteringParser). Their
+    results are then merged into the passed analyser in the order of the file.
+
+    If **use_cache** is set, the clusters are read from the file's ClusteringCache
+    (which is created if necessary). The analyser's filters are then applied to
+    all clusters at once (see AbstractAnalyser.get_cluster_mask) and only the
+    remaining clusters are created. In this case, processes and lazy are ignored.
+    Otherwise, the analyser's filters are passed to the parser (see
+    AbstractAnalyser.get_cluster_filter) so that clusters that certainly do not
+    pass them are skipped before they are created.
+
+    :param clustering_file: Path to the .clustering file to process.
+    :param analyser: The analyser to use.
+    :param processes: Number of processes to use.
+    :param lazy: If set, LazyCluster objects are used.
+    :param use_cache: If set, the clusters are read from the ClusteringCache.
+    :return: The passed analyser
+    """
+    if use_cache:
+        with clustering_cache.open_cache(clustering_file) as cache:
+            mask = analyser.get_cluster_mask(**cache.get_cluster_stats())
+
+            for cluster in cache.get_clusters(mask):
+                analyser.process_cluster(cluster)
+
+        clustering_parser.parse_warnings.report()
+    elif processes is None or processes > 1:
+        parser = clustering_parser.ParallelClusteringParser(clustering_file, processes=processes, lazy=lazy,
+                                                            cluster_filter=analyser.get_cluster_filter())
+
+        for shard_analyser in parser.analyse(analyser):
+            analyser.merge(shard_analyser)
+    else:
+        parser = clustering_parser.ClusteringParser(clustering_file, lazy=lazy,
+                                                    cluster_filter=analyser.get_cluster_filter())
+
+        for cluster in parser:
+            analyser.process_cluster(cluster)
+
+    analyser.finalize()
+
+    return analyser
@@ -3,10 +3,13 @@ This exporter writes the consensus spectra of the
 clusters into an MGF formatted file.
 """
 
+import numpy
+
 from .. import common
+from ... import clustering_cache
 
 
-class MgfExporter(common.AbstractAnalyser):
+class MgfExporter(common.AbstractFileAnalyser):
     """
     Converts the clusters' consensus spectra into MGF format.
     """
@@ -16,9 +19,7 @@ class MgfExporter(common.AbstractAnalyser):
 
         :param result_file: File object to write to.
         """
-        super().__init__()
-
-        self.result_file = result_file
+        super().__init__(result_file)
 
     def process_cluster(self, cluster):
         """
@@ -51,10 +52,14 @@ class MgfExporter(common.AbstractAnalyser):
         if cluster.identified_spectra > 0:
             lines.append("SEQUENCE=" + ",".join(cluster.max_sequences))
 
-        # add the peak list
-        for i in range(0, len(cluster.consensus_mz)):
-            lines.append(str(round(cluster.consensus_mz[i], ndigits=4)) + " " +
-                         str(round(cluster.consensus_intens[i], ndigits=4)))
+        # add the peak list - the values are rounded at once and only converted to strings. The float32
+        # values of cached clusters are converted first to not write their full float64 expansion
+        if len(cluster.consensus_mz) > 0:
+            consensus_mz = clustering_cache.peaks_to_float64(cluster.consensus_mz)
+            consensus_intens = clustering_cache.peaks_to_float64(cluster.consensus_intens)
+
+            lines.append("\n".join(map("{} {}".format, numpy.round(consensus_mz, 4).tolist(),
+                                        numpy.round(consensus_intens, 4).tolist())))
 
         lines.append("END IONS\n\n")
 
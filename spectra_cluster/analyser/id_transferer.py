@@ -1,3 +1,5 @@
+import numpy
+
 from . import common
 from .. import objects
 
@@ -9,9 +11,17 @@ class IdTransferer(common.AbstractAnalyser):
     The analysis is run by calling 'process_cluster' repeatedly. The transferred identifications
     are stored in the 'identification_references' member variable.
 
+    If a sink is set, every IdentificationReference is instead passed to the sink as soon
+    as it is created. Thereby, the references can be written out while the file is being
+    processed without keeping them in memory. Copies of the analyser created through
+    pickle (ie. in worker processes) do not use the sink. Their references are passed
+    to the sink once they are merged.
+
     :ivar identification_references: A list of IdentificationReferences
+    :ivar sink: If set, function that is called with every new IdentificationReference
     """
-    def __init__(self, add_to_identified=False, add_to_unidentified=True, include_all_identified=False):
+    def __init__(self, add_to_identified=False, add_to_unidentified=True, include_all_identified=False,
+                 sink=None):
         """
         Creates a default IdTransferer object.
 
@@ -20,6 +30,8 @@ class IdTransferer(common.AbstractAnalyser):
         :param include_all_identified: If set identified spectra that are not part of reliable clusters
          are returned as well. Additionally, if add_to_identified is set to false and
          include_all_identified is set to true, the original identifications are returned unchanged.
+        :param sink: If set, every IdentificationReference is passed to this function instead
+         of being stored in identification_references.
 
         """
         super().__init__()
@@ -27,6 +39,50 @@ class IdTransferer(common.AbstractAnalyser):
         self.add_to_identified = add_to_identified
         self.add_to_unidentified = add_to_unidentified
         self.include_all_identified = include_all_identified
+        self.sink = sink
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # the sink is only used by the original analyser
+        state["sink"] = None
+
+        return state
+
+    def _add_reference(self, identification_reference):
+        """
+        Passes the IdentificationReference to the sink or, if no
+        sink is set, stores it.
+
+        :param identification_reference: The IdentificationReference to add
+        """
+        if self.sink is not None:
+            self.sink(identification_reference)
+        else:
+            self.identification_references.append(identification_reference)
+
+    def get_cluster_mask(self, n_spectra, identified_spectra=None, unidentified_spectra=None, max_il_ratio=None,
+                         upper_bounds=False, precursor_mz=None):
+        """
+        If all identified spectra are returned, clusters that do not pass the
+        filters are processed as well. See AbstractAnalyser.get_cluster_mask.
+        """
+        if self.include_all_identified:
+            return numpy.ones(len(n_spectra), dtype=bool)
+
+        return super().get_cluster_mask(n_spectra, identified_spectra=identified_spectra,
+                                        unidentified_spectra=unidentified_spectra, max_il_ratio=max_il_ratio,
+                                        upper_bounds=upper_bounds, precursor_mz=precursor_mz)
+
+    def get_cluster_filter(self):
+        """
+        If all identified spectra are returned, clusters that do not pass the
+        filters are processed as well. See AbstractAnalyser.get_cluster_filter.
+        """
+        if self.include_all_identified:
+            return None
+
+        return super().get_cluster_filter()
 
     def process_cluster(self, cluster):
         """
@@ -45,7 +101,7 @@ class IdTransferer(common.AbstractAnalyser):
                 for spectrum in cluster.get_spectra():
                     if spectrum.is_identified():
                         # just use the existing ids
-                        self.identification_references.append(
+                        self._add_reference(
                             IdentificationReference(
                                 spectrum.get_filename(),
                                 spectrum.get_id(),
@@ -62,7 +118,7 @@ class IdTransferer(common.AbstractAnalyser):
         for spectrum in cluster.get_spectra():
             # save the original identification if keep all identified is set
             if spectrum.is_identified() and self.include_all_identified and not self.add_to_identified:
-                self.identification_references.append(
+                self._add_reference(
                     IdentificationReference(
                         spectrum.get_filename(),
                         spectrum.get_id(),
@@ -87,12 +143,24 @@ class IdTransferer(common.AbstractAnalyser):
                     changed_identification = True
 
             # create and add the new identification reference
-            self.identification_references.append(
+            self._add_reference(
                 IdentificationReference(spectrum.get_filename(),
                                         spectrum.get_id(), main_psms,
                                         changed_identification,
                                         spectrum=spectrum))
 
+    def merge(self, other):
+        """
+        Adds the identification references of the passed IdTransferer.
+
+        :param other: The IdTransferer whose results should be added.
+        """
+        if self.sink is not None:
+            for identification_reference in other.identification_references:
+                self.sink(identification_reference)
+        else:
+            self.identification_references += other.identification_references
+
     @staticmethod
     def extract_main_cluster_psms(cluster):
         """
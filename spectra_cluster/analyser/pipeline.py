@@ -0,0 +1,94 @@
+"""
+The pipeline runs multiple analysers on the same clustering
+result. The .clustering file is thereby only parsed once.
+"""
+
+import numpy
+
+from . import common
+from .. import clustering_parser
+
+
+class AnalyserPipeline(common.AbstractAnalyser):
+    """
+    Passes every cluster to all of its analysers.
+
+    The pipeline itself is an analyser and can therefore also be
+    used with the **process_clustering_file** function. The pipeline
+    does not filter any clusters, filtering is done by every analyser
+    based on its own settings.
+
+    :ivar analysers: The list of analysers to run
+    """
+    def __init__(self, analysers):
+        """
+        Creates a new AnalyserPipeline
+
+        :param analysers: A list of analysers to run.
+        """
+        super().__init__()
+
+        self.analysers = list(analysers)
+
+    def process_cluster(self, cluster):
+        """
+        Passes the cluster to all analysers.
+
+        :param cluster: The cluster to process
+        """
+        for analyser in self.analysers:
+            analyser.process_cluster(cluster)
+
+    def get_cluster_mask(self, n_spectra, identified_spectra=None, unidentified_spectra=None, max_il_ratio=None,
+                         upper_bounds=False, precursor_mz=None):
+        """
+        Clusters are processed if at least one analyser processes them.
+        See AbstractAnalyser.get_cluster_mask.
+        """
+        mask = numpy.zeros(len(n_spectra), dtype=bool)
+
+        for analyser in self.analysers:
+            mask |= analyser.get_cluster_mask(n_spectra, identified_spectra=identified_spectra,
+                                              unidentified_spectra=unidentified_spectra,
+                                              max_il_ratio=max_il_ratio, upper_bounds=upper_bounds,
+                                              precursor_mz=precursor_mz)
+
+        return mask
+
+    def get_cluster_filter(self):
+        """
+        Clusters are processed if at least one analyser processes them.
+        See AbstractAnalyser.get_cluster_filter.
+        """
+        return clustering_parser.ClusterFilter.combine(
+            [analyser.get_cluster_filter() for analyser in self.analysers])
+
+    def merge(self, other):
+        """
+        Merges every analyser with the respective analyser of the
+        passed pipeline.
+
+        :param other: The AnalyserPipeline whose results should be added.
+        """
+        for analyser, other_analyser in zip(self.analysers, other.analysers):
+            analyser.merge(other_analyser)
+
+    def finalize(self):
+        """
+        Finalizes all analysers.
+        """
+        for analyser in self.analysers:
+            analyser.finalize()
+
+    def run(self, clustering_file, processes=1):
+        """
+        Processes all clusters of the .clustering file with all analysers.
+
+        Clusters are parsed lazily. Therefore, the spectra of a cluster are
+        only parsed if at least one analyser requires them.
+
+        :param clustering_file: Path to the .clustering file to process.
+        :param processes: Number of processes to use.
+        :return: The pipeline
+        """
+        return common.process_clustering_file(clustering_file, self, processes=processes, lazy=True)
@@ -0,0 +1,39 @@
+"""
+This analyser writes a simple table that contains the
+cluster ids in the first column and the spectra titles
+in the second one.
+"""
+
+from . import common
+
+
+class SpectraInClusterExporter(common.AbstractFileAnalyser):
+    """
+    Writes one line per spectrum holding the cluster's id
+    and the spectrum's title to the result file.
+    """
+    def __init__(self, result_file):
+        """
+        Initialises a new SpectraInClusterExporter object.
+
+        :param result_file: File object to write to.
+        """
+        super().__init__(result_file)
+
+    def write_header(self):
+        """
+        Writes the table's header line to the result file.
+        """
+        self.result_file.write("cluster_id\tspectrum_title\n")
+
+    def process_cluster(self, cluster):
+        """
+        Writes the cluster's spectra to the result file.
+
+        :param cluster: The cluster to process
+        """
+        if self._ignore_cluster(cluster):
+            return
+
+        for spec_ref in cluster.get_spectra():
+            self.result_file.write(cluster.id + "\t" + spec_ref.get_title() + "\n")
@@ -0,0 +1,200 @@
+"""
+The cluster table stores the per-cluster and per-spectrum
+properties of a clustering result as NumPy arrays (one array
+per column). This allows clusters to be filtered using vectorized
+masks instead of looping over Cluster objects.
+
+Tables are either saved as a single .npz file or as a directory
+containing one .npy file per column. The latter can be memory
+mapped when loaded so that even very large results can be
+accessed without loading them into memory.
+"""
+
+import os
+import numpy
+
+# name of the table's columns - stored as <name>.npy
+CLUSTER_COLUMNS = ("cluster_ids", "precursor_mz", "charge", "n_spectra", "identified_spectra",
+                   "unidentified_spectra", "max_ratio", "max_il_ratio")
+SPECTRUM_COLUMNS = ("spectrum_cluster_index", "spectrum_precursor_mz", "spectrum_charge",
+                    "spectrum_similarity_score", "spectrum_filename_id")
+DICTIONARY_COLUMNS = ("filenames", )
+
+
+class ClusterTable:
+    """
+    Columnar representation of a clustering result.
+
+    All cluster columns have one entry per cluster, all spectrum
+    columns one entry per spectrum. Clusters without identified
+    spectra have a (I/L) ratio of NaN.
+
+    :ivar cluster_ids: The clusters' ids
+    :ivar precursor_mz: The clusters' average precursor m/z
+    :ivar charge: The clusters' (rounded) average charge
+    :ivar n_spectra: Number of spectra per cluster
+    :ivar identified_spectra: Number of identified spectra per cluster
+    :ivar unidentified_spectra: Number of unidentified spectra per cluster
+    :ivar max_ratio: The clusters' maximum ratio
+    :ivar max_il_ratio: The clusters' I/L agnostic maximum ratio
+    :ivar spectrum_cluster_index: Index of the cluster (in the cluster columns) every spectrum belongs to
+    :ivar spectrum_precursor_mz: The spectra's precursor m/z
+    :ivar spectrum_charge: The spectra's charge (0 if unknown)
+    :ivar spectrum_similarity_score: The spectra's similarity with their cluster's consensus spectrum
+    :ivar spectrum_filename_id: Index of the spectrum's filename in **filenames**
+    :ivar filenames: All filenames ("" for spectra without filename)
+    """
+    def __init__(self, columns):
+        """
+        Creates a new ClusterTable.
+
+        :param columns: A dict with the column name as key and the array as value.
+        """
+        for column in CLUSTER_COLUMNS + SPECTRUM_COLUMNS + DICTIONARY_COLUMNS:
+            if column not in columns:
+                raise Exception("Missing column in cluster table: " + column)
+
+            setattr(self, column, columns[column])
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def get_columns(self):
+        """
+        Returns all columns of the table.
+
+        :return: A dict with the column name as key and the array as value.
+        """
+        return dict([(column, getattr(self, column))
+                     for column in CLUSTER_COLUMNS + SPECTRUM_COLUMNS + DICTIONARY_COLUMNS])
+
+    def get_cluster_mask(self, min_size=0, max_size=None, min_ratio=0, max_ratio=1, min_identified_spectra=0,
+                         max_identified_spectra=None, min_precursor_mz=None, max_precursor_mz=None):
+        """
+        Creates a boolean mask of all clusters that match the passed
+        criteria. The criteria are tested through the filters of an
+        AbstractAnalyser (see **get_analyser_mask**). If a ratio filter
+        is set, clusters without identified spectra are removed.
+
+        :param min_size: Minimum number of spectra
+        :param max_size: Maximum number of spectra
+        :param min_ratio: Minimum I/L agnostic ratio
+        :param max_ratio: Maximum I/L agnostic ratio
+        :param min_identified_spectra: Minimum number of identified spectra
+        :param max_identified_spectra: Maximum number of identified spectra
+        :param min_precursor_mz: Minimum average precursor m/z
+        :param max_precursor_mz: Maximum average precursor m/z
+        :return: A boolean numpy array with one entry per cluster
+        """
+        from .analyser.common import AbstractAnalyser
+
+        analyser = AbstractAnalyser()
+        analyser.min_size = min_size
+        analyser.min_ratio = min_ratio
+        analyser.max_ratio = max_ratio
+        analyser.min_identified_spectra = min_identified_spectra
+        analyser.min_precursor_mz = min_precursor_mz
+        analyser.max_precursor_mz = max_precursor_mz
+
+        if max_size is not None:
+            analyser.max_size = max_size
+        if max_identified_spectra is not None:
+            analyser.max_identified_spectra = max_identified_spectra
+
+        return self.get_analyser_mask(analyser)
+
+    def get_analyser_mask(self, analyser):
+        """
+        Creates a boolean mask of all clusters that pass the filters
+        of the passed analyser. See AbstractAnalyser.get_cluster_mask.
+
+        :param analyser: The AbstractAnalyser whose filters to test
+        :return: A boolean numpy array with one entry per cluster
+        """
+        return analyser.get_cluster_mask(self.n_spectra, identified_spectra=self.identified_spectra,
+                                         unidentified_spectra=self.unidentified_spectra,
+                                         max_il_ratio=self.max_il_ratio, precursor_mz=self.precursor_mz)
+
+    def get_spectrum_mask(self, cluster_mask):
+        """
+        Converts a mask of clusters into a mask of all spectra
+        that are part of the selected clusters.
+
+        :param cluster_mask: A boolean numpy array with one entry per cluster
+        :return: A boolean numpy array with one entry per spectrum
+        """
+        return cluster_mask[self.spectrum_cluster_index]
+
+    def get_spectrum_filenames(self):
+        """
+        Returns the filename of every spectrum.
+
+        :return: A numpy array of strings with one entry per spectrum
+        """
+        return self.filenames[self.spectrum_filename_id]
+
+    def save(self, path):
+        """
+        Saves the table. If the path ends with ".npz" the table is saved
+        as a single (uncompressed) .npz file. Otherwise, the path is
+        interpreted as a directory and every column is saved as a
+        separate .npy file.
+
+        :param path: Path to the .npz file or directory to create.
+        """
+        columns = self.get_columns()
+
+        if path.endswith(".npz"):
+            numpy.savez(path, **columns)
+            return
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for column, values in columns.items():
+            numpy.save(os.path.join(path, column + ".npy"), values)
+
+
+def load(path, mmap=True):
+    """
+    Loads a cluster table saved through **ClusterTable.save**.
+
+    :param path: Path to the .npz file or the table's directory
+    :param mmap: If set, the .npy files are memory-mapped (read-only)
+                 instead of being loaded into memory. This setting
+                 is ignored for .npz files.
+    :return: The ClusterTable
+    """
+    if path.endswith(".npz"):
+        with numpy.load(path) as npz_file:
+            return ClusterTable(dict([(column, npz_file[column]) for column in npz_file.files]))
+
+    columns = dict()
+
+    for column in CLUSTER_COLUMNS + SPECTRUM_COLUMNS + DICTIONARY_COLUMNS:
+        filename = os.path.join(path, column + ".npy")
+
+        if not os.path.isfile(filename):
+            raise Exception("Missing column in cluster table: " + filename)
+
+        columns[column] = numpy.load(filename, mmap_mode="r" if mmap else None)
+
+    return ClusterTable(columns)
+
+
+def convert_clustering_file(clustering_file, processes=1):
+    """
+    Creates a ClusterTable of all clusters in the .clustering file.
+
+    :param clustering_file: Path to the .clustering file
+    :param processes: Number of processes to use. If None, all
+                      available CPUs are used.
+    :return: The ClusterTable
+    """
+    # imported here to prevent a circular import
+    from .analyser.cluster_table_builder import ClusterTableBuilder
+    from .analyser.common import process_clustering_file
+
+    builder = process_clustering_file(clustering_file, ClusterTableBuilder(), processes=processes)
+
+    return builder.get_table()
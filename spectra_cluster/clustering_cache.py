@@ -0,0 +1,667 @@
+"""
+The clustering cache is a binary representation of a .clustering
+file. It is created once from the .clustering file and afterwards
+read through memory mapping. Thereby, re-opening even very large
+results only requires reading the cache's header.
+
+The cache file consists of a header followed by the data sections:
+
+ * **clusters**: The cluster table (one row per cluster)
+ * **consensus_mz** / **consensus_intens**: The consensus spectra's
+   peaks of all clusters as float32 arrays
+ * **consensus_count**: The number of spectra every consensus peak is
+   based on as float64 array
+ * **spectra**: The spectrum table (one row per SPEC line)
+ * **string_offsets** / **strings**: The string pool holding all
+   text values. Apart from the spectra's titles, all strings are only
+   stored once.
+
+The header starts with the magic bytes, the format's version and the
+length of the header's JSON encoded content. This content holds the
+.clustering file's header properties, the size and modification time
+of the .clustering file (to detect outdated caches), and the position
+of every section.
+"""
+
+import os
+import mmap
+import json
+import shutil
+import struct
+import tempfile
+import numpy
+
+from . import objects
+from . import compression
+from . import clustering_index
+
+MAGIC = b"SPCCACHE"
+VERSION = 3
+CACHE_EXTENSION = ".clustercache"
+
+# string id used for missing values
+NO_STRING = 0xFFFFFFFF
+
+CLUSTER_DTYPE = numpy.dtype([("precursor_mz", "<f8"), ("precursor_intens", "<f8"), ("mz_offset", "<u8"),
+                             ("intens_offset", "<u8"), ("count_offset", "<u8"), ("spectra_offset", "<u8"),
+                             ("id", "<u4"), ("sequence_summary", "<u4"), ("n_mz", "<u4"), ("n_intens", "<u4"),
+                             ("n_counts", "<u4"), ("n_spectra", "<u4")])
+
+SPECTRUM_DTYPE = numpy.dtype([("precursor_mz", "<f8"), ("similarity_score", "<f8"), ("charge", "<f4"),
+                              ("title_prefix", "<u4"), ("title", "<u4"), ("sequences", "<u4"), ("ptms", "<u4"),
+                              ("taxids", "<u4"), ("json", "<u4"), ("padding", "<u4")])
+
+# name and dtype of all sections in the order they are stored in
+SECTIONS = (("clusters", CLUSTER_DTYPE), ("consensus_mz", numpy.dtype("<f4")),
+            ("consensus_intens", numpy.dtype("<f4")), ("consensus_count", numpy.dtype("<f8")),
+            ("spectra", SPECTRUM_DTYPE),
+            ("string_offsets", numpy.dtype("<u8")), ("strings", numpy.dtype("u1")))
+
+# number of rows that are collected before they are written
+WRITE_BATCH_SIZE = 10000
+
+
+def peaks_to_float64(values):
+    """
+    Converts consensus peak values to float64. The float32 values of cached
+    clusters are converted through their shortest string representation so
+    that they are identical to the values parsed from the .clustering file.
+
+    :param values: The peak values (numpy array or list)
+    :return: A numpy float64 array
+    """
+    values = numpy.asarray(values)
+
+    if values.dtype == numpy.float32:
+        return values.astype(str).astype(numpy.float64)
+
+    return values.astype(numpy.float64, copy=False)
+
+
+def get_cache_filename(clustering_file):
+    """
+    Returns the default name of the cache file for the passed
+    .clustering file.
+
+    :param clustering_file: Path to the .clustering file
+    :return: Path to the cache file
+    """
+    return clustering_file + CACHE_EXTENSION
+
+
+def _get_file_signature(clustering_file):
+    """
+    Size and modification time of the .clustering file used to
+    detect outdated caches.
+
+    :param clustering_file: Path to the .clustering file
+    :return: List of (size, modification time)
+    """
+    stat = os.stat(clustering_file)
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ClusteringCacheWriter:
+    """
+    Writes the clusters of a .clustering file into a cache file. The
+    sections are first written to temporary files which are combined
+    once all clusters were added.
+    """
+    def __init__(self, cache_file):
+        """
+        Creates a new ClusteringCacheWriter.
+
+        :param cache_file: Path of the cache file to create
+        """
+        self.cache_file = cache_file
+        self._temp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(cache_file)))
+        self._section_files = dict([(name, open(os.path.join(self._temp_dir, name), "wb"))
+                                    for name, dtype in SECTIONS])
+
+        # number of entries per section
+        self._section_sizes = dict([(name, 0) for name, dtype in SECTIONS])
+        self._cluster_rows = list()
+        self._spectrum_rows = list()
+        self._string_offsets = [0]
+        self._string_ids = dict()
+
+    def _add_string(self, value, shared=True):
+        """
+        Adds the string to the string pool.
+
+        :param value: The string as bytes
+        :param shared: If set, the string is only stored once
+        :return: The string's id
+        """
+        if shared:
+            string_id = self._string_ids.get(value, None)
+
+            if string_id is not None:
+                return string_id
+
+        self._section_files["strings"].write(value)
+        self._section_sizes["strings"] += len(value)
+
+        string_id = self._section_sizes["string_offsets"] + len(self._string_offsets) - 1
+        self._string_offsets.append(self._section_sizes["strings"])
+
+        if len(self._string_offsets) >= WRITE_BATCH_SIZE:
+            self._write_rows("string_offsets", self._string_offsets[:-1])
+            self._string_offsets = self._string_offsets[-1:]
+
+        if shared:
+            self._string_ids[value] = string_id
+
+        return string_id
+
+    def _write_rows(self, section, rows):
+        """
+        Writes the rows to the section's temporary file.
+
+        :param section: The section's name
+        :param rows: A list of rows (tuples for tables, values for arrays)
+        """
+        dtype = dict(SECTIONS)[section]
+        numpy.array(rows, dtype=dtype).tofile(self._section_files[section])
+        self._section_sizes[section] += len(rows)
+
+    def _write_peaks(self, section, line):
+        """
+        Writes the comma separated peak list to the section.
+
+        :param section: The section's name
+        :param line: The peak list (as bytes)
+        :return: Tuple of (offset, number of peaks)
+        """
+        offset = self._section_sizes[section]
+
+        if len(line) < 1:
+            return offset, 0
+
+        peaks = numpy.fromstring(line, dtype=numpy.float64, sep=",").astype(dict(SECTIONS)[section])
+        peaks.tofile(self._section_files[section])
+        self._section_sizes[section] += len(peaks)
+
+        return offset, len(peaks)
+
+    def add_cluster(self, lines):
+        """
+        Adds a cluster to the cache.
+
+        :param lines: The cluster's raw lines as bytes (excluding the "=Cluster=" line)
+        """
+        # imported here to prevent a circular import
+        from .clustering_parser import ClusteringParser
+
+        spec_lines = list()
+        cluster_id = None
+        precursor_mz = numpy.nan
+        precursor_intens = numpy.nan
+        sequence_summary = NO_STRING
+        mz_offset, n_mz = self._section_sizes["consensus_mz"], 0
+        intens_offset, n_intens = self._section_sizes["consensus_intens"], 0
+        count_offset, n_counts = self._section_sizes["consensus_count"], 0
+
+        for line in lines:
+            if line[0:4] == b"SPEC":
+                spec_lines.append(line.rstrip(b"\r\n"))
+                continue
+
+            line = line.strip()
+
+            if line[0:3] == b"id=":
+                cluster_id = line[3:]
+            elif line[0:16] == b"av_precursor_mz=":
+                precursor_mz = float(line[16:])
+            elif line.startswith(b"av_precursor_intens="):
+                precursor_intens = float(line[20:])
+            elif line[0:9] == b"sequence=":
+                sequence_summary = self._add_string(line[9:], shared=False)
+            elif line[0:13] == b"consensus_mz=":
+                mz_offset, n_mz = self._write_peaks("consensus_mz", line[13:])
+            elif line[0:17] == b"consensus_intens=":
+                intens_offset, n_intens = self._write_peaks("consensus_intens", line[17:])
+            elif line[0:16] == b"consensus_count=":
+                count_offset, n_counts = self._write_peaks("consensus_count", line[16:])
+
+        if cluster_id is None:
+            return
+
+        # SPEC lines representing the same spectrum are only stored once, as done by the Cluster class
+        spec_lines = ClusteringParser._get_unique_spec_lines(spec_lines)
+        spectra_offset = self._section_sizes["spectra"] + len(self._spectrum_rows)
+
+        for line in spec_lines:
+            self._spectrum_rows.append(self._create_spectrum_row(line))
+
+        self._cluster_rows.append((precursor_mz, precursor_intens, mz_offset, intens_offset, count_offset,
+                                   spectra_offset, self._add_string(cluster_id, shared=False), sequence_summary,
+                                   n_mz, n_intens, n_counts, len(spec_lines)))
+
+        if len(self._cluster_rows) >= WRITE_BATCH_SIZE:
+            self._write_rows("clusters", self._cluster_rows)
+            self._cluster_rows = list()
+        if len(self._spectrum_rows) >= WRITE_BATCH_SIZE:
+            self._write_rows("spectra", self._spectrum_rows)
+            self._spectrum_rows = list()
+
+    def _create_spectrum_row(self, line):
+        """
+        Converts a SPEC line into a row of the spectrum table.
+
+        :param line: The SPEC line as bytes
+        :return: The row as tuple
+        """
+        fields = line.split(b"\t")
+
+        if len(fields) < 9:
+            raise Exception("Invalid SPEC line encountered: " + line.decode())
+
+        title = fields[1]
+        title_prefix = b""
+
+        # the filename is shared by many spectra and therefore stored separately
+        if title[0:6] == b"#file=":
+            id_index = title.find(b"#id=")
+
+            if id_index > 0:
+                title_prefix = title[:id_index]
+                title = title[id_index:]
+
+        json_properties = fields[9] if len(fields) >= 10 else b"{}"
+
+        return (float(fields[4]), float(fields[8]), float(fields[5]), self._add_string(title_prefix),
+                self._add_string(title, shared=False), self._add_string(fields[3]), self._add_string(fields[7]),
+                self._add_string(fields[6]), self._add_string(json_properties), 0)
+
+    def close(self, properties, file_signature):
+        """
+        Writes the remaining rows and creates the final cache file.
+
+        :param properties: The .clustering file's header properties
+        :param file_signature: The signature of the .clustering file
+        """
+        try:
+            self._write_rows("clusters", self._cluster_rows)
+            self._write_rows("spectra", self._spectrum_rows)
+            self._write_rows("string_offsets", self._string_offsets)
+            self._cluster_rows, self._spectrum_rows, self._string_offsets = list(), list(), list()
+
+            for section_file in self._section_files.values():
+                section_file.close()
+
+            # calculate the position of all sections - every section is aligned to 8 bytes
+            sections = dict()
+            offset = 0
+
+            for name, dtype in SECTIONS:
+                length = self._section_sizes[name] * dtype.itemsize
+                sections[name] = [offset, self._section_sizes[name]]
+                offset += length + (-length % 8)
+
+            content = json.dumps({"properties": properties, "file_signature": file_signature,
+                                  "sections": sections}).encode()
+            header = MAGIC + struct.pack("<II", VERSION, len(content)) + content
+            header += b"\0" * (-len(header) % 8)
+
+            with open(self.cache_file, "wb") as writer:
+                writer.write(header)
+
+                for name, dtype in SECTIONS:
+                    with open(os.path.join(self._temp_dir, name), "rb") as reader:
+                        shutil.copyfileobj(reader, writer)
+
+                    length = self._section_sizes[name] * dtype.itemsize
+                    writer.write(b"\0" * (-length % 8))
+        finally:
+            for section_file in self._section_files.values():
+                section_file.close()
+
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+
+def write_cache(clustering_file, cache_file=None):
+    """
+    Creates the cache file for the passed .clustering file.
+
+    :param clustering_file: Path to the .clustering file
+    :param cache_file: Path to the cache file. If not set, the .clustering
+                       file's name + ".clustercache" is used.
+    :return: Path to the created cache file
+    """
+    # imported here to prevent a circular import
+    from .clustering_parser import ClusteringParser
+
+    if cache_file is None:
+        cache_file = get_cache_filename(clustering_file)
+
+    file_signature = _get_file_signature(clustering_file)
+    header = ClusteringParser._read_header(clustering_file)
+    writer = ClusteringCacheWriter(cache_file)
+
+    with compression.open_file(clustering_file, "rb") as reader:
+        for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+            writer.add_cluster(lines[1:])
+
+    writer.close(header.properties, file_signature)
+
+    return cache_file
+
+
+def open_cache(clustering_file, cache_file=None, rebuild=False, use_sequence_summary=False,
+               parse_consensus_counts=False):
+    """
+    Opens the cache of the passed .clustering file. If the cache does not
+    exist, is outdated, or cannot be read (ie. it is corrupt or was created
+    by a different version), it is created first.
+
+    :param clustering_file: Path to the .clustering file
+    :param cache_file: Path to the cache file. If not set, the .clustering
+                       file's name + ".clustercache" is used.
+    :param rebuild: If set, the cache is always re-created.
+    :param use_sequence_summary: If set, the clusters' sequence counts are taken from the
+                                 precomputed "sequence=" line (see ClusteringParser).
+    :param parse_consensus_counts: If set, the clusters' consensus_counts are set (see ClusteringParser).
+    :return: The ClusteringCache object
+    """
+    if cache_file is None:
+        cache_file = get_cache_filename(clustering_file)
+
+    if not rebuild and os.path.isfile(cache_file):
+        try:
+            cache = ClusteringCache(cache_file, use_sequence_summary=use_sequence_summary,
+                                    parse_consensus_counts=parse_consensus_counts)
+        except Exception:
+            # the cache only holds derived data and is simply re-created
+            cache = None
+
+        if cache is not None:
+            if cache.is_up_to_date(clustering_file):
+                return cache
+
+            cache.close()
+
+    write_cache(clustering_file, cache_file)
+
+    return ClusteringCache(cache_file, use_sequence_summary=use_sequence_summary,
+                           parse_consensus_counts=parse_consensus_counts)
+
+
+class ClusteringCache:
+    """
+    Reads clusters from a cache file. The file is memory mapped and
+    only the requested clusters are converted into Cluster objects.
+
+    Consensus peaks are stored as float32 values and may therefore
+    differ slightly from the values in the .clustering file.
+    """
+    def __init__(self, cache_file, use_sequence_summary=False, parse_consensus_counts=False):
+        """
+        Opens the cache file.
+
+        :param cache_file: Path to the cache file
+        :param use_sequence_summary: If set, the clusters' sequence counts are taken from the
+                                     precomputed "sequence=" line (see ClusteringParser).
+        :param parse_consensus_counts: If set, the clusters' consensus_counts are set. Otherwise,
+                                       they are None (see ClusteringParser).
+        """
+        self.cache_file = cache_file
+        self.use_sequence_summary = use_sequence_summary
+        self.parse_consensus_counts = parse_consensus_counts
+
+        self._file = open(cache_file, "rb")
+
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self._file.close()
+            raise Exception("Invalid clustering cache file: " + cache_file)
+
+        if self._mmap[0:len(MAGIC)] != MAGIC:
+            self.close()
+            raise Exception("Invalid clustering cache file: " + cache_file)
+
+        version, content_length = struct.unpack("<II", self._mmap[len(MAGIC):len(MAGIC) + 8])
+
+        if version != VERSION:
+            self.close()
+            raise Exception("Unsupported clustering cache version " + str(version) + " in " + cache_file)
+
+        content_start = len(MAGIC) + 8
+        content = json.loads(self._mmap[content_start:content_start + content_length].decode())
+        data_start = content_start + content_length + (-(content_start + content_length) % 8)
+
+        self.header = objects.ClusteringHeader(content["properties"])
+        self._file_signature = content["file_signature"]
+
+        for name, dtype in SECTIONS:
+            offset, count = content["sections"][name]
+
+            if name == "strings":
+                # strings are read directly from the mapped file
+                self._strings_start = data_start + offset
+
+            setattr(self, "_" + name, numpy.frombuffer(self._mmap, dtype=dtype, count=count,
+                                                       offset=data_start + offset))
+
+        # decoded shared strings and PSMs
+        self._string_cache = dict()
+        self._psm_cache = dict()
+        self._cluster_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._clusters)
+
+    def __iter__(self):
+        for index in range(len(self._clusters)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        """
+        Returns the cluster at the passed position.
+
+        :param index: The cluster's position in the file
+        :return: The Cluster object
+        """
+        return self._create_cluster(self._clusters[index])
+
+    def close(self):
+        """
+        Closes the cache file. Clusters that were already loaded remain
+        valid.
+        """
+        # the arrays reference the mapped memory
+        for name, dtype in SECTIONS:
+            setattr(self, "_" + name, None)
+
+        self._mmap.close()
+        self._file.close()
+
+    def is_up_to_date(self, clustering_file):
+        """
+        Tests whether the cache matches the current version of
+        the .clustering file.
+
+        :param clustering_file: Path to the .clustering file
+        :return: Boolean
+        """
+        return self._file_signature == _get_file_signature(clustering_file)
+
+    def get_cluster(self, cluster_id):
+        """
+        Returns the cluster with the passed id.
+
+        :param cluster_id: The cluster's id
+        :return: The Cluster object or None if the cluster does not exist
+        """
+        if self._cluster_ids is None:
+            self._cluster_ids = dict()
+
+            for index, string_id in enumerate(self._clusters["id"].tolist()):
+                self._cluster_ids.setdefault(self._get_string(string_id, shared=False), index)
+
+        index = self._cluster_ids.get(cluster_id, None)
+
+        if index is None:
+            return None
+
+        return self[index]
+
+    def get_clusters(self, mask=None):
+        """
+        Returns the clusters selected through the mask.
+
+        :param mask: Boolean array with one entry per cluster. If not set, all clusters are returned.
+        :return: Generator of Cluster objects
+        """
+        if mask is None:
+            positions = range(len(self._clusters))
+        else:
+            positions = numpy.flatnonzero(mask).tolist()
+
+        for index in positions:
+            yield self[index]
+
+    def get_cluster_stats(self):
+        """
+        Returns the number of (identified / unidentified) spectra of
+        all clusters without creating the Cluster objects. As in the
+        Cluster objects, SPEC lines that represent the same spectrum
+        are only counted once.
+
+        :return: A dict with "n_spectra", "identified_spectra", "unidentified_spectra", and
+                 "precursor_mz" as keys and numpy arrays as values.
+        """
+        n_spectra = self._clusters["n_spectra"].astype(numpy.int64)
+
+        # every distinct sequence string is only tested once
+        sequence_ids, spectrum_sequences = numpy.unique(self._spectra["sequences"], return_inverse=True)
+        identified = numpy.array([len(self._get_string(string_id).strip()) > 0
+                                  for string_id in sequence_ids.tolist()], dtype=bool)[spectrum_sequences]
+
+        # the spectra are stored in the order of their clusters
+        cluster_index = numpy.repeat(numpy.arange(len(self._clusters)), n_spectra)
+        identified_spectra = numpy.bincount(cluster_index, weights=identified,
+                                            minlength=len(self._clusters)).astype(numpy.int64)
+
+        return {"n_spectra": n_spectra, "identified_spectra": identified_spectra,
+                "unidentified_spectra": n_spectra - identified_spectra,
+                "precursor_mz": self._clusters["precursor_mz"]}
+
+    def get_precursor_index(self):
+        """
+        Creates a PrecursorIndex of all clusters in the cache. The
+        PrecursorIndex returns the clusters' positions which can be
+        used to retrieve the clusters (ie. cache[position]).
+
+        :return: The PrecursorIndex
+        """
+        # same logic as Cluster._calculate_charge, duplicated SPEC lines were already removed
+        charges = self._spectra["charge"].astype(numpy.int64)
+
+        # the spectra are stored in the order of their clusters
+        cluster_index = numpy.repeat(numpy.arange(len(self._clusters)), self._clusters["n_spectra"])
+
+        sum_charge = numpy.bincount(cluster_index, weights=charges, minlength=len(self._clusters))
+        n_charges = numpy.bincount(cluster_index, weights=charges != 0, minlength=len(self._clusters))
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            cluster_charge = numpy.where(n_charges > 0, numpy.round(sum_charge / n_charges), 0)
+
+        return clustering_index.PrecursorIndex(self._clusters["precursor_mz"], cluster_charge,
+                                               numpy.arange(len(self._clusters)))
+
+    def _get_string(self, string_id, shared=True):
+        """
+        Returns the string with the passed id from the string pool.
+
+        :param string_id: The string's id
+        :param shared: If set, the decoded string is kept in memory
+        :return: The string
+        """
+        if shared:
+            value = self._string_cache.get(string_id, None)
+
+            if value is not None:
+                return value
+
+        start, end = self._string_offsets[string_id:string_id + 2].tolist()
+        value = self._mmap[self._strings_start + start:self._strings_start + end].decode()
+
+        if shared:
+            self._string_cache[string_id] = value
+
+        return value
+
+    def _get_psms(self, sequences_id, ptms_id):
+        """
+        Returns the PSMs defined by the SPEC line's sequence and PTM fields.
+
+        :param sequences_id: String id of the sequences
+        :param ptms_id: String id of the PTMs
+        :return: A list of PSM objects
+        """
+        psms = self._psm_cache.get((sequences_id, ptms_id), None)
+
+        if psms is None:
+            # imported here to prevent a circular import
+            from .clustering_parser import ClusteringParser
+
+            sequences = self._get_string(sequences_id).split(",")
+            ptm_strings = self._get_string(ptms_id).split(";")
+
+            if len(sequences) != len(ptm_strings):
+                raise Exception("Invalid SPEC line encountered: different number of sequences and PTMs defined")
+
+            psms = ClusteringParser._create_psms(sequences, ptm_strings)
+            self._psm_cache[(sequences_id, ptms_id)] = psms
+
+        return psms
+
+    def _create_cluster(self, row):
+        """
+        Creates the Cluster object based on its row in the cluster table.
+
+        :param row: The cluster's row
+        :return: The Cluster object
+        """
+        precursor_mz, precursor_intens, mz_offset, intens_offset, count_offset, spectra_offset, cluster_id, \
+            sequence_summary, n_mz, n_intens, n_counts, n_spectra = row.item()
+
+        # copy the peaks since the mapped memory is released once the cache is closed
+        consensus_mz = numpy.array(self._consensus_mz[mz_offset:mz_offset + n_mz])
+        consensus_intens = numpy.array(self._consensus_intens[intens_offset:intens_offset + n_intens])
+
+        consensus_counts = None
+        if self.parse_consensus_counts:
+            consensus_counts = numpy.array(self._consensus_count[count_offset:count_offset + n_counts])
+
+        spectra = list()
+        for spectrum_precursor_mz, similarity_score, charge, title_prefix, title, sequences, ptms, taxids, \
+                json_properties, padding in self._spectra[spectra_offset:spectra_offset + n_spectra].tolist():
+            spectra.append(objects.Spectrum(self._get_string(title_prefix) + self._get_string(title, shared=False),
+                                            spectrum_precursor_mz, charge, self._get_string(taxids).split(","),
+                                            self._get_psms(sequences, ptms), similarity_score,
+                                            self._get_string(json_properties)))
+
+        sequence_counts = None
+        if self.use_sequence_summary and sequence_summary != NO_STRING:
+            # imported here to prevent a circular import
+            from .clustering_parser import ClusteringParser
+
+            sequence_counts = ClusteringParser._parse_sequence_summary(
+                self._get_string(sequence_summary, shared=False))
+
+        return objects.Cluster(self._get_string(cluster_id, shared=False),
+                               precursor_mz if precursor_mz == precursor_mz else None, consensus_mz,
+                               consensus_intens, spectra, sequence_counts=sequence_counts,
+                               consensus_counts=consensus_counts,
+                               precursor_intens=precursor_intens if precursor_intens == precursor_intens else None)
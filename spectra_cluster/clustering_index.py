@@ -0,0 +1,566 @@
+"""
+The clustering index stores the position of every cluster
+within a .clustering file. This allows clusters to be loaded
+directly from (very large) files without having to parse the
+whole file.
+
+The index is stored as numpy arrays next to the .clustering
+file (".pyindex" extension) and is re-created automatically if
+the .clustering file was changed.
+
+Additionally, the PrecursorIndex holds the clusters sorted by their
+precursor m/z to quickly find all clusters within a m/z window and
+the PeptideIndex maps the identified peptides to the clusters they
+were observed in (".pepindex" extension).
+"""
+
+import os
+import mmap
+import pickle
+import numpy
+
+from . import sequences
+from . import compression
+
+# version of the index file's format - older index files are re-created
+INDEX_VERSION = 3
+PEPTIDE_INDEX_VERSION = 1
+
+# the arrays of a ClusteringIndex (in the order they are saved)
+INDEX_ARRAYS = ("cluster_ids", "entries", "file_order")
+
+INDEX_ENTRY_DTYPE = numpy.dtype([("offset", "<u8"), ("length", "<u8"), ("precursor_mz", "<f8"),
+                                 ("n_spectra", "<u4"), ("charge", "<i4")])
+
+
+class ClusterIndexEntry:
+    """
+    Position and basic properties of a cluster within a
+    .clustering file.
+
+    :ivar cluster_id: The cluster's id
+    :ivar offset: Byte offset of the cluster's "=Cluster=" line
+    :ivar length: Length of the cluster's block in bytes
+    :ivar precursor_mz: The cluster's average precursor m/z
+    :ivar n_spectra: Number of SPEC lines of the cluster
+    :ivar charge: The cluster's charge (average charge of its SPEC lines, see Cluster)
+    """
+    def __init__(self, cluster_id, offset, length, precursor_mz, n_spectra, charge=0):
+        self.cluster_id = cluster_id
+        self.offset = offset
+        self.length = length
+        self.precursor_mz = precursor_mz
+        self.n_spectra = n_spectra
+        self.charge = charge
+
+
+class ClusteringIndex:
+    """
+    Maps cluster ids to the position of the cluster within
+    a .clustering file.
+
+    The index is held as flat numpy arrays with the entries sorted by
+    the clusters' ids. Clusters are found through binary search and
+    their ClusterIndexEntry objects are only created when requested.
+    Saved indexes are memory-mapped so that loading the index does
+    not depend on the number of clusters.
+
+    :ivar clustering_file: Path to the indexed .clustering file
+    :ivar index_file: Path to the file the index is stored in
+    """
+    def __init__(self, clustering_file, index_file=None):
+        """
+        Creates a new (empty) index for the passed .clustering file.
+
+        :param clustering_file: Path to the .clustering file.
+        :param index_file: Path to the index file. If not set, the
+                           .clustering file's name + ".pyindex" is used.
+        """
+        self.clustering_file = clustering_file
+        self.index_file = index_file if index_file is not None else clustering_file + ".pyindex"
+        self._set_arrays(ClusteringIndex._create_arrays(list(), list()))
+        self._file_signature = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, cluster_id):
+        return self._find(cluster_id) is not None
+
+    def __getitem__(self, cluster_id):
+        entry = self.get(cluster_id)
+
+        if entry is None:
+            raise KeyError(cluster_id)
+
+        return entry
+
+    def __iter__(self):
+        # the entries are returned in the order of the .clustering file
+        for position in self._file_order.tolist():
+            yield self._create_entry(position)
+
+    def get(self, cluster_id):
+        """
+        Returns the index entry for the passed cluster id.
+
+        :param cluster_id: The cluster's id
+        :return: The ClusterIndexEntry or None if the cluster is not part of the file
+        """
+        position = self._find(cluster_id)
+
+        if position is None:
+            return None
+
+        return self._create_entry(position)
+
+    def build(self):
+        """
+        Creates the index in a single pass over the .clustering
+        file.
+        """
+        # imported here to prevent a circular import
+        from .clustering_parser import ClusteringParser
+
+        cluster_ids = list()
+        rows = dict()
+        self._file_signature = _get_file_signature(self.clustering_file)
+
+        with compression.open_file(self.clustering_file, "rb") as reader:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+                cluster_id = None
+                precursor_mz = None
+                n_spectra = 0
+                n_charges = 0
+                sum_charge = 0
+
+                for line in lines:
+                    if line.startswith(b"SPEC"):
+                        n_spectra += 1
+
+                        # same logic as Cluster._calculate_charge
+                        fields = line.split(b"\t", 6)
+                        charge = int(float(fields[5])) if len(fields) > 5 else 0
+
+                        if charge != 0:
+                            n_charges += 1
+                            sum_charge += charge
+                    elif line.startswith(b"id="):
+                        cluster_id = line[3:].strip()
+                    elif line.startswith(b"av_precursor_mz="):
+                        precursor_mz = float(line[16:])
+
+                # ignore invalid blocks and keep the first occurrence of a cluster
+                if cluster_id is None or cluster_id in rows:
+                    continue
+
+                charge = round(sum_charge / n_charges, ndigits=0) if n_charges > 0 else 0
+
+                cluster_ids.append(cluster_id)
+                rows[cluster_id] = (offset, length, precursor_mz if precursor_mz is not None else numpy.nan,
+                                    n_spectra, charge)
+
+        self._set_arrays(ClusteringIndex._create_arrays(cluster_ids, [rows[c] for c in cluster_ids]))
+
+    def get_precursor_index(self):
+        """
+        Creates a PrecursorIndex of all clusters in the index. The
+        PrecursorIndex returns the clusters' ids.
+
+        :return: The PrecursorIndex
+        """
+        return PrecursorIndex(self._entries["precursor_mz"], self._entries["charge"],
+                              numpy.char.decode(self._cluster_ids, "utf-8"))
+
+    def is_saved(self):
+        """
+        Tests whether the index file exists.
+
+        :return: Boolean indicating whether the index was saved before
+        """
+        return os.path.isfile(self.index_file)
+
+    def is_up_to_date(self):
+        """
+        Tests whether the index matches the current version of
+        the .clustering file.
+
+        :return: Boolean
+        """
+        return self._file_signature is not None and self._file_signature == _get_file_signature(self.clustering_file)
+
+    def save(self):
+        """
+        Saves the index to the index file. The file holds the index's
+        arrays as consecutive .npy arrays.
+        """
+        info = numpy.array([INDEX_VERSION] + list(self._file_signature), dtype="<i8")
+
+        with open(self.index_file, "wb") as writer:
+            for values in [info] + [getattr(self, "_" + name) for name in INDEX_ARRAYS]:
+                numpy.save(writer, values, allow_pickle=False)
+
+    def load(self):
+        """
+        Loads the index from the index file. The index's arrays are
+        memory-mapped and not read into memory.
+        """
+        try:
+            arrays = _map_arrays(self.index_file, len(INDEX_ARRAYS) + 1)
+        except Exception:
+            # truncated or corrupt index files are rebuilt as well
+            arrays = None
+
+        # index files of older versions are treated as outdated
+        if arrays is None or arrays[0].shape != (3, ) or arrays[0][0] != INDEX_VERSION:
+            self._file_signature = None
+            self._set_arrays(ClusteringIndex._create_arrays(list(), list()))
+            return
+
+        self._file_signature = tuple(arrays[0][1:].tolist())
+        self._set_arrays(dict(zip(INDEX_ARRAYS, arrays[1:])))
+
+    def _set_arrays(self, arrays):
+        """
+        Sets the index's arrays.
+
+        :param arrays: A dict with the array's name (see INDEX_ARRAYS) as key and the array as value
+        """
+        for name in INDEX_ARRAYS:
+            setattr(self, "_" + name, arrays[name])
+
+    @staticmethod
+    def _create_arrays(cluster_ids, rows):
+        """
+        Creates the index's arrays with the entries sorted by their cluster id.
+
+        :param cluster_ids: The clusters' ids as bytes in the order of the .clustering file
+        :param rows: The clusters' (offset, length, precursor m/z, n spectra, charge) in the same order
+        :return: A dict with the array's name (see INDEX_ARRAYS) as key and the array as value
+        """
+        cluster_ids = numpy.array(cluster_ids, dtype=bytes)
+        entries = numpy.array(rows, dtype=INDEX_ENTRY_DTYPE)
+
+        order = numpy.argsort(cluster_ids, kind="stable")
+        file_order = numpy.empty(len(order), dtype="<u4")
+        file_order[order] = numpy.arange(len(order), dtype="<u4")
+
+        return {"cluster_ids": cluster_ids[order], "entries": entries[order], "file_order": file_order}
+
+    def _find(self, cluster_id):
+        """
+        Finds the position of the passed cluster within the index's arrays.
+
+        :param cluster_id: The cluster's id
+        :return: The position or None if the cluster is not part of the file
+        """
+        cluster_id = cluster_id.encode()
+        position = int(numpy.searchsorted(self._cluster_ids, cluster_id))
+
+        if position < len(self._cluster_ids) and self._cluster_ids[position] == cluster_id:
+            return position
+
+        return None
+
+    def _create_entry(self, position):
+        """
+        Creates the ClusterIndexEntry of the passed position.
+
+        :param position: The entry's position within the index's arrays
+        :return: The ClusterIndexEntry
+        """
+        offset, length, precursor_mz, n_spectra, charge = self._entries[position].tolist()
+
+        return ClusterIndexEntry(self._cluster_ids[position].decode(), offset, length,
+                                 precursor_mz if precursor_mz == precursor_mz else None, n_spectra, charge)
+
+
+class PrecursorIndex:
+    """
+    Holds the clusters' precursor m/z values in sorted order to find
+    all clusters within a m/z window through binary search.
+
+    :ivar precursor_mz: The sorted precursor m/z values
+    :ivar charges: The clusters' charges (in the same order)
+    :ivar keys: The clusters' keys (in the same order). These are the cluster
+                ids or the clusters' positions, depending on how the index was created.
+    """
+    def __init__(self, precursor_mz, charges, keys):
+        """
+        Creates a new PrecursorIndex. Clusters without a precursor m/z
+        (None or NaN) are never returned.
+
+        :param precursor_mz: The clusters' precursor m/z values
+        :param charges: The clusters' charges
+        :param keys: The clusters' keys (ids or positions) that are returned by the queries
+        """
+        if not isinstance(precursor_mz, numpy.ndarray):
+            precursor_mz = [mz if mz is not None else numpy.nan for mz in precursor_mz]
+
+        precursor_mz = numpy.asarray(precursor_mz, dtype=numpy.float64)
+        order = numpy.argsort(precursor_mz, kind="stable")
+
+        self.precursor_mz = precursor_mz[order]
+        self.charges = numpy.asarray(charges, dtype=numpy.int16)[order]
+        self.keys = numpy.asarray(keys)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def query_precursor(self, mz, tolerance, charge=None):
+        """
+        Finds all clusters whose precursor m/z lies within the passed
+        tolerance (inclusive).
+
+        :param mz: The target m/z or a list / array of target m/z values
+        :param tolerance: The m/z tolerance (absolute)
+        :param charge: If set, only clusters with this charge are returned. If
+                       multiple targets are passed this may also be a list
+                       with one charge (or None) per target.
+        :return: A numpy array of the matching clusters' keys sorted by precursor m/z. If
+                 multiple targets were passed a list with one array per target.
+        """
+        if numpy.ndim(mz) == 0:
+            return self.query_precursor([mz], tolerance, [charge])[0]
+
+        mz = numpy.asarray(mz, dtype=numpy.float64)
+
+        if charge is None or numpy.ndim(charge) == 0:
+            charge = [charge] * len(mz)
+
+        starts = numpy.searchsorted(self.precursor_mz, mz - tolerance, side="left").tolist()
+        ends = numpy.searchsorted(self.precursor_mz, mz + tolerance, side="right").tolist()
+
+        results = list()
+
+        for start, end, target_charge in zip(starts, ends, charge):
+            if target_charge is None:
+                results.append(self.keys[start:end])
+            else:
+                results.append(self.keys[start:end][self.charges[start:end] == target_charge])
+
+        return results
+
+
+class PeptideIndex:
+    """
+    Inverted index of the clean peptide sequences (only upper case
+    letters) identified in a .clustering file. For every sequence the
+    index holds the clusters containing spectra identified as this
+    sequence and the respective number of spectra. Additionally, the
+    same information is stored for the I/L agnostic sequences (every
+    "I" replaced by "L").
+
+    :ivar clustering_file: Path to the indexed .clustering file
+    :ivar index_file: Path to the file the index is stored in
+    :ivar cluster_ids: List of all indexed clusters' ids
+    :ivar cluster_sizes: List of the clusters' number of spectra (same order as cluster_ids)
+    :ivar sequences: Dict with the clean sequence as key and a list of (cluster position, n spectra) as value
+    :ivar il_sequences: Dict with the I/L agnostic sequence as key and a list of (cluster position, n spectra)
+                        as value
+    """
+    def __init__(self, clustering_file, index_file=None):
+        """
+        Creates a new (empty) peptide index for the passed .clustering file.
+
+        :param clustering_file: Path to the .clustering file.
+        :param index_file: Path to the index file. If not set, the
+                           .clustering file's name + ".pepindex" is used.
+        """
+        self.clustering_file = clustering_file
+        self.index_file = index_file if index_file is not None else clustering_file + ".pepindex"
+        self.cluster_ids = list()
+        self.cluster_sizes = list()
+        self.sequences = dict()
+        self.il_sequences = dict()
+        self._file_signature = None
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def __contains__(self, sequence):
+        return PeptideIndex.clean_sequence(sequence) in self.sequences
+
+    @staticmethod
+    def clean_sequence(sequence, ignore_il=False):
+        """
+        Removes all characters but upper case letters from the sequence.
+
+        :param sequence: The peptide sequence
+        :param ignore_il: If set, every "I" is replaced by "L"
+        :return: The clean sequence
+        """
+        if ignore_il:
+            return sequences.clean_il_sequence(sequence)
+
+        return sequences.clean_sequence(sequence)
+
+    def get_clusters(self, sequence, ignore_il=False):
+        """
+        Returns all clusters containing spectra identified as the passed
+        sequence.
+
+        :param sequence: The peptide sequence. Modifications or lower case
+                         letters are ignored.
+        :param ignore_il: If set, I and L are treated as the same amino acid.
+        :return: A dict with the cluster id as key and the number of spectra identified
+                 as the sequence as value.
+        """
+        sequence = PeptideIndex.clean_sequence(sequence, ignore_il)
+        entries = self.il_sequences if ignore_il else self.sequences
+
+        return dict([(self.cluster_ids[position], n_spectra) for position, n_spectra in entries.get(sequence, [])])
+
+    def build(self):
+        """
+        Creates the index in a single pass over the .clustering
+        file. Only the SPEC lines' sequence fields are parsed.
+        """
+        # imported here to prevent a circular import
+        from .clustering_parser import ClusteringParser
+
+        self.cluster_ids = list()
+        self.cluster_sizes = list()
+        self.sequences = dict()
+        self.il_sequences = dict()
+        self._file_signature = _get_file_signature(self.clustering_file)
+
+        # the clean sequences of every sequence field are only determined once
+        clean_sequences = dict()
+
+        with compression.open_file(self.clustering_file, "rb") as reader:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+                cluster_id = None
+                spec_lines = list()
+
+                for line in lines:
+                    if line.startswith(b"SPEC"):
+                        spec_lines.append(line.rstrip(b"\r\n"))
+                    elif line.startswith(b"id="):
+                        cluster_id = line[3:].strip().decode()
+
+                if cluster_id is None:
+                    continue
+
+                # SPEC lines representing the same spectrum are only counted once, as done by the Cluster class
+                spec_lines = ClusteringParser._get_unique_spec_lines(spec_lines)
+                sequence_counts = dict()
+                il_sequence_counts = dict()
+
+                for line in spec_lines:
+                    fields = line.split(b"\t", 4)
+
+                    if len(fields) < 5:
+                        raise Exception("Invalid SPEC line encountered: " + line.decode())
+
+                    if fields[3] not in clean_sequences:
+                        spec_sequences = set([sequences.clean_sequence(sequence)
+                                              for sequence in fields[3].decode().split(",")])
+                        spec_sequences.discard("")
+                        clean_sequences[fields[3]] = (spec_sequences,
+                                                      set([sequences.fold_il(s) for s in spec_sequences]))
+
+                    spec_sequences, il_sequences = clean_sequences[fields[3]]
+
+                    for sequence in spec_sequences:
+                        sequence_counts[sequence] = sequence_counts.get(sequence, 0) + 1
+                    for sequence in il_sequences:
+                        il_sequence_counts[sequence] = il_sequence_counts.get(sequence, 0) + 1
+
+                position = len(self.cluster_ids)
+                self.cluster_ids.append(cluster_id)
+                self.cluster_sizes.append(len(spec_lines))
+
+                for entries, counts in ((self.sequences, sequence_counts), (self.il_sequences, il_sequence_counts)):
+                    for sequence, n_spectra in counts.items():
+                        if sequence not in entries:
+                            entries[sequence] = list()
+                        entries[sequence].append((position, n_spectra))
+
+    def is_saved(self):
+        """
+        Tests whether the index file exists.
+
+        :return: Boolean indicating whether the index was saved before
+        """
+        return os.path.isfile(self.index_file)
+
+    def is_up_to_date(self):
+        """
+        Tests whether the index matches the current version of
+        the .clustering file.
+
+        :return: Boolean
+        """
+        return self._file_signature is not None and self._file_signature == _get_file_signature(self.clustering_file)
+
+    def save(self):
+        """
+        Saves the index to the index file.
+        """
+        with open(self.index_file, "wb") as writer:
+            pickle.dump((PEPTIDE_INDEX_VERSION, self._file_signature, self.cluster_ids, self.cluster_sizes,
+                         self.sequences, self.il_sequences), file=writer)
+
+    def load(self):
+        """
+        Loads the index from the index file.
+        """
+        try:
+            with open(self.index_file, "rb") as reader:
+                content = pickle.load(reader)
+        except Exception:
+            # truncated or corrupt index files are rebuilt as well
+            content = None
+
+        # index files of other versions are treated as outdated
+        if not isinstance(content, tuple) or len(content) != 6 or content[0] != PEPTIDE_INDEX_VERSION:
+            self._file_signature = None
+            return
+
+        version, self._file_signature, self.cluster_ids, self.cluster_sizes, self.sequences, \
+            self.il_sequences = content
+
+
+def _map_arrays(filename, n_arrays):
+    """
+    Memory-maps the consecutive .npy arrays stored in the passed file.
+
+    :param filename: Path to the file
+    :param n_arrays: Number of arrays stored in the file
+    :return: A list of the (read-only) arrays
+    """
+    with open(filename, "rb") as reader:
+        file_map = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+        arrays = list()
+
+        for i in range(n_arrays):
+            version = numpy.lib.format.read_magic(reader)
+
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(reader)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(reader)
+
+            if len(shape) != 1 or dtype.hasobject:
+                raise Exception("Invalid array in " + filename)
+
+            offset = reader.tell()
+            arrays.append(numpy.frombuffer(file_map, dtype=dtype, count=shape[0], offset=offset))
+            reader.seek(offset + dtype.itemsize * shape[0])
+
+    return arrays
+
+
+def _get_file_signature(clustering_file):
+    """
+    Size and modification time of the .clustering file used to
+    detect outdated indexes.
+
+    :param clustering_file: Path to the .clustering file
+    :return: Tuple of (size, modification time)
+    """
+    stat = os.stat(clustering_file)
+
+    return stat.st_size, stat.st_mtime_ns
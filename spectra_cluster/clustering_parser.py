@@ -5,83 +5,713 @@
 # -------------------------------
 
 
+import os
+import queue
+import functools
+import collections
+import multiprocessing
+import numpy
+
 from . import objects
+from . import compression
+from . import clustering_index
+
+# number of distinct PTM strings and SPEC line identifications whose parsed objects are cached
+PTM_CACHE_SIZE = 100000
+
+# number of bytes read from the .clustering file at once
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+# prefixes of the cluster-level lines that are used by the parser
+CLUSTER_PROPERTY_PREFIXES = (b"id=", b"av_precursor_mz=", b"av_precursor_intens=", b"sequence=", b"consensus_mz=",
+                             b"consensus_intens=", b"consensus_count=")
+
+
+class ParseWarnings:
+    """
+    Counts the warnings raised while parsing .clustering files.
+
+    The same invalid definitions (ie. PTMs) are often found in thousands
+    of SPEC lines. Instead of printing every occurrence, the warnings are
+    counted per message and reported once through **report**.
+
+    :ivar counts: Dict with the warning message as key and the number of occurrences as value
+    :ivar examples: Dict with the warning message as key and the first offending value as value
+    """
+    def __init__(self):
+        self.counts = dict()
+        self.examples = dict()
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def add(self, message, example, count=1):
+        """
+        Counts a warning.
+
+        :param message: The warning's message
+        :param example: The value that caused the warning
+        :param count: Number of occurrences to add
+        """
+        if message not in self.counts:
+            self.counts[message] = 0
+            self.examples[message] = example
+
+        self.counts[message] += count
+
+    def merge(self, other):
+        """
+        Adds the warnings counted by another ParseWarnings object.
+
+        :param other: The ParseWarnings to add
+        """
+        for message, count in other.counts.items():
+            self.add(message, other.examples[message], count)
+
+    def pop(self):
+        """
+        Returns a copy of the current warnings and resets the counters.
+
+        :return: A ParseWarnings object
+        """
+        warnings = ParseWarnings()
+        warnings.merge(self)
+        self.reset()
+
+        return warnings
+
+    def reset(self):
+        """
+        Removes all counted warnings.
+        """
+        self.counts = dict()
+        self.examples = dict()
+
+    def report(self, reset=True):
+        """
+        Prints one line per warning message and resets the counters.
+
+        :param reset: If set, the counters are reset after printing.
+        """
+        for message, count in self.counts.items():
+            print("Warning: " + message + " (" + str(count) + "x, e.g. '" + self.examples[message] + "')")
+
+        if reset:
+            self.reset()
+
+
+# warnings of all parsers within this process
+parse_warnings = ParseWarnings()
 
 
 class ClusteringParser:
     """Parses .clustering output files created by the spectra-cluster applications.
     """
 
-    def __init__(self, clustering_file):
+    def __init__(self, clustering_file, lazy=False, use_sequence_summary=False, cluster_filter=None,
+                 parse_consensus_counts=False):
         """
         Processes the passed .clustering file
 
         :param clustering_file: Path to the file to process
+        :param lazy: If set, LazyCluster objects are returned that only create their
+                     Spectrum objects once get_spectra() is called.
+        :param use_sequence_summary: If set, the clusters' sequence counts (and thereby the ratios)
+                                     are taken from the precomputed "sequence=" line instead of being
+                                     calculated from the SPEC lines. Clusters without this line are
+                                     still processed based on their SPEC lines.
+        :param cluster_filter: If set, clusters that do not pass this ClusterFilter are skipped
+                               without creating the Cluster objects.
+        :param parse_consensus_counts: If set, the consensus peaks' counts ("consensus_count=" line)
+                                       are parsed into the clusters' consensus_counts.
         :return:
         """
         self.clustering_file = clustering_file
+        self.lazy = lazy
+        self.use_sequence_summary = use_sequence_summary
+        self.cluster_filter = cluster_filter
+        self.parse_consensus_counts = parse_consensus_counts
+        self._index = None
+        self._precursor_index = None
+        self._peptide_index = None
+        self._header = None
+
+    @property
+    def header(self):
+        """
+        The file's header (all lines before the first cluster) as
+        a ClusteringHeader object. The header is only read once.
+
+        :return: The ClusteringHeader object
+        """
+        if self._header is None:
+            self._header = ClusteringParser._read_header(self.clustering_file)
+
+        return self._header
+
+    @staticmethod
+    def _read_header(clustering_file):
+        """
+        Reads the header of a .clustering file.
+
+        :param clustering_file: Path to the .clustering file
+        :return: A ClusteringHeader object
+        """
+        properties = dict()
+
+        with compression.open_file(clustering_file, "rb") as reader:
+            for line in reader:
+                line = line.decode().strip()
+
+                if line == "=Cluster=":
+                    break
+
+                separator_index = line.find("=")
+
+                if separator_index < 1:
+                    continue
+
+                properties[line[:separator_index]] = line[separator_index + 1:]
+
+        return objects.ClusteringHeader(properties)
 
     def __iter__(self):
         return self._get_iterator()
 
     def _get_iterator(self):
         """
-        Iterates over all clusters in a file
+        Iterates over all clusters in a file based on their raw cluster
+        blocks. Blocks that do not pass the cluster filter are skipped.
 
-        :return: The next Cluster
+        :return: The next (Lazy)Cluster
         """
-        spectra = list()
-        cur_id = None
-        precursor_mz = None
-        consensus_mz = list()
-        consensus_intens = list()
+        with compression.open_file(self.clustering_file, "rb") as clustering_input:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(clustering_input):
+                if self.cluster_filter is not None and not self.cluster_filter.accepts_block(lines):
+                    continue
 
-        with open(self.clustering_file, "r") as clustering_input:
-            for line in clustering_input:
-                line = line.strip()
-                if line == "=Cluster=":
-                    # create and return the cluster
-                    if cur_id is not None:
-                        cluster = objects.Cluster(cur_id, precursor_mz, consensus_mz, consensus_intens, spectra)
-                        yield cluster
-
-                    # reset parameters
-                    cur_id = None
-                    precursor_mz = None
-                    consensus_mz = list()
-                    consensus_intens = list()
-                    spectra = list()
+                cluster = ClusteringParser._parse_cluster_block(lines, self.lazy, self.use_sequence_summary,
+                                                                self.parse_consensus_counts)
+
+                if cluster is not None:
+                    yield cluster
 
+        parse_warnings.report()
+
+    def get_index(self, rebuild=False):
+        """
+        Returns the byte-offset index of the .clustering file. If an index
+        file exists next to the .clustering file and is still up to date it
+        is loaded. Otherwise, the index is created in a single pass over the
+        file and saved for later use.
+
+        :param rebuild: If set, the index is always re-created.
+        :return: The ClusteringIndex object
+        """
+        if self._index is not None and not rebuild:
+            return self._index
+
+        self._precursor_index = None
+
+        index = clustering_index.ClusteringIndex(self.clustering_file)
+
+        if not rebuild and index.is_saved():
+            index.load()
+
+        if rebuild or not index.is_up_to_date():
+            index.build()
+
+            try:
+                index.save()
+            except OSError:
+                # the index still works, it simply has to be re-created next time
+                print("Warning: Failed to save index file " + index.index_file)
+
+        self._index = index
+
+        return self._index
+
+    def get_peptide_index(self, rebuild=False):
+        """
+        Returns the inverted peptide index of the .clustering file. As
+        with the byte-offset index, the index is loaded from the file
+        next to the .clustering file (".pepindex" extension) if it is up
+        to date. Otherwise, it is created and saved.
+
+        :param rebuild: If set, the index is always re-created.
+        :return: The PeptideIndex object
+        """
+        if self._peptide_index is not None and not rebuild:
+            return self._peptide_index
+
+        index = clustering_index.PeptideIndex(self.clustering_file)
+
+        if not rebuild and index.is_saved():
+            index.load()
+
+        if rebuild or not index.is_up_to_date():
+            index.build()
+
+            try:
+                index.save()
+            except OSError:
+                # the index still works, it simply has to be re-created next time
+                print("Warning: Failed to save index file " + index.index_file)
+
+        self._peptide_index = index
+
+        return self._peptide_index
+
+    def query_precursor(self, mz, tolerance, charge=None):
+        """
+        Finds all clusters whose average precursor m/z lies within the
+        passed tolerance using the file's index. The index is created if
+        it does not exist. The matching clusters can then be loaded through
+        **get_clusters**.
+
+        :param mz: The target m/z or a list of target m/z values
+        :param tolerance: The m/z tolerance (absolute)
+        :param charge: If set, only clusters with this charge are returned. If
+                       multiple targets are passed this may also be a list
+                       with one charge (or None) per target.
+        :return: A list of the matching cluster ids. If multiple targets were passed
+                 a list with one list of cluster ids per target.
+        """
+        if self._precursor_index is None:
+            self._precursor_index = self.get_index().get_precursor_index()
+
+        results = self._precursor_index.query_precursor(mz, tolerance, charge)
+
+        if isinstance(results, list):
+            return [result.tolist() for result in results]
+
+        return results.tolist()
+
+    def get_cluster(self, cluster_id):
+        """
+        Loads a single cluster from the file using the file's index. The
+        index is created if it does not exist.
+
+        :param cluster_id: The cluster's id
+        :return: The Cluster object or None if no cluster with this id exists
+        """
+        clusters = self.get_clusters([cluster_id])
+
+        if len(clusters) < 1:
+            return None
+
+        return clusters[0]
+
+    def get_clusters(self, cluster_ids):
+        """
+        Loads the defined clusters from the file using the file's index. Clusters
+        are returned in the order of the passed ids, ids that do not exist in the
+        file are ignored.
+
+        Compressed files cannot be accessed through the index's offsets. Their
+        clusters are loaded in a single pass over the file instead.
+
+        :param cluster_ids: An iterable of cluster ids
+        :return: A list of Cluster objects
+        """
+        if compression.is_compressed(self.clustering_file):
+            return self._find_clusters(cluster_ids)
+
+        index = self.get_index()
+        clusters = list()
+
+        with open(self.clustering_file, "rb") as reader:
+            for cluster_id in cluster_ids:
+                entry = index.get(cluster_id)
+
+                if entry is None:
                     continue
 
-                # process the spectrum
-                if line[0:4] == "SPEC":
-                    spectra.append(ClusteringParser._parse_spec_line(line))
+                reader.seek(entry.offset)
+                cluster_block = reader.read(entry.length)
+
+                cluster = ClusteringParser._parse_cluster_block(ClusteringParser._split_lines(cluster_block),
+                                                                self.lazy, self.use_sequence_summary,
+                                                                self.parse_consensus_counts)
+
+                if cluster is not None:
+                    clusters.append(cluster)
+
+        parse_warnings.report()
+
+        return clusters
+
+    def _find_clusters(self, cluster_ids):
+        """
+        Loads the defined clusters in a single pass over the file.
+
+        :param cluster_ids: An iterable of cluster ids
+        :return: A list of Cluster objects in the order of the passed ids
+        """
+        cluster_ids = list(cluster_ids)
+        clusters = dict()
+
+        cluster_filter = ClusterFilter(cluster_ids=cluster_ids)
+
+        with compression.open_file(self.clustering_file, "rb") as reader:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+                if not cluster_filter.accepts_block(lines):
                     continue
 
-                # process standard fields
-                if line[0:3] == "id=":
-                    cur_id = line[3:]
-                if line[0:16] == "av_precursor_mz=":
-                    precursor_mz = float(line[16:])
-                if line.lstrip()[0:13] == "consensus_mz=":
-                    # this is only a work around for empty consensus spectrum entries
-                    if len(line) < 14:
-                        consensus_mz = list()
-                    else:
-                        consensus_mz = [float(s) for s in line[13:].split(",")]
-                if line[0:17] == "consensus_intens=":
-                    if len(line) < 18:
-                        consensus_intens = list()
-                    else:
-                        consensus_intens = [float(s) for s in line[17:].split(",")]
-
-                # TODO: add support for consensus counts!
-
-        # process the last cluster
-        if cur_id is not None:
-            cluster = objects.Cluster(cur_id, precursor_mz, consensus_mz, consensus_intens, spectra)
-            yield cluster
+                cluster = ClusteringParser._parse_cluster_block(lines, self.lazy, self.use_sequence_summary,
+                                                                self.parse_consensus_counts)
+
+                if cluster is not None:
+                    clusters[cluster.id] = cluster
+
+                # stop once all clusters were found
+                if len(clusters) == len(cluster_filter.cluster_ids):
+                    break
+
+        parse_warnings.report()
+
+        return [clusters[cluster_id] for cluster_id in cluster_ids if cluster_id in clusters]
+
+    @staticmethod
+    def _read_cluster_blocks(reader, start=0, end=None):
+        """
+        Iterates over the raw cluster blocks of a .clustering file opened in
+        binary mode. A block starts with the "=Cluster=" line and ends before
+        the next "=Cluster=" line or at the end of the file.
+
+        The file is read in large chunks which are only split into lines once
+        a complete block was found.
+
+        :param reader: File object opened in binary mode (see compression.open_file).
+        :param start: Byte offset at which the first cluster starts. Must be 0 for compressed files.
+        :param end: If set, only blocks starting before this offset are returned.
+        :return: Tuples of (offset, length, lines) with lines being the block's raw lines
+                 (without the line endings)
+        """
+        # compressed files may not support seek
+        if start > 0:
+            reader.seek(start)
+
+        # the start is always at the beginning of a line
+        data = b"\n" + reader.read(READ_BUFFER_SIZE)
+        # data[0] is located at data_offset within the file
+        data_offset = start - 1
+        is_eof = len(data) < 2
+
+        # find the first block
+        block_start = data.find(b"\n=Cluster=")
+
+        while block_start < 0:
+            if is_eof:
+                return
+
+            # keep the bytes that may be the beginning of the first block's line
+            data_offset += max(len(data) - 9, 0)
+            data = data[-9:]
+            chunk = reader.read(READ_BUFFER_SIZE)
+            is_eof = len(chunk) < 1
+            data += chunk
+            block_start = data.find(b"\n=Cluster=")
+
+        block_start += 1
+        search_start = block_start
+
+        while True:
+            if end is not None and data_offset + block_start >= end:
+                return
+
+            block_end = data.find(b"\n=Cluster=", search_start)
+
+            if block_end < 0 and not is_eof:
+                # read the next chunk but only keep the current block
+                data = data[block_start:]
+                data_offset += block_start
+                # the current data may end within the next block's "\n=Cluster="
+                search_start = max(len(data) - 9, 0)
+                block_start = 0
+                chunk = reader.read(READ_BUFFER_SIZE)
+                is_eof = len(chunk) < 1
+                data += chunk
+                continue
+
+            block_end = block_end + 1 if block_end >= 0 else len(data)
+
+            yield data_offset + block_start, block_end - block_start, \
+                ClusteringParser._split_lines(data[block_start:block_end])
+
+            if block_end >= len(data):
+                return
+
+            block_start = block_end
+            search_start = block_end
+
+    @staticmethod
+    def _split_lines(block):
+        """
+        Splits a raw cluster block into its lines. Leading whitespace
+        is removed from the lines so that indented property and SPEC
+        lines are recognized by all prefix tests.
+
+        :param block: The block as bytes
+        :return: A list of the block's lines (without the line endings)
+        """
+        lines = block.split(b"\n")
+
+        # only indented lines need to be stripped
+        if b"\n " in block or b"\n\t" in block:
+            lines = [line.lstrip() for line in lines]
+
+        # the last line ends with "\n"
+        if len(lines[-1]) < 1:
+            lines.pop()
+
+        return lines
+
+    @staticmethod
+    def _split_cluster_lines(lines):
+        """
+        Separates the SPEC lines from the cluster-level properties of a
+        cluster block. The properties' lines are identified using a single
+        prefix test against CLUSTER_PROPERTY_PREFIXES.
+
+        :param lines: The cluster's raw lines as bytes
+        :return: Tuple of (SPEC lines, properties) with properties being a dict
+                 with the property's name (bytes) as key and its raw value as value
+        """
+        spec_lines = list()
+        properties = dict()
+
+        for line in lines:
+            if line.startswith(b"SPEC"):
+                spec_lines.append(line)
+            elif line.startswith(CLUSTER_PROPERTY_PREFIXES):
+                name, value = line.split(b"=", 1)
+                properties[name] = value
+
+        return spec_lines, properties
+
+    @staticmethod
+    def _parse_cluster_block(lines, lazy=False, use_sequence_summary=False, parse_consensus_counts=False):
+        """
+        Creates the cluster object based on a raw cluster block as returned
+        by _read_cluster_blocks.
+
+        :param lines: The block's lines as bytes (including the "=Cluster=" line)
+        :param lazy: If set, a LazyCluster is created
+        :param use_sequence_summary: If set, the sequence counts are taken from the "sequence=" line
+        :param parse_consensus_counts: If set, the consensus peaks' counts are parsed
+        :return: The (Lazy)Cluster object or None if the block does not contain a cluster id
+        """
+        if lazy:
+            return ClusteringParser._parse_lazy_cluster(lines[1:], use_sequence_summary, parse_consensus_counts)
+
+        return ClusteringParser._parse_cluster(lines[1:], use_sequence_summary, parse_consensus_counts)
+
+    @staticmethod
+    def _parse_cluster_properties(properties, use_sequence_summary=False, parse_consensus_counts=False):
+        """
+        Parses the cluster-level properties as returned by _split_cluster_lines.
+
+        :param properties: Dict with the property's name as key and its raw value as value
+        :param use_sequence_summary: If set, the sequence counts are taken from the "sequence=" line
+        :param parse_consensus_counts: If set, the consensus peaks' counts are parsed. Otherwise,
+                                       the returned counts are None.
+        :return: Tuple of (id, precursor m/z, precursor intensity, consensus m/z, consensus intensities,
+                 consensus counts, sequence counts). The id is None if the block does not contain
+                 a cluster id.
+        """
+        cluster_id = properties.get(b"id", None)
+        precursor_mz = properties.get(b"av_precursor_mz", None)
+        precursor_intens = properties.get(b"av_precursor_intens", None)
+        consensus_mz = properties.get(b"consensus_mz", None)
+        consensus_intens = properties.get(b"consensus_intens", None)
+        consensus_counts = properties.get(b"consensus_count", None) if parse_consensus_counts else None
+        sequence_summary = properties.get(b"sequence", None) if use_sequence_summary else None
+
+        if parse_consensus_counts:
+            consensus_counts = ClusteringParser._parse_peaks(consensus_counts.strip()) \
+                if consensus_counts is not None else numpy.zeros(0)
+
+        return (cluster_id.strip().decode() if cluster_id is not None else None,
+                float(precursor_mz) if precursor_mz is not None else None,
+                float(precursor_intens) if precursor_intens is not None else None,
+                ClusteringParser._parse_peaks(consensus_mz.strip()) if consensus_mz is not None else numpy.zeros(0),
+                ClusteringParser._parse_peaks(consensus_intens.strip()) if consensus_intens is not None
+                else numpy.zeros(0),
+                consensus_counts,
+                ClusteringParser._parse_sequence_summary(sequence_summary.decode()) if sequence_summary is not None
+                else None)
+
+    @staticmethod
+    def _parse_cluster(lines, use_sequence_summary=False, parse_consensus_counts=False):
+        """
+        Creates a Cluster object based on the raw lines of a single cluster
+        block (without the "=Cluster=" line).
+
+        :param lines: The cluster's lines as bytes
+        :param use_sequence_summary: If set, the sequence counts are taken from the "sequence=" line
+        :param parse_consensus_counts: If set, the consensus peaks' counts are parsed
+        :return: The Cluster object or None if the block does not contain a cluster id
+        """
+        spec_lines, properties = ClusteringParser._split_cluster_lines(lines)
+        cur_id, precursor_mz, precursor_intens, consensus_mz, consensus_intens, consensus_counts, sequence_counts = \
+            ClusteringParser._parse_cluster_properties(properties, use_sequence_summary, parse_consensus_counts)
+
+        if cur_id is None:
+            return None
+
+        # all SPEC lines are decoded at once
+        spectra = [ClusteringParser._parse_spec_line(line.rstrip())
+                   for line in b"\n".join(spec_lines).decode().split("\n")] if len(spec_lines) > 0 else list()
+
+        return objects.Cluster(cur_id, precursor_mz, consensus_mz, consensus_intens, spectra,
+                               sequence_counts=sequence_counts, consensus_counts=consensus_counts,
+                               precursor_intens=precursor_intens)
+
+    @staticmethod
+    def _parse_lazy_cluster(lines, use_sequence_summary=False, parse_consensus_counts=False):
+        """
+        Creates a LazyCluster object based on the raw lines of a single cluster
+        block (without the "=Cluster=" line). Only the cluster-level fields are
+        parsed, the SPEC lines are stored as they are.
+
+        :param lines: The cluster's lines as bytes
+        :param use_sequence_summary: If set, the sequence counts are taken from the "sequence=" line
+        :param parse_consensus_counts: If set, the consensus peaks' counts are parsed
+        :return: The LazyCluster object or None if the block does not contain a cluster id
+        """
+        spec_lines, properties = ClusteringParser._split_cluster_lines(lines)
+        cur_id, precursor_mz, precursor_intens, consensus_mz, consensus_intens, consensus_counts, sequence_counts = \
+            ClusteringParser._parse_cluster_properties(properties, use_sequence_summary, parse_consensus_counts)
+
+        if cur_id is None:
+            return None
+
+        spec_lines = ClusteringParser._get_unique_spec_lines(spec_lines)
+        spectrum_summaries = [ClusteringParser._parse_spec_summary(line) for line in spec_lines]
+
+        return objects.LazyCluster(cur_id, precursor_mz, consensus_mz, consensus_intens, b"\n".join(spec_lines),
+                                   spectrum_summaries, ClusteringParser._parse_spec_line,
+                                   sequence_counts=sequence_counts, consensus_counts=consensus_counts,
+                                   precursor_intens=precursor_intens)
+
+    @staticmethod
+    def _get_unique_spec_lines(spec_lines):
+        """
+        Removes all SPEC lines that represent an already listed spectrum. As
+        in the Cluster class, spectra are identical if their keys (see
+        Spectrum.get_key) are equal. Only the first of these lines is kept.
+
+        :param spec_lines: The SPEC lines as bytes
+        :return: A list of the unique SPEC lines
+        """
+        # spectra can only be identical if their titles are identical
+        titles = set()
+
+        for line in spec_lines:
+            fields = line.split(b"\t", 2)
+            titles.add(fields[1] if len(fields) > 1 else line)
+
+        if len(titles) == len(spec_lines):
+            return spec_lines
+
+        unique_lines = dict()
+
+        for line in spec_lines:
+            unique_lines.setdefault(ClusteringParser._get_spec_key(line.strip().decode()), line)
+
+        return list(unique_lines.values())
+
+    @staticmethod
+    def _get_spec_key(line):
+        """
+        Creates the key of the Spectrum object a SPEC line represents
+        without creating the object.
+
+        :param line: A String representing the SPEC line.
+        :return: The key as returned by Spectrum.get_key
+        """
+        fields = line.split("\t")
+
+        if len(fields) < 9:
+            raise Exception("Invalid SPEC line encountered: " + line)
+
+        psms = ClusteringParser._parse_identification(fields[3], fields[7])[0]
+        title_prefix, title_suffix = objects.Spectrum._split_title(fields[1])
+
+        return title_prefix, title_suffix, float(fields[4]), float(fields[5]), \
+            objects._get_taxid_set(fields[6].split(",")), frozenset(psms)
+
+    @staticmethod
+    def _parse_peaks(peak_string):
+        """
+        Parses a comma separated list of consensus peak values.
+
+        :param peak_string: The values as string or bytes (without the field's name)
+        :return: A numpy float64 array
+        """
+        # this is only a work around for empty consensus spectrum entries
+        if len(peak_string) < 1:
+            return numpy.zeros(0)
+
+        return numpy.fromstring(peak_string, dtype=numpy.float64, sep=",")
+
+    @staticmethod
+    def _parse_sequence_summary(summary_string):
+        """
+        Parses the precomputed sequence counts of a cluster's "sequence=" line
+        in the format "[PEPTIDE:count,PEPTIDE2:count]".
+
+        :param summary_string: The line's value (without the "sequence=")
+        :return: A dict with the sequence as key and the count as value
+        """
+        summary_string = summary_string.strip()
+
+        if summary_string[0:1] == "[":
+            summary_string = summary_string[1:]
+        if summary_string[-1:] == "]":
+            summary_string = summary_string[:-1]
+
+        sequence_counts = dict()
+
+        for entry in summary_string.split(","):
+            separator_index = entry.rfind(":")
+
+            if separator_index < 0:
+                continue
+
+            try:
+                count = int(entry[separator_index + 1:])
+            except ValueError:
+                parse_warnings.add("Ignoring invalid sequence count", entry)
+                continue
+
+            sequence = entry[:separator_index].strip()
+            sequence_counts[sequence] = sequence_counts.get(sequence, 0) + count
+
+        return sequence_counts
+
+    @staticmethod
+    def _parse_spec_summary(line):
+        """
+        Extracts the charge and the identified sequences from a SPEC line
+        without creating the Spectrum object.
+
+        :param line: The SPEC line as bytes
+        :return: A SpectrumSummary object
+        """
+        fields = line.split(b"\t", 6)
+
+        if len(fields) < 7:
+            raise Exception("Invalid SPEC line encountered: " + line.decode())
+
+        sequences = fields[3].decode().split(",")
+
+        # test if it's an empty line
+        if len(sequences) == 1 and len(sequences[0].strip()) == 0:
+            sequences = tuple()
+
+        return objects.SpectrumSummary(float(fields[5]), sequences)
 
     @staticmethod
     def _parse_spec_line(line):
@@ -96,28 +726,52 @@ class ClusteringParser:
         if len(fields) < 9:
             raise Exception("Invalid SPEC line encountered: " + line)
 
-        title = fields[1]
-        sequences = fields[3].split(",")
-        prec_mz = float(fields[4])
+        # make sure sequences and ptms have the same length
+        if fields[3].count(",") != fields[7].count(";"):
+            raise Exception("Invalid SPEC line encountered: different number of sequences and PTMs defined: " +
+                            line)
+
+        # the same identifications are observed in many spectra
+        psms, warnings = ClusteringParser._parse_identification(fields[3], fields[7])
+
+        for message, example in warnings:
+            parse_warnings.add(message, example)
+
         # charge is stored as float just in case
-        charge = float(fields[5])
-        taxids = fields[6].split(",")
-        ptm_strings = fields[7].split(";")
-        similarity_score = float(fields[8])
+        return objects.Spectrum(fields[1], float(fields[4]), float(fields[5]), fields[6].split(","), psms,
+                                float(fields[8]), fields[9] if len(fields) >= 10 else "{}")
 
-        json_properties = fields[9] if len(fields) >= 10 else "{}"
+    @staticmethod
+    @functools.lru_cache(maxsize=PTM_CACHE_SIZE)
+    def _parse_identification(sequence_field, ptm_field):
+        """
+        Creates the PSM objects of a SPEC line's sequence and PTM fields. Since PSMs
+        cannot be changed, the created objects are cached and shared between all
+        spectra with the same identification.
 
-        if title == "PXD000443;PRIDE_Exp_Complete_Ac_31019.xml;spectrum=377050":
-            pass
+        :param sequence_field: The SPEC line's comma separated sequences
+        :param ptm_field: The SPEC line's semicolon separated PTM strings (one per sequence)
+        :return: Tuple of (PSMs, warnings) with warnings being (message, example) tuples
+        """
+        # fast path for unidentified spectra
+        if len(sequence_field) == 0:
+            return tuple(), tuple()
 
-        # make sure sequences and ptms have the same length
-        if len(sequences) != len(ptm_strings):
-            raise Exception("Invalid SPEC line encountered: different number of sequences and PTMs defined: " +
-                            line)
+        sequences = sequence_field.split(",")
+
+        # test if it's an empty line
+        if len(sequences) == 1 and len(sequences[0].strip()) == 0:
+            return tuple(), tuple()
+
+        psms = list()
+        warnings = tuple()
 
-        psms = ClusteringParser._create_psms(sequences, ptm_strings)
+        for sequence, ptm_string in zip(sequences, ptm_field.split(";")):
+            ptms, ptm_warnings = ClusteringParser._parse_ptm_string(ptm_string)
+            psms.append(objects.PSM(sequence, ptms))
+            warnings += ptm_warnings
 
-        return objects.Spectrum(title, prec_mz, charge, taxids, psms, similarity_score, json_properties)
+        return tuple(psms), warnings
 
     @staticmethod
     def _create_psms(sequences, ptm_strings):
@@ -155,12 +809,77 @@ class ClusteringParser:
         :param ptm_string: String defining the PTMs in a .clustering SPEC line.
         :return: List of PTMs
         """
+        ptms, warnings = ClusteringParser._parse_ptm_string(ptm_string)
+
+        for message, example in warnings:
+            parse_warnings.add(message, example)
+
+        return list(ptms)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=PTM_CACHE_SIZE)
+    def _parse_ptm_string(ptm_string):
+        """
+        Creates the PTMs defined by a PTM specification string. The result is
+        cached since the same PTM strings are found in many SPEC lines.
+
+        :param ptm_string: String defining the PTMs in a .clustering SPEC line.
+        :return: Tuple of (PTMs, warnings) with warnings being (message, example) tuples
+        """
         if len(ptm_string) < 1:
-            return list()
+            return tuple(), tuple()
 
         ptm_strings = ptm_string.split(",")
 
         # merge possible PTM tags within "[" and "]"
+        if "[" in ptm_string:
+            ptm_strings = ClusteringParser._merge_ptm_tags(ptm_strings)
+
+        ptms = list()
+        warnings = list()
+
+        for cur_ptm_string in ptm_strings:
+            first_index = cur_ptm_string.find("-")
+
+            if first_index < 0:
+                warnings.append(("Ignoring invalid PTM definition", cur_ptm_string))
+                continue
+
+            position = cur_ptm_string[0:first_index]
+            accession = cur_ptm_string[first_index + 1:]
+
+            # fast path for standard "position-MOD:accession" definitions
+            if position.isdecimal():
+                ptms.append(objects.PTM(int(position), accession))
+                continue
+
+            # ignore chemmod
+            if "CHEMMOD" in position:
+                warnings.append(("Ignoring CHEMMOD PTM", cur_ptm_string))
+                continue
+
+            # fix some odd parsing errors
+            if "=" in position:
+                sign_index = position.find("=")
+                position = position[sign_index+1:]
+
+            try:
+                ptms.append(objects.PTM(int(position), accession))
+            except ValueError:
+                warnings.append(("Ignoring invalid PTM definition", cur_ptm_string))
+                continue
+
+        return tuple(ptms), tuple(warnings)
+
+    @staticmethod
+    def _merge_ptm_tags(ptm_strings):
+        """
+        Merges the comma separated parts of PTM definitions whose
+        accession is a tag within "[" and "]" (ie. PSI-MS entries).
+
+        :param ptm_strings: The PTM string split at every ","
+        :return: A list of PTM definitions
+        """
         merged_ptm_strings = list()
         current_ptm_string = ""
         in_tags = False
@@ -183,37 +902,457 @@ class ClusteringParser:
                 merged_ptm_strings.append(current_ptm_string[:-1])
                 current_ptm_string = ""
 
-        # remove unused variable
-        del ptm_string, current_ptm_string, in_tags
+        return merged_ptm_strings
 
-        ptms = list()
 
-        for cur_ptm_string in merged_ptm_strings:
-            first_index = cur_ptm_string.find("-")
+class ClusterFilter:
+    """
+    Filters clusters based on their raw cluster block before the
+    Cluster object is created. Thereby, filtered clusters are
+    skipped at almost the speed of reading the file.
 
-            if first_index < 0:
-                print("Warning: Ignoring invalid PTM definition: " + cur_ptm_string)
-                continue
+    The filter only uses information that is available without
+    parsing the SPEC lines: the number of SPEC lines, the cluster's
+    id, and its average precursor m/z. Since duplicated spectra are
+    only detected once the Cluster object is created, a block may
+    pass the filter although the resulting Cluster does not. The
+    filter therefore only is a pre-filter and the analysers still
+    need to test the created Cluster objects.
 
-            position = cur_ptm_string[0:first_index]
-            accession = cur_ptm_string[first_index + 1:]
+    :ivar min_size: Minimum number of spectra
+    :ivar max_size: Maximum number of spectra (None to ignore)
+    :ivar min_precursor_mz: Minimum average precursor m/z (None to ignore)
+    :ivar max_precursor_mz: Maximum average precursor m/z (None to ignore)
+    :ivar cluster_ids: Set of the cluster ids to keep (None to keep all)
+    """
+    def __init__(self, min_size=0, max_size=None, min_precursor_mz=None, max_precursor_mz=None, cluster_ids=None):
+        """
+        Creates a new ClusterFilter object.
 
-            # ignore chemmod
-            if "CHEMMOD" in position:
-                print("Warning: Ignoring PTM (" + cur_ptm_string + ")")
-                continue
+        :param min_size: Minimum number of spectra
+        :param max_size: Maximum number of spectra (None to ignore)
+        :param min_precursor_mz: Minimum average precursor m/z (None to ignore)
+        :param max_precursor_mz: Maximum average precursor m/z (None to ignore)
+        :param cluster_ids: An iterable of the cluster ids to keep (None to keep all)
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_precursor_mz = min_precursor_mz
+        self.max_precursor_mz = max_precursor_mz
+        self.cluster_ids = set(cluster_ids) if cluster_ids is not None else None
 
-            # fix some odd parsing errors
-            if "=" in position:
-                sign_index = position.find("=")
-                position = position[sign_index+1:]
+    def is_active(self):
+        """
+        Tests whether the filter may reject any cluster.
 
-            try:
-                ptms.append(objects.PTM(int(position), accession))
-            except ValueError:
-                print("Warning: Ignoring invalid PTM definition: " + cur_ptm_string)
-                continue
+        :return: Boolean
+        """
+        return self.min_size > 0 or self.max_size is not None or self.min_precursor_mz is not None or \
+            self.max_precursor_mz is not None or self.cluster_ids is not None
+
+    def accepts_precursor_mz(self, precursor_mz):
+        """
+        Tests whether the precursor m/z is within the filter's range.
+        Clusters without a precursor m/z are rejected if a range is set.
+
+        :param precursor_mz: The cluster's average precursor m/z (may be None)
+        :return: Boolean
+        """
+        if self.min_precursor_mz is None and self.max_precursor_mz is None:
+            return True
+        # NaN values are never accepted
+        if precursor_mz is None or not precursor_mz == precursor_mz:
+            return False
+        if self.min_precursor_mz is not None and precursor_mz < self.min_precursor_mz:
+            return False
+        if self.max_precursor_mz is not None and precursor_mz > self.max_precursor_mz:
+            return False
+
+        return True
+
+    def accepts_block(self, lines):
+        """
+        Tests whether the cluster block may pass the filter.
+
+        :param lines: The block's raw lines as returned by ClusteringParser._read_cluster_blocks
+        :return: False if the cluster does certainly not pass the filter
+        """
+        test_precursor = self.min_precursor_mz is not None or self.max_precursor_mz is not None
+
+        if self.cluster_ids is not None or test_precursor:
+            cluster_id = None
+            precursor_mz = None
+
+            # the cluster's properties are stored before its SPEC lines
+            for line in lines:
+                if line.startswith(b"SPEC"):
+                    break
+                if line.startswith(b"id="):
+                    cluster_id = line[3:].strip().decode()
+                elif line.startswith(b"av_precursor_mz="):
+                    precursor_mz = float(line[16:])
+
+            if self.cluster_ids is not None and cluster_id not in self.cluster_ids:
+                return False
+            if test_precursor and not self.accepts_precursor_mz(precursor_mz):
+                return False
+
+        if self.min_size > 0 or self.max_size is not None:
+            # identical SPEC lines represent the same spectrum
+            spec_lines = set([line.rstrip() for line in lines if line.startswith(b"SPEC")])
+
+            if len(spec_lines) < self.min_size:
+                return False
+
+            # spectra with different titles are always different spectra
+            if self.max_size is not None and len(spec_lines) > self.max_size and \
+                    len(set([line.split(b"\t", 2)[1] for line in spec_lines])) > self.max_size:
+                return False
+
+        return True
+
+    @staticmethod
+    def combine(cluster_filters):
+        """
+        Creates a filter that accepts every cluster that is accepted by
+        at least one of the passed filters.
+
+        :param cluster_filters: A list of ClusterFilters. None represents a filter that accepts all clusters.
+        :return: The combined ClusterFilter or None if all clusters are accepted.
+        """
+        if len(cluster_filters) < 1 or None in cluster_filters:
+            return None
+
+        def combine_bounds(values, function):
+            return None if None in values else function(values)
+
+        combined_filter = ClusterFilter(
+            min_size=min([f.min_size for f in cluster_filters]),
+            max_size=combine_bounds([f.max_size for f in cluster_filters], max),
+            min_precursor_mz=combine_bounds([f.min_precursor_mz for f in cluster_filters], min),
+            max_precursor_mz=combine_bounds([f.max_precursor_mz for f in cluster_filters], max),
+            cluster_ids=combine_bounds([f.cluster_ids for f in cluster_filters], lambda ids: set().union(*ids)))
+
+        if not combined_filter.is_active():
+            return None
+
+        return combined_filter
+
+
+class ParallelClusteringParser:
+    """
+    Parses .clustering files using multiple processes.
+
+    The file is split into shards (byte ranges) that always start
+    at a "=Cluster=" line. Every shard is then parsed by a separate
+    worker process.
+
+    Compressed files cannot be split into byte ranges. For these, the
+    main process decompresses the file and passes batches of cluster
+    blocks to the worker processes instead.
+
+    The parser can either be used as an iterator, similar to the
+    ClusteringParser, or to run an analyser on every shard through
+    the **analyse** function. All clusters and analysers are transferred
+    between the processes using pickle.
+    """
+    def __init__(self, clustering_file, processes=None, ordered=True, lazy=False, use_sequence_summary=False,
+                 shard_size=16 * 1024 * 1024, cluster_filter=None, parse_consensus_counts=False):
+        """
+        Creates a new ParallelClusteringParser object
+
+        :param clustering_file: Path to the file to process
+        :param processes: Number of worker processes to use. If not set, the number of CPUs is used.
+        :param ordered: If set, clusters are returned in the same order as they occur in the file.
+                        Otherwise, clusters are returned as soon as their shard was processed.
+        :param lazy: If set, LazyCluster objects are returned.
+        :param use_sequence_summary: If set, the sequence counts are taken from the "sequence=" line
+        :param shard_size: The (approximate) size of every shard in bytes.
+        :param cluster_filter: If set, clusters that do not pass this ClusterFilter are skipped
+                               without creating the Cluster objects.
+        :param parse_consensus_counts: If set, the consensus peaks' counts are parsed.
+        """
+        self.clustering_file = clustering_file
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.ordered = ordered
+        self.lazy = lazy
+        self.use_sequence_summary = use_sequence_summary
+        self.shard_size = shard_size
+        self.cluster_filter = cluster_filter
+        self.parse_consensus_counts = parse_consensus_counts
+
+    def __iter__(self):
+        return self._get_iterator()
+
+    def _get_iterator(self):
+        """
+        Iterates over all clusters in the file
+
+        :return: The next Cluster
+        """
+        shard_arguments = ((self.clustering_file, shard, self.lazy, self.use_sequence_summary,
+                            self.parse_consensus_counts, self.cluster_filter) for shard in self._iter_shards())
+
+        with multiprocessing.Pool(processes=self.processes) as pool:
+            for clusters, shard_warnings in self._map_shards(pool, _parse_shard, shard_arguments, self.ordered):
+                parse_warnings.merge(shard_warnings)
+
+                for cluster in clusters:
+                    yield cluster
+
+        parse_warnings.report()
+
+    def analyse(self, analyser, reduce_function=None):
+        """
+        Processes all clusters of the file with the passed analyser. Every
+        shard is processed by a separate copy of the analyser within a worker
+        process.
+
+        :param analyser: The analyser to use. Since it is copied to the worker
+                         processes, it must support pickle.
+        :param reduce_function: If set, the shards' analysers are combined using this
+                                function (see functools.reduce). It must accept two
+                                analysers and return the combined one.
+        :return: A list of the shards' analysers in the order of the file or, if
+                 reduce_function is set, the combined analyser.
+        """
+        shard_arguments = ((self.clustering_file, shard, self.lazy, self.use_sequence_summary,
+                            self.parse_consensus_counts, self.cluster_filter, analyser)
+                           for shard in self._iter_shards())
+
+        with multiprocessing.Pool(processes=self.processes) as pool:
+            shard_analysers = list()
+
+            for shard_analyser, shard_warnings in self._map_shards(pool, _analyse_shard, shard_arguments, True):
+                shard_analysers.append(shard_analyser)
+                parse_warnings.merge(shard_warnings)
+
+        parse_warnings.report()
+
+        if reduce_function is None:
+            return shard_analysers
+
+        return functools.reduce(reduce_function, shard_analysers)
+
+    def _iter_shards(self):
+        """
+        Returns the shards of the file. For uncompressed files, these are
+        (start, end) tuples. For compressed files, every shard is a list
+        of cluster blocks (see ClusteringParser._read_cluster_blocks).
+
+        :return: An iterator over the shards
+        """
+        if compression.is_compressed(self.clustering_file):
+            return self._read_block_shards()
+
+        return iter(self.get_shards())
+
+    def _read_block_shards(self):
+        """
+        Reads the (compressed) file and combines its cluster blocks into
+        shards of approximately shard_size bytes.
+
+        :return: A generator yielding lists of cluster blocks
+        """
+        shard = list()
+        shard_size = 0
+
+        with compression.open_file(self.clustering_file, "rb") as reader:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+                shard.append(lines)
+                shard_size += length
+
+                if shard_size >= self.shard_size:
+                    yield shard
+                    shard = list()
+                    shard_size = 0
+
+        if len(shard) > 0:
+            yield shard
+
+    def _map_shards(self, pool, function, shard_arguments, ordered):
+        """
+        Processes all shards using the pool's worker processes.
+
+        The shards of compressed files are created by the main process.
+        Therefore, only a limited number of them is submitted at the
+        same time to keep the memory usage in check. If the results do
+        not have to be ordered, every result is returned as soon as its
+        shard was processed.
+
+        :param pool: The multiprocessing.Pool to use
+        :param function: The function to apply to every shard's arguments
+        :param shard_arguments: Iterator over the shards' arguments
+        :param ordered: If set, the results are returned in the order of the shards
+        :return: A generator yielding the function's results
+        """
+        if not compression.is_compressed(self.clustering_file):
+            if ordered:
+                yield from pool.imap(function, shard_arguments)
+            else:
+                yield from pool.imap_unordered(function, shard_arguments)
+
+            return
+
+        if ordered:
+            pending_results = collections.deque()
+
+            for arguments in shard_arguments:
+                pending_results.append(pool.apply_async(function, (arguments, )))
+
+                if len(pending_results) >= self.processes * 2:
+                    yield pending_results.popleft().get()
+
+            while len(pending_results) > 0:
+                yield pending_results.popleft().get()
+
+            return
+
+        # receives (True, result) or (False, exception) tuples in the order the shards are finished
+        finished_results = queue.Queue()
+        n_pending = 0
+
+        for arguments in shard_arguments:
+            pool.apply_async(function, (arguments, ), callback=lambda result: finished_results.put((True, result)),
+                             error_callback=lambda error: finished_results.put((False, error)))
+            n_pending += 1
+
+            if n_pending >= self.processes * 2:
+                yield ParallelClusteringParser._get_finished_result(finished_results)
+                n_pending -= 1
+
+        while n_pending > 0:
+            yield ParallelClusteringParser._get_finished_result(finished_results)
+            n_pending -= 1
+
+    @staticmethod
+    def _get_finished_result(finished_results):
+        """
+        Waits for the next processed shard.
+
+        :param finished_results: The queue receiving the (success, result) tuples
+        :return: The shard's result
+        """
+        success, result = finished_results.get()
+
+        if not success:
+            raise result
+
+        return result
+
+    def get_shards(self):
+        """
+        Splits the file into shards that start at a "=Cluster=" line. This
+        is only supported for uncompressed files.
+
+        :return: A list of (start, end) tuples
+        """
+        file_size = os.path.getsize(self.clustering_file)
+        boundaries = [0]
+
+        with open(self.clustering_file, "rb") as reader:
+            for raw_boundary in range(self.shard_size, file_size, self.shard_size):
+                # the next cluster may have been found after the current boundary
+                if raw_boundary <= boundaries[-1]:
+                    continue
+
+                boundary = ParallelClusteringParser._find_cluster_start(reader, raw_boundary)
+
+                if boundary is None:
+                    break
+
+                boundaries.append(boundary)
+
+        boundaries.append(file_size)
+
+        return [(boundaries[i], boundaries[i + 1]) for i in range(0, len(boundaries) - 1)
+                if boundaries[i] < boundaries[i + 1]]
+
+    @staticmethod
+    def _find_cluster_start(reader, offset):
+        """
+        Finds the first "=Cluster=" line starting at or after the defined offset.
+
+        :param reader: The file opened in binary mode
+        :param offset: The offset to start searching from
+        :return: The offset of the "=Cluster=" line or None if there is none
+        """
+        # move to the beginning of the next line
+        reader.seek(offset - 1)
+        reader.readline()
+        line_offset = reader.tell()
+
+        for line in iter(reader.readline, b""):
+            if line.startswith(b"=Cluster="):
+                return line_offset
+
+            line_offset += len(line)
+
+        return None
+
+
+def _read_shard(clustering_file, shard):
+    """
+    Returns the cluster blocks of a shard.
+
+    :param clustering_file: Path to the .clustering file
+    :param shard: Either a (start, end) tuple or a list of cluster blocks
+    :return: A generator yielding every cluster block's lines
+    """
+    if not isinstance(shard, tuple):
+        yield from shard
+        return
+
+    start, end = shard
+
+    with open(clustering_file, "rb") as reader:
+        for offset, length, lines in ClusteringParser._read_cluster_blocks(reader, start, end):
+            yield lines
+
+
+def _parse_shard(arguments):
+    """
+    Parses all clusters of a shard. This function is used by the
+    worker processes of the ParallelClusteringParser.
+
+    :param arguments: Tuple of (clustering file, shard, lazy, use_sequence_summary, parse_consensus_counts,
+                      cluster filter)
+    :return: Tuple of (the list of clusters, the shard's ParseWarnings)
+    """
+    clustering_file, shard, lazy, use_sequence_summary, parse_consensus_counts, cluster_filter = arguments
+    clusters = list()
+
+    for lines in _read_shard(clustering_file, shard):
+        if cluster_filter is not None and not cluster_filter.accepts_block(lines):
+            continue
+
+        cluster = ClusteringParser._parse_cluster_block(lines, lazy, use_sequence_summary, parse_consensus_counts)
+
+        if cluster is not None:
+            clusters.append(cluster)
+
+    return clusters, parse_warnings.pop()
+
+
+def _analyse_shard(arguments):
+    """
+    Processes all clusters of a shard using the passed analyser. This
+    function is used by the worker processes of the ParallelClusteringParser.
+
+    :param arguments: Tuple of (clustering file, shard, lazy, use_sequence_summary, parse_consensus_counts,
+                      cluster filter, analyser)
+    :return: Tuple of (the analyser, the shard's ParseWarnings)
+    """
+    clustering_file, shard, lazy, use_sequence_summary, parse_consensus_counts, cluster_filter, analyser = \
+        arguments
+
+    for lines in _read_shard(clustering_file, shard):
+        if cluster_filter is not None and not cluster_filter.accepts_block(lines):
+            continue
 
-        return ptms
+        cluster = ClusteringParser._parse_cluster_block(lines, lazy, use_sequence_summary, parse_consensus_counts)
 
+        if cluster is not None:
+            analyser.process_cluster(cluster)
 
+    return analyser, parse_warnings.pop()
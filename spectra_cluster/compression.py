@@ -0,0 +1,499 @@
+"""
+Functions to transparently read compressed input files.
+
+All parsers open their input files through **open_file**. The
+compression (gzip, block-gzip (BGZF), bzip2, or Zstandard) is detected
+based on the file's first bytes and the content is decompressed while it
+is read. Where possible, the decompression is done by multiple threads.
+"""
+
+import io
+import os
+import bz2
+import gzip
+import zlib
+import shutil
+import struct
+import subprocess
+import collections
+import concurrent.futures
+
+try:
+    import isal.igzip_threaded as igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# number of threads used to decompress a file
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+
+# extensions of compressed files that are tested by find_file
+COMPRESSED_EXTENSIONS = (".gz", ".bgz", ".bz2", ".zst")
+
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# size of the buffer used to read the output of external decompression tools
+PROCESS_BUFFER_SIZE = 1024 * 1024
+
+
+def detect_compression(filename):
+    """
+    Detects the compression of a file based on its first bytes.
+
+    :param filename: Path to the file
+    :return: "bgzf", "gzip", "bz2", "zstd", or None if the file is not compressed
+    """
+    with open(filename, "rb") as reader:
+        magic = reader.read(16)
+
+    if magic[0:2] == GZIP_MAGIC:
+        # BGZF blocks are gzip members with a "BC" extra field
+        if len(magic) >= 14 and magic[3] & 4 and magic[12:14] == b"BC":
+            return "bgzf"
+
+        return "gzip"
+    if magic[0:3] == BZ2_MAGIC:
+        return "bz2"
+    if magic[0:4] == ZSTD_MAGIC:
+        return "zstd"
+
+    return None
+
+
+def is_compressed(filename):
+    """
+    Tests whether the file is compressed.
+
+    :param filename: Path to the file
+    :return: Boolean
+    """
+    return detect_compression(filename) is not None
+
+
+def find_file(filename):
+    """
+    Returns the path of the file or of its compressed version
+    (see COMPRESSED_EXTENSIONS) if only that exists.
+
+    :param filename: Path to the (uncompressed) file
+    :return: The path to the existing file or None if neither exists
+    """
+    for extension in ("", ) + COMPRESSED_EXTENSIONS:
+        if os.path.isfile(filename + extension):
+            return filename + extension
+
+    return None
+
+
+def open_file(filename, mode="rb", threads=None, seekable=False):
+    """
+    Opens a (possibly compressed) file for reading.
+
+    Gzip files are decompressed using python-isal or pigz if available, BGZF
+    files using a thread pool. Zstandard files require the zstandard package
+    or the zstd command line tool.
+
+    :param filename: Path to the file
+    :param mode: "rb" to read bytes, "r" or "rt" to read text
+    :param threads: Number of threads to use for decompression (default DEFAULT_THREADS)
+    :param seekable: If set, the returned file supports seek and tell. BGZF files use
+                     virtual offsets (see BgzfReader), all other compressed files use
+                     offsets within the uncompressed data. Seeking may then require
+                     decompressing the file up to the offset.
+    :return: The file object
+    """
+    if mode not in ("rb", "r", "rt"):
+        raise Exception("Unsupported file mode '" + mode + "'. Files can only be opened for reading.")
+
+    if threads is None:
+        threads = DEFAULT_THREADS
+
+    compression = detect_compression(filename)
+
+    if compression is None:
+        return open(filename, mode)
+
+    if compression == "bgzf":
+        reader = BgzfReader(filename, threads=threads)
+    elif compression == "gzip":
+        reader = _open_gzip(filename, threads, seekable)
+    elif compression == "bz2":
+        reader = _open_bz2(filename, threads, seekable)
+    else:
+        reader = _open_zstd(filename, threads, seekable)
+
+    if mode == "rb":
+        return reader
+
+    return io.TextIOWrapper(reader)
+
+
+def _open_gzip(filename, threads, seekable):
+    """
+    Opens a gzip compressed file.
+
+    :param filename: Path to the file
+    :param threads: Number of threads to use
+    :param seekable: If set, the returned file must support seek
+    :return: The file object (binary)
+    """
+    if not seekable and threads > 1:
+        if igzip_threaded is not None:
+            return igzip_threaded.open(filename, "rb", threads=threads)
+        if shutil.which("pigz") is not None:
+            return _open_process(["pigz", "-d", "-c", "-p", str(threads), filename])
+
+    return gzip.open(filename, "rb")
+
+
+def _open_bz2(filename, threads, seekable):
+    """
+    Opens a bzip2 compressed file.
+
+    :param filename: Path to the file
+    :param threads: Number of threads to use
+    :param seekable: If set, the returned file must support seek
+    :return: The file object (binary)
+    """
+    if not seekable and threads > 1 and shutil.which("lbzip2") is not None:
+        return _open_process(["lbzip2", "-d", "-c", "-n", str(threads), filename])
+
+    return bz2.open(filename, "rb")
+
+
+def _open_zstd(filename, threads, seekable):
+    """
+    Opens a Zstandard compressed file.
+
+    :param filename: Path to the file
+    :param threads: Number of threads to use
+    :param seekable: If set, the returned file must support seek
+    :return: The file object (binary)
+    """
+    if zstandard is not None:
+        compressed_file = open(filename, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(compressed_file, closefd=True)
+
+        return io.BufferedReader(reader, buffer_size=PROCESS_BUFFER_SIZE)
+
+    if not seekable and shutil.which("zstd") is not None:
+        return _open_process(["zstd", "-d", "-c", "-q", filename])
+
+    raise Exception("Reading Zstandard compressed files requires the zstandard package or the zstd tool")
+
+
+def _open_process(command):
+    """
+    Reads the standard output of an external decompression tool.
+
+    :param command: The command to run as list
+    :return: The file object (binary)
+    """
+    return io.BufferedReader(ProcessReader(command), buffer_size=PROCESS_BUFFER_SIZE)
+
+
+class ProcessReader(io.RawIOBase):
+    """
+    Reads the standard output of an external process. If the file is
+    closed before all data was read, the process is terminated.
+    """
+    def __init__(self, command):
+        """
+        Starts the process.
+
+        :param command: The command to run as list
+        """
+        super().__init__()
+
+        self.command = command
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n_bytes = self._process.stdout.readinto(buffer)
+
+        if n_bytes == 0 and self._process.wait() != 0:
+            raise Exception("Failed to run '" + " ".join(self.command) + "': " +
+                            self._process.stderr.read().decode().strip())
+
+        return n_bytes
+
+    def close(self):
+        if not self.closed:
+            if self._process.poll() is None:
+                self._process.terminate()
+
+            self._process.wait()
+            self._process.stdout.close()
+            self._process.stderr.close()
+
+        super().close()
+
+
+class BgzfReader(io.BufferedIOBase):
+    """
+    Reads block-gzip (BGZF) compressed files as created by bgzip.
+
+    BGZF files consist of independently compressed blocks of at most
+    64 kb. Therefore, the blocks can be decompressed by multiple threads
+    and every position within the file can be accessed directly.
+
+    Positions are represented as virtual offsets: The offset of the
+    block within the compressed file shifted 16 bits to the left plus
+    the position within the decompressed block. The offsets returned by
+    **tell** can be passed to **seek**.
+
+    :ivar filename: Path to the BGZF file
+    :ivar threads: Number of threads used to decompress the blocks
+    """
+    def __init__(self, filename, threads=None):
+        """
+        Opens the BGZF file.
+
+        :param filename: Path to the BGZF file
+        :param threads: Number of threads to use (default DEFAULT_THREADS)
+        """
+        super().__init__()
+
+        self.filename = filename
+        self.threads = threads if threads is not None else DEFAULT_THREADS
+
+        self._file = open(filename, "rb")
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+        # blocks that are decompressed in the background as (offset, size, future)
+        self._pending_blocks = collections.deque()
+        # offset of the next block that is read from the compressed file
+        self._next_block_offset = 0
+        self._block_offset = 0
+        self._block_size = 0
+        self._block_data = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        if not self.closed:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+            self._file.close()
+
+        super().close()
+
+    @staticmethod
+    def _decompress_block(block):
+        """
+        Decompresses a single BGZF block.
+
+        :param block: The complete block as bytes
+        :return: The decompressed data
+        """
+        extra_length = struct.unpack("<H", block[10:12])[0]
+        data = zlib.decompress(block[12 + extra_length:-8], -15)
+
+        if len(data) != struct.unpack("<I", block[-4:])[0]:
+            raise Exception("Invalid BGZF block encountered")
+
+        return data
+
+    def _read_raw_block(self):
+        """
+        Reads the next compressed block from the file.
+
+        :return: Tuple of (offset, size, block) or None at the end of the file
+        """
+        self._file.seek(self._next_block_offset)
+        header = self._file.read(18)
+
+        if len(header) < 1:
+            return None
+        if len(header) < 18 or header[0:2] != GZIP_MAGIC or header[12:14] != b"BC":
+            raise Exception("Invalid BGZF block encountered in " + self.filename)
+
+        block_size = struct.unpack("<H", header[16:18])[0] + 1
+        block = header + self._file.read(block_size - 18)
+        offset = self._next_block_offset
+        self._next_block_offset += block_size
+
+        return offset, block_size, block
+
+    def _load_next_block(self):
+        """
+        Makes the next block the current block.
+
+        :return: False if the end of the file was reached
+        """
+        # read ahead so that all threads are used
+        while self._executor is not None and len(self._pending_blocks) < self.threads * 2:
+            raw_block = self._read_raw_block()
+
+            if raw_block is None:
+                break
+
+            offset, block_size, block = raw_block
+            self._pending_blocks.append((offset, block_size,
+                                         self._executor.submit(BgzfReader._decompress_block, block)))
+
+        if len(self._pending_blocks) > 0:
+            offset, block_size, future = self._pending_blocks.popleft()
+            data = future.result()
+        else:
+            raw_block = self._read_raw_block()
+
+            if raw_block is None:
+                return False
+
+            offset, block_size, block = raw_block
+            data = BgzfReader._decompress_block(block)
+
+        self._block_offset = offset
+        self._block_size = block_size
+        self._block_data = data
+        self._position = 0
+
+        return True
+
+    def _has_data(self):
+        """
+        Makes sure that the current block still contains unread data.
+
+        :return: False if the end of the file was reached
+        """
+        # the EOF marker is an empty block
+        while self._position >= len(self._block_data):
+            if not self._load_next_block():
+                return False
+
+        return True
+
+    def tell(self):
+        """
+        Returns the current virtual offset.
+
+        :return: The virtual offset
+        """
+        # the end of a block is the start of the next one
+        if self._position >= len(self._block_data) and len(self._block_data) > 0:
+            return (self._block_offset + self._block_size) << 16
+
+        return (self._block_offset << 16) | self._position
+
+    def seek(self, virtual_offset, whence=io.SEEK_SET):
+        """
+        Moves to the passed virtual offset.
+
+        :param virtual_offset: The virtual offset as returned by tell
+        :param whence: Only io.SEEK_SET is supported
+        :return: The virtual offset
+        """
+        if whence != io.SEEK_SET:
+            raise Exception("BGZF files only support absolute virtual offsets")
+
+        block_offset = virtual_offset >> 16
+        position = virtual_offset & 0xFFFF
+
+        if block_offset != self._block_offset or len(self._block_data) < 1:
+            # discard all blocks that were read ahead
+            for offset, block_size, future in self._pending_blocks:
+                future.cancel()
+
+            self._pending_blocks.clear()
+            self._next_block_offset = block_offset
+            self._block_data = b""
+            self._block_offset = block_offset
+            self._block_size = 0
+
+            if not self._load_next_block() and position > 0:
+                raise Exception("Invalid virtual offset " + str(virtual_offset))
+
+        if position > len(self._block_data):
+            raise Exception("Invalid virtual offset " + str(virtual_offset))
+
+        self._position = position
+
+        return virtual_offset
+
+    def read(self, size=-1):
+        """
+        Reads up to size bytes.
+
+        :param size: Number of bytes to read (-1 to read the rest of the file)
+        :return: The data
+        """
+        if size is None:
+            size = -1
+
+        chunks = list()
+
+        while (size < 0 or size > 0) and self._has_data():
+            end = len(self._block_data) if size < 0 else min(self._position + size, len(self._block_data))
+            chunks.append(self._block_data[self._position:end])
+
+            if size > 0:
+                size -= end - self._position
+
+            self._position = end
+
+        return b"".join(chunks)
+
+    def read1(self, size=-1):
+        """
+        Reads up to size bytes from the current block.
+
+        :param size: Maximum number of bytes to read
+        :return: The data
+        """
+        if not self._has_data():
+            return b""
+
+        end = len(self._block_data) if size is None or size < 0 else \
+            min(self._position + size, len(self._block_data))
+        data = self._block_data[self._position:end]
+        self._position = end
+
+        return data
+
+    def readline(self, size=-1):
+        """
+        Reads the next line (including the line ending).
+
+        :param size: Ignored
+        :return: The line or b"" at the end of the file
+        """
+        chunks = list()
+
+        while self._has_data():
+            end = self._block_data.find(b"\n", self._position)
+
+            if end >= 0:
+                chunks.append(self._block_data[self._position:end + 1])
+                self._position = end + 1
+                break
+
+            chunks.append(self._block_data[self._position:])
+            self._position = len(self._block_data)
+
+        return b"".join(chunks)
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def __next__(self):
+        line = self.readline()
+
+        if len(line) < 1:
+            raise StopIteration
+
+        return line
@@ -3,37 +3,334 @@
 # used by the clustering parser.
 # ------------------------------
 
-import re
+import sys
 import json
+import functools
+
+from . import sequences
+
+# shared by all objects without PSMs / PTMs
+EMPTY_FROZENSET = frozenset()
+
+# number of distinct taxid and PSM sets that are shared between spectra
+SHARED_SET_CACHE_SIZE = 100000
+
+
+def _get_taxid_set(taxids):
+    """
+    Returns a shared frozenset for the passed taxids.
+
+    :param taxids: An iterable of taxids
+    :return: A frozenset of the (interned) taxids
+    """
+    return _create_taxid_set(tuple(taxids))
+
+
+@functools.lru_cache(maxsize=SHARED_SET_CACHE_SIZE)
+def _create_taxid_set(taxids):
+    """
+    Creates the frozenset of the passed taxids. The most recently
+    used sets are cached so that spectra with the same taxids share
+    the same object.
+
+    :param taxids: A tuple of taxids
+    :return: A frozenset of the (interned) taxids
+    """
+    return frozenset([sys.intern(taxid) if isinstance(taxid, str) else taxid for taxid in taxids])
+
+
+def _get_psm_set(psms):
+    """
+    Returns a shared frozenset for the passed PSMs.
+
+    :param psms: An iterable of PSMs
+    :return: A frozenset of the PSMs
+    """
+    psm_set = frozenset(psms)
+
+    if len(psm_set) < 1:
+        return EMPTY_FROZENSET
+
+    return _share_psm_set(psm_set)
+
+
+@functools.lru_cache(maxsize=SHARED_SET_CACHE_SIZE)
+def _share_psm_set(psm_set):
+    """
+    Returns the first (still cached) frozenset that is equal to
+    the passed one.
+
+    :param psm_set: A frozenset of PSMs
+    :return: The shared frozenset
+    """
+    return psm_set
+
+
+class ClusterStats:
+    """
+    Accumulates the statistics of a cluster's spectra (number of
+    (un)identified spectra, charge, and sequence counts) in a single
+    pass over the spectra. Afterwards, spectra can be added and removed
+    without processing the remaining spectra again.
+
+    The sequences are additionally grouped by their count. Thereby, the
+    most common sequences are known after every change without
+    searching all sequence counts.
+
+    :ivar n_spectra: Number of spectra
+    :ivar identified_spectra: Number of identified spectra
+    :ivar unidentified_spectra: Number of unidentified spectra
+    :ivar sequence_counts: A dict with the clean sequence as key and the number of spectra as value
+    :ivar il_sequence_counts: A dict with the I/L ignorant sequence as key and the number of spectra as value
+    """
+    def __init__(self, spectra=None, sequence_counts=None):
+        """
+        Creates a new ClusterStats object.
+
+        :param spectra: The spectra to add. These may either be Spectrum or SpectrumSummary objects.
+        :param sequence_counts: If set, these (clean) sequence counts are used instead of counting the
+                                spectra's sequences. Spectra can then no longer be added or removed.
+        """
+        self.n_spectra = 0
+        self.identified_spectra = 0
+        self.unidentified_spectra = 0
+        self.sequence_counts = dict()
+        self.il_sequence_counts = dict()
+        self._charge_sum = 0
+        self._charged_spectra = 0
+        self._fixed_sequence_counts = sequence_counts is not None
+
+        # the sequences with a certain count, the most common sequences are returned in the order of sequence_counts
+        self._count_sequences = dict()
+        self._sequence_order = dict()
+        self._n_sequences_added = 0
+        self._max_count = 0
+
+        # only the number of I/L ignorant sequences with a certain count is required
+        self._il_count_sizes = dict()
+        self._max_il_count = 0
+
+        if spectra is not None:
+            for spectrum in spectra:
+                self._update(spectrum, 1)
+
+        if sequence_counts is not None:
+            for sequence, count in sequence_counts.items():
+                self._change_count(sequence, count)
+            for sequence, count in Cluster.fold_sequence_counts(sequence_counts).items():
+                self._change_il_count(sequence, count)
+
+    def add_spectrum(self, spectrum):
+        """
+        Adds the spectrum to the statistics.
+
+        :param spectrum: The Spectrum (or SpectrumSummary) to add
+        """
+        if self._fixed_sequence_counts:
+            raise Exception("Spectra cannot be added or removed if sequence counts were set")
+
+        self._update(spectrum, 1)
+
+    def remove_spectrum(self, spectrum):
+        """
+        Removes the spectrum from the statistics. The spectrum
+        must have been added before.
+
+        :param spectrum: The Spectrum (or SpectrumSummary) to remove
+        """
+        if self._fixed_sequence_counts:
+            raise Exception("Spectra cannot be added or removed if sequence counts were set")
+
+        self._update(spectrum, -1)
+
+    def _update(self, spectrum, change):
+        """
+        Adds (change = 1) or removes (change = -1) the spectrum.
+
+        :param spectrum: The spectrum to add or remove
+        :param change: 1 to add the spectrum, -1 to remove it
+        """
+        self.n_spectra += change
+
+        # spectra without a charge state are ignored for the charge
+        if spectrum.charge is not None:
+            charge = int(spectrum.charge)
+
+            if charge != 0:
+                self._charged_spectra += change
+                self._charge_sum += charge * change
+
+        if not spectrum.is_identified():
+            self.unidentified_spectra += change
+            return
+
+        self.identified_spectra += change
+
+        if self._fixed_sequence_counts:
+            return
+
+        for sequence in spectrum.get_clean_sequences():
+            self._change_count(sequence, change)
+            self._change_il_count(sequences.fold_il(sequence), change)
+
+    def _change_count(self, sequence, change):
+        """
+        Changes the sequence's count. Sequences whose count
+        dropped to 0 are removed.
+
+        :param sequence: The clean sequence
+        :param change: The change of the count
+        """
+        count = self.sequence_counts.get(sequence, 0)
+
+        if count > 0:
+            ClusterStats._remove_from_bucket(self._count_sequences, count, sequence)
+        else:
+            self._sequence_order[sequence] = self._n_sequences_added
+            self._n_sequences_added += 1
+
+        count += change
+
+        if count > 0:
+            self.sequence_counts[sequence] = count
+            self._count_sequences.setdefault(count, set()).add(sequence)
+        else:
+            del self.sequence_counts[sequence]
+            del self._sequence_order[sequence]
+
+        self._max_count = ClusterStats._update_max_count(self._max_count, self._count_sequences, count)
+
+    def _change_il_count(self, sequence, change):
+        """
+        Changes the I/L ignorant sequence's count. Sequences whose
+        count dropped to 0 are removed.
+
+        :param sequence: The I/L ignorant sequence
+        :param change: The change of the count
+        """
+        count = self.il_sequence_counts.get(sequence, 0)
+
+        if count > 0:
+            self._il_count_sizes[count] -= 1
+
+            if self._il_count_sizes[count] < 1:
+                del self._il_count_sizes[count]
+
+        count += change
+
+        if count > 0:
+            self.il_sequence_counts[sequence] = count
+            self._il_count_sizes[count] = self._il_count_sizes.get(count, 0) + 1
+        else:
+            del self.il_sequence_counts[sequence]
+
+        self._max_il_count = ClusterStats._update_max_count(self._max_il_count, self._il_count_sizes, count)
+
+    @staticmethod
+    def _remove_from_bucket(buckets, count, sequence):
+        """
+        Removes the sequence from the bucket of its count.
+
+        :param buckets: Dict with the count as key and the set of sequences as value
+        :param count: The sequence's count
+        :param sequence: The sequence
+        """
+        bucket = buckets[count]
+        bucket.discard(sequence)
+
+        if len(bucket) < 1:
+            del buckets[count]
+
+    @staticmethod
+    def _update_max_count(max_count, buckets, new_count):
+        """
+        Returns the new maximum count after a sequence's count was
+        changed. Since counts are changed by one, the loop only runs
+        once for every removed spectrum.
+
+        :param max_count: The previous maximum count
+        :param buckets: Dict with the count as key
+        :param new_count: The changed sequence's new count
+        :return: The new maximum count
+        """
+        if new_count > max_count:
+            return new_count
+
+        while max_count > 0 and max_count not in buckets:
+            max_count -= 1
+
+        return max_count
+
+    def get_charge(self):
+        """
+        Returns the average charge of all spectra with a charge state.
+
+        :return: The charge rounded as an int
+        """
+        if self._charged_spectra < 1:
+            return 0
+
+        return round(self._charge_sum / self._charged_spectra, ndigits=0)
+
+    def get_max_sequences(self):
+        """
+        Returns the most common sequence(s) in the order of **sequence_counts**.
+
+        :return: A tuple of the sequences' count and a tuple of the sequences
+        """
+        if self._max_count < 1:
+            return 0, tuple()
+
+        return self._max_count, tuple(sorted(self._count_sequences[self._max_count],
+                                             key=self._sequence_order.__getitem__))
+
+    def get_max_il_count(self):
+        """
+        Returns the count of the most common I/L ignorant sequence.
+
+        :return: The count
+        """
+        return self._max_il_count
 
 
 class Cluster:
     """
     Represents a cluster in a .clustering output file.
     """
-    def __init__(self, cluster_id, precursor_mz, consensus_mz, consensus_intens, spectra, ignore_duplicated=True):
+    def __init__(self, cluster_id, precursor_mz, consensus_mz, consensus_intens, spectra, ignore_duplicated=True,
+                 sequence_counts=None, consensus_counts=None, precursor_intens=None):
         """ Creates a new cluster object
 
         :param cluster_id: The cluster's id
         :param precursor_mz: The cluster's average precursor m/z
-        :param consensus_mz: A list of doubles holding the consensus spectrum's m/z values
-        :param consensus_intens: A list of doubles holding the consensus spectrum's intensity values
+        :param consensus_mz: A numpy array holding the consensus spectrum's m/z values
+        :param consensus_intens: A numpy array holding the consensus spectrum's intensity values
         :param spectra: A set of spectra associated with the cluster
         :param ignore_duplicated: The constructor automatically removes duplicated spectra from the list
                                   of clustered spectra. If duplicated spectra are found, an Exception is
                                   raised. Setting this parameter to true does not prevent the filtering, but
                                   prevents the exception to be raised.
+        :param sequence_counts: If set, these sequence counts (for example from the .clustering file's
+                                "sequence=" line) are used instead of calculating them from the spectra.
+        :param consensus_counts: A numpy array holding the number of spectra every consensus peak
+                                 is based on. None if the counts were not parsed.
+        :param precursor_intens: The cluster's average precursor intensity
         """
         self.id = cluster_id
         self.precursor_mz = precursor_mz
+        self.precursor_intens = precursor_intens
         self.consensus_mz = consensus_mz
         self.consensus_intens = consensus_intens
-        self._spectra = set(spectra)
+        self.consensus_counts = consensus_counts
+        # the statistics are calculated in the spectra's order, as done by the LazyCluster
+        unique_spectra = list(dict.fromkeys(spectra))
+        self._spectra = set(unique_spectra)
+        self._summary_sequence_counts = Cluster._clean_sequence_counts(sequence_counts)
 
         if not ignore_duplicated and self._spectra != len(spectra):
             raise Exception("Duplicated spectra identified in the dataset.")
 
-        self._update_properties()
+        self._calculate_properties(unique_spectra)
 
     def _update_properties(self):
         """
@@ -43,45 +340,54 @@ class Cluster:
 
         :return:
         """
-        self.n_spectra = len(self._spectra)
-        self.identified_spectra = 0
-        self.unidentified_spectra = 0
-        self.charge = Cluster._calculate_charge(self._spectra)
+        self._calculate_properties(self._spectra)
 
-        for spectrum in self._spectra:
-            if spectrum.is_identified():
-                self.identified_spectra += 1
-            else:
-                self.unidentified_spectra += 1
+    def _calculate_properties(self, spectra):
+        """
+        Calculates the cluster's properties based on the passed spectra. These
+        may either be Spectrum or SpectrumSummary objects.
 
-        if self.identified_spectra > 0:
-            # calculate ratios
-            self.sequence_counts = Cluster.calculate_sequence_counts(self._spectra, False)
+        :param spectra: The spectra to use.
+        """
+        # use the precomputed sequence counts if available
+        self._stats = ClusterStats(spectra, sequence_counts=self._summary_sequence_counts)
+        self._apply_stats()
 
-            self.sequence_ratios = dict()
-            for sequence in self.sequence_counts.keys():
-                self.sequence_ratios[sequence] = self.sequence_counts[sequence] / self.identified_spectra
+    def _apply_stats(self):
+        """
+        Sets the cluster's properties based on its ClusterStats.
+        """
+        stats = self._stats
 
-            self.max_ratio = max(self.sequence_ratios.values())
+        self.n_spectra = stats.n_spectra
+        self.identified_spectra = stats.identified_spectra
+        self.unidentified_spectra = stats.unidentified_spectra
+        self.charge = stats.get_charge()
+        self.sequence_counts = stats.sequence_counts
 
-            self.max_sequences = tuple([sequence for sequence in self.sequence_ratios.keys()
-                                        if self.sequence_ratios[sequence] == self.max_ratio])
+        if self.identified_spectra > 0:
+            max_count, self.max_sequences = stats.get_max_sequences()
+            self.max_ratio = max_count / self.identified_spectra
 
             # calculate max I/L ratio
-            sequence_counts_il = Cluster.calculate_sequence_counts(self._spectra, True)
-
-            sequence_ratios_il = dict()
-            for sequence in sequence_counts_il.keys():
-                sequence_ratios_il[sequence] = sequence_counts_il[sequence] / self.identified_spectra
-
-            self.max_il_ratio = max(sequence_ratios_il.values())
+            self.max_il_ratio = stats.get_max_il_count() / self.identified_spectra
         else:
             # set to default values for unidentified clusters
-            self.sequence_ratios = dict()
             self.max_ratio = None
             self.max_sequences = tuple()
             self.max_il_ratio = None
 
+    @property
+    def sequence_ratios(self):
+        """
+        The ratios of all sequences as a dict with the sequence as key. The
+        ratios are only calculated when accessed.
+        """
+        if self.identified_spectra < 1:
+            return dict()
+
+        return dict([(sequence, count / self.identified_spectra) for sequence, count in self.sequence_counts.items()])
+
     @staticmethod
     def _calculate_charge(spectra):
         """
@@ -120,12 +426,121 @@ class Cluster:
 
     def set_spectra(self, new_spectra):
         """
-        Updates the cluster's stored spectra
+        Updates the cluster's stored spectra. Only the statistics
+        of the added and removed spectra are updated.
+
+        :param new_spectra: A list of Spectrum objects.
+        """
+        new_spectra = set(new_spectra)
+        self._prepare_update()
+
+        self._remove_spectra(self._spectra - new_spectra)
+        self._add_spectra(new_spectra - self._spectra)
+        self._apply_stats()
+
+    def add_spectra(self, spectra):
+        """
+        Adds the spectra to the cluster. Spectra that are already part of
+        the cluster are ignored. Only the statistics of the added spectra
+        are calculated.
+
+        :param spectra: An iterable of Spectrum objects
+        """
+        self._prepare_update()
+        self._add_spectra([spectrum for spectrum in set(spectra) if spectrum not in self._spectra])
+        self._apply_stats()
+
+    def remove_spectra(self, spectra):
+        """
+        Removes the spectra from the cluster. Spectra that are not part of
+        the cluster are ignored. Only the statistics of the removed spectra
+        are calculated.
+
+        :param spectra: An iterable of Spectrum objects
+        """
+        self._prepare_update()
+        self._remove_spectra([spectrum for spectrum in set(spectra) if spectrum in self._spectra])
+        self._apply_stats()
+
+    def merge(self, other_cluster):
+        """
+        Adds all spectra of the other cluster to this cluster. The
+        cluster's id, precursor m/z, and consensus spectrum are not changed.
+
+        :param other_cluster: The Cluster to merge into this one
+        """
+        self.add_spectra(other_cluster.get_spectra())
+
+    def _prepare_update(self):
+        """
+        Called before the cluster's spectra are changed. If the statistics
+        are based on precomputed sequence counts, these are no longer valid
+        and the statistics are calculated from the spectra.
+        """
+        if self._summary_sequence_counts is not None:
+            self._summary_sequence_counts = None
+            self._update_properties()
+
+    def _add_spectra(self, spectra):
+        """
+        Adds spectra that are not yet part of the cluster.
+
+        :param spectra: An iterable of Spectrum objects
+        """
+        for spectrum in spectra:
+            self._spectra.add(spectrum)
+            self._stats.add_spectrum(spectrum)
+
+    def _remove_spectra(self, spectra):
+        """
+        Removes spectra that are part of the cluster.
+
+        :param spectra: An iterable of Spectrum objects
+        """
+        for spectrum in spectra:
+            self._spectra.remove(spectrum)
+            self._stats.remove_spectrum(spectrum)
+
+    @staticmethod
+    def _clean_sequence_counts(sequence_counts):
+        """
+        Removes all special characters from the sequences of precomputed
+        sequence counts. Empty sequences are removed.
+
+        :param sequence_counts: A dict with the sequence as key and the number of occurrences as value.
+        :return: The cleaned dict or None if no sequence counts were passed
+        """
+        if sequence_counts is None:
+            return None
+
+        clean_counts = dict()
+
+        for sequence, count in sequence_counts.items():
+            clean_sequence = sequences.clean_sequence(sequence)
+
+            if len(clean_sequence) < 1:
+                continue
+
+            clean_counts[clean_sequence] = clean_counts.get(clean_sequence, 0) + count
+
+        return clean_counts
+
+    @staticmethod
+    def fold_sequence_counts(sequence_counts):
+        """
+        Converts sequence counts into I/L ignorant sequence counts by
+        replacing all I with L.
 
-        :param new_spectra: A list of PSM objects.
+        :param sequence_counts: A dict with the sequence as key and the number of occurrences as value.
+        :return: A dict with the I/L ignorant sequence as key and the number of occurrences as value.
         """
-        self._spectra = list(new_spectra)
-        self._update_properties()
+        folded_counts = dict()
+
+        for sequence, count in sequence_counts.items():
+            folded_sequence = sequences.fold_il(sequence)
+            folded_counts[folded_sequence] = folded_counts.get(folded_sequence, 0) + count
+
+        return folded_counts
 
     @staticmethod
     def calculate_sequence_counts(spectra, ignore_i_l=False):
@@ -148,7 +563,7 @@ class Cluster:
 
             for sequence in spectrum.get_clean_sequences():
                 if ignore_i_l:
-                    processed_sequence = sequence.replace("I", "L")
+                    processed_sequence = sequences.fold_il(sequence)
                 else:
                     processed_sequence = sequence
 
@@ -160,10 +575,187 @@ class Cluster:
         return sequence_counts
 
 
+class LazyCluster(Cluster):
+    """
+    A cluster that only creates its Spectrum objects when they are accessed
+    for the first time through **get_spectra**.
+
+    The cluster's statistics (size, ratios, charge, etc.) are calculated
+    from lightweight SpectrumSummary objects instead. Until then, the
+    cluster's SPEC lines are only stored as a single bytes object.
+    """
+    def __init__(self, cluster_id, precursor_mz, consensus_mz, consensus_intens, spec_lines,
+                 spectrum_summaries, spectrum_parser, sequence_counts=None, consensus_counts=None,
+                 precursor_intens=None):
+        """
+        Creates a new LazyCluster object
+
+        :param cluster_id: The cluster's id
+        :param precursor_mz: The cluster's average precursor m/z
+        :param consensus_mz: A numpy array holding the consensus spectrum's m/z values
+        :param consensus_intens: A numpy array holding the consensus spectrum's intensity values
+        :param spec_lines: The cluster's (unique) SPEC lines as a single bytes object
+        :param spectrum_summaries: SpectrumSummary objects, one for every SPEC line
+        :param spectrum_parser: Function to convert a SPEC line (string) into a Spectrum object
+        :param sequence_counts: If set, these sequence counts are used instead of calculating them
+                                from the SPEC lines.
+        :param consensus_counts: A numpy array holding the number of spectra every consensus peak
+                                 is based on. None if the counts were not parsed.
+        :param precursor_intens: The cluster's average precursor intensity
+        """
+        self.id = cluster_id
+        self.precursor_mz = precursor_mz
+        self.precursor_intens = precursor_intens
+        self.consensus_mz = consensus_mz
+        self.consensus_intens = consensus_intens
+        self.consensus_counts = consensus_counts
+        self._spectra = None
+        self._summary_sequence_counts = Cluster._clean_sequence_counts(sequence_counts)
+        self._spec_lines = spec_lines
+        self._spectrum_parser = spectrum_parser
+
+        self._calculate_properties(spectrum_summaries)
+
+    def _update_properties(self):
+        if self._spectra is None:
+            self._load_spectra()
+
+        super()._update_properties()
+
+    def _prepare_update(self):
+        if self._spectra is None:
+            self._load_spectra()
+
+        super()._prepare_update()
+
+    def _load_spectra(self):
+        """
+        Creates the Spectrum objects based on the stored SPEC lines.
+        """
+        self._spectra = set([self._spectrum_parser(line.strip()) for line in self._spec_lines.decode().splitlines()])
+        self._spec_lines = None
+
+    def is_loaded(self):
+        """
+        Checks whether the cluster's Spectrum objects were already created.
+
+        :return: boolean
+        """
+        return self._spectra is not None
+
+    def get_spectra(self):
+        """
+        Returns the stored spectra in a tuple. The Spectrum objects
+        are created during the first call of this function.
+
+        :return: A tuple containing the cluster's spectra
+        """
+        if self._spectra is None:
+            self._load_spectra()
+
+        return super().get_spectra()
+
+
+class SpectrumSummary:
+    """
+    Holds the minimal information of a SPEC line required to calculate
+    a cluster's statistics. This class is used by the LazyCluster class
+    and mirrors the respective functions of the Spectrum class.
+    """
+    def __init__(self, charge, sequences):
+        """
+        Creates a new SpectrumSummary object
+
+        :param charge: The spectrum's charge state
+        :param sequences: The spectrum's (unclean) identified sequences
+        """
+        self.charge = charge
+        self.sequences = sequences
+
+    def is_identified(self):
+        """
+        Checks whether the spectrum was identified.
+
+        :return: boolean
+        """
+        return len(self.sequences) > 0
+
+    def get_clean_sequences(self):
+        """
+        Returns the identified sequences without any additional
+        characters and only using high-caps.
+
+        :return: Identified sequences
+        """
+        return set([sequences.clean_sequence(sequence) for sequence in self.sequences])
+
+
+class ClusteringHeader:
+    """
+    Represents the header of a .clustering file.
+
+    :ivar name: Name of the clustering run
+    :ivar similarity_method: Name of the used similarity method
+    :ivar threshold: The clustering threshold
+    :ivar fdr: The used FDR
+    :ivar version: Version of the software that created the file
+    :ivar description: Description of the clustering run
+    :ivar properties: A dict holding all fields of the header as strings
+    """
+    def __init__(self, properties):
+        """
+        Creates a new ClusteringHeader object
+
+        :param properties: A dict holding the header's fields as key and their values as strings.
+        """
+        self.properties = dict(properties)
+        self.name = self.properties.get("name", None)
+        self.similarity_method = self.properties.get("similarity_method", None)
+        self.version = self.properties.get("version", None)
+        self.description = self.properties.get("description", None)
+        self.threshold = ClusteringHeader._to_float(self.properties.get("threshold", None))
+        self.fdr = ClusteringHeader._to_float(self.properties.get("fdr", None))
+
+    @staticmethod
+    def _to_float(value):
+        """
+        Converts the passed string to a float
+
+        :param value: The value to convert
+        :return: The value as float or None if it cannot be converted
+        """
+        if value is None:
+            return None
+
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def get_property(self, key):
+        """
+        Get the header field with the defined key.
+
+        :param key: The field's name.
+        :return: The field's value as string or None if it is not defined
+        """
+        return self.properties.get(key, None)
+
+
 class Spectrum:
     """
     A spectrum reference.
+
+    To reduce the memory footprint, the class uses __slots__, shares
+    the filename part of titles as well as the taxid sets between
+    spectra, and only decodes the JSON encoded properties when they
+    are accessed for the first time.
+
+    The spectrum's identity (title, precursor m/z, charge, taxids and
+    PSMs) is stored as an immutable key together with its hash. These
+    properties can therefore not be changed once the object was created.
     """
+    __slots__ = ("_key", "_hash", "similarity_score", "_json_properties", "_properties")
 
     def __init__(self, title, precursor_mz, charge, taxids, psms, similarity_score=0, json_properties=None):
         """
@@ -179,18 +771,85 @@ class Spectrum:
         :param json_properties: Additional properties of the spectrum encoded as a JSON string.
         :return:
         """
-        self.title = title
-        self.precursor_mz = precursor_mz
-        self.charge = charge
-        self.taxids = frozenset(taxids)
+        title_prefix, title_suffix = Spectrum._split_title(title)
+
+        self._key = (title_prefix, title_suffix, precursor_mz, charge, _get_taxid_set(taxids),
+                     _get_psm_set(psms) if psms else EMPTY_FROZENSET)
+        self._hash = hash(self._key)
         self.similarity_score = similarity_score
 
-        if psms is None:
-            self.psms = frozenset()
-        else:
-            self.psms = frozenset(psms)
+        # JSON properties are only decoded when accessed
+        self._json_properties = json_properties if json_properties != "{}" else None
+        self._properties = None
+
+    @staticmethod
+    def _split_title(title):
+        """
+        Splits the title into the filename part and the remaining
+        title. The filename is shared by many spectra and therefore
+        interned.
+
+        :param title: The spectrum's title
+        :return: Tuple of (filename part, remaining title)
+        """
+        if title.startswith("#file="):
+            id_index = title.find("#id=")
+
+            if id_index > 0:
+                return sys.intern(title[:id_index]), title[id_index:]
+
+        return "", title
+
+    @property
+    def title(self):
+        """
+        The spectrum's title (including the encoded filename and id).
+        """
+        return self._key[0] + self._key[1]
+
+    @property
+    def precursor_mz(self):
+        return self._key[2]
+
+    @property
+    def charge(self):
+        return self._key[3]
+
+    @property
+    def taxids(self):
+        return self._key[4]
+
+    @property
+    def psms(self):
+        return self._key[5]
+
+    def get_key(self):
+        """
+        Returns the immutable key defining the spectrum's identity.
 
-        self.properties = json.loads(json_properties) if json_properties is not None else dict()
+        :return: Tuple of (filename part of title, remaining title, precursor m/z, charge, taxids, psms)
+        """
+        return self._key
+
+    @property
+    def properties(self):
+        """
+        Additional properties of the spectrum as a dict.
+        """
+        if self._properties is None:
+            if self._json_properties is not None:
+                self._properties = json.loads(self._json_properties)
+            else:
+                self._properties = dict()
+
+            self._json_properties = None
+
+        return self._properties
+
+    @properties.setter
+    def properties(self, properties):
+        self._properties = properties
+        self._json_properties = None
 
     def get_filename(self):
         """
@@ -200,16 +859,22 @@ class Spectrum:
 
         :return: Original filename or None if not present
         """
-        if "#file=" not in self.title:
+        # the filename is stored separately if the title starts with it
+        if self._key[0]:
+            return self._key[0][6:]
+
+        title = self.title
+
+        if "#file=" not in title:
             return None
 
-        start = self.title.find("#file=")
-        end = self.title.find("#id=")
+        start = title.find("#file=")
+        end = title.find("#id=")
 
         if end == -1:
-            end = len(self.title)
+            end = len(title)
 
-        return self.title[start + 6:end]
+        return title[start + 6:end]
 
     def get_mass(self):
         """
@@ -228,16 +893,18 @@ class Spectrum:
 
         :return: Original spectrum id or None if not present
         """
-        if "#id=" not in self.title:
+        title = self.title
+
+        if "#id=" not in title:
             return None
 
-        start = self.title.find("#id=")
-        end = self.title.find("#title=")
+        start = title.find("#id=")
+        end = title.find("#title=")
 
         if end == -1:
-            end = len(self.title)
+            end = len(title)
 
-        return self.title[start + 4:end]
+        return title[start + 4:end]
 
     def get_title(self):
         """
@@ -250,11 +917,13 @@ class Spectrum:
 
         :return: The original spectrum's title
         """
-        if "#title=" not in self.title:
-            return self.title
+        title = self.title
+
+        if "#title=" not in title:
+            return title
 
-        start = self.title.find("#title=")
-        return self.title[start + 7:]
+        start = title.find("#title=")
+        return title[start + 7:]
 
     def get_clean_sequence_psms(self):
         """
@@ -266,7 +935,7 @@ class Spectrum:
         clean_psms = list()
 
         for psm in self.psms:
-            clean_sequence = re.sub(r"[^A-Z]", "", psm.sequence.upper())
+            clean_sequence = sequences.clean_sequence(psm.sequence)
             clean_psms.append(PSM(sequence=clean_sequence, ptms=psm.ptms))
 
         return tuple(clean_psms)
@@ -278,13 +947,7 @@ class Spectrum:
 
         :return: Identified sequences
         """
-        clean_sequences = set()
-
-        for psm in self.psms:
-            clean_sequences.add(
-                re.sub(r"[^A-Z]", "", psm.sequence.upper()))
-
-        return clean_sequences
+        return set([sequences.clean_sequence(psm.sequence) for psm in self.psms])
 
     def is_identified(self):
         """
@@ -323,18 +986,10 @@ class Spectrum:
         if type(self) != type(other):
             return False
 
-        if self.title != other.title:
-            return False
-        if self.precursor_mz != other.precursor_mz:
-            return False
-        if self.charge != other.charge:
-            return False
-        if self.taxids != other.taxids:
-            return False
-        if self.psms != other.psms:
+        if self._hash != other._hash:
             return False
 
-        return True
+        return self._key == other._key
 
     def __str__(self):
         return "<Spectrum @ " + str(self.precursor_mz) + " m/z " + str(self.charge) + \
@@ -348,13 +1003,30 @@ class Spectrum:
                repr(self.psms)
 
     def __hash__(self):
-        return hash(repr(self))
+        return self._hash
+
+    def __getstate__(self):
+        # the hash is not pickled since string hashes differ between processes
+        return self._key, self.similarity_score, self._json_properties, self._properties
+
+    def __setstate__(self, state):
+        key, self.similarity_score, self._json_properties, self._properties = state
+
+        # share the sets with the spectra of this process
+        self._key = (sys.intern(key[0]), key[1], key[2], key[3], _get_taxid_set(key[4]),
+                     _get_psm_set(key[5]) if key[5] else EMPTY_FROZENSET)
+        self._hash = hash(self._key)
 
 
 class PSM:
     """
     Defines a peptide-spectrum-match
+
+    The sequence and PTMs define the PSM's identity and must not be
+    changed once the object was created.
     """
+    __slots__ = ("_key", "_hash")
+
     def __init__(self, sequence, ptms):
         """
         Creates a new PSM object.
@@ -363,8 +1035,17 @@ class PSM:
         :param ptms: A set of PTMs
         :return:
         """
-        self.sequence = sequence
-        self.ptms = frozenset(ptms)
+        # the same sequences are observed many times
+        self._key = (sys.intern(sequence), frozenset(ptms) if ptms else EMPTY_FROZENSET)
+        self._hash = hash(self._key)
+
+    @property
+    def sequence(self):
+        return self._key[0]
+
+    @property
+    def ptms(self):
+        return self._key[1]
 
     def __eq__(self, other):
         """
@@ -377,13 +1058,10 @@ class PSM:
         if type(self) != type(other):
             return False
 
-        if self.sequence != other.sequence:
-            return False
-
-        if self.ptms != other.ptms:
+        if self._hash != other._hash:
             return False
 
-        return True
+        return self._key == other._key
 
     def __str__(self):
         sequence_list = list()
@@ -405,7 +1083,14 @@ class PSM:
         return repr(self.sequence) + repr(self.ptms)
 
     def __hash__(self):
-        return hash(repr(self))
+        return self._hash
+
+    def __getstate__(self):
+        return self._key
+
+    def __setstate__(self, state):
+        self._key = (sys.intern(state[0]), state[1])
+        self._hash = hash(self._key)
 
 
 class PTM:
@@ -416,7 +1101,11 @@ class PTM:
     :ivar accession: The PTM's accession in UNIMOD (if starting with
                      "MOD:"). This may also represent a PSI entry in
                      the format [PSI-MS, MS:1001524, fragment neutral loss, 63.998283]
+
+    The position and accession must not be changed once the object
+    was created.
     """
+    __slots__ = ("_key", "_hash")
 
     def __init__(self, position, accession):
         """
@@ -426,8 +1115,16 @@ class PTM:
         :param accession: MOD accession of the modification.
         :return:
         """
-        self.position = position
-        self.accession = accession
+        self._key = (position, sys.intern(accession))
+        self._hash = hash(self._key)
+
+    @property
+    def position(self):
+        return self._key[0]
+
+    @property
+    def accession(self):
+        return self._key[1]
 
     def __eq__(self, other):
         """
@@ -440,19 +1137,23 @@ class PTM:
         if type(self) != type(other):
             return False
 
-        if self.accession != other.accession:
+        if self._hash != other._hash:
             return False
 
-        if self.position != other.position:
-            return False
-
-        return True
+        return self._key == other._key
 
     def __repr__(self):
         return repr(self.position) + repr(self.accession)
 
     def __hash__(self):
-        return hash(repr(self))
+        return self._hash
+
+    def __getstate__(self):
+        return self._key
+
+    def __setstate__(self, state):
+        self._key = (state[0], sys.intern(state[1]))
+        self._hash = hash(self._key)
 
     def __str__(self):
         return str(self.position) + "-" + self.accession
@@ -0,0 +1,69 @@
+"""
+Functions to normalize peptide sequences.
+
+The same peptide sequences occur many times in a clustering result.
+Therefore, the normalized sequences are cached and interned so that
+every distinct sequence is only processed and stored once.
+"""
+
+import re
+import sys
+import functools
+
+# number of sequences whose normalized form is cached
+SEQUENCE_CACHE_SIZE = 100000
+
+# removes all ASCII characters but letters and converts lower case letters to upper case
+_UPPER_CASE_TABLE = dict([(c, None) for c in range(128) if not chr(c).isalpha()] +
+                         [(ord(c), c.upper()) for c in "abcdefghijklmnopqrstuvwxyz"])
+
+# removes all ASCII characters but upper case letters
+_REMOVE_LOWER_CASE_TABLE = dict([(c, None) for c in range(128) if not "A" <= chr(c) <= "Z"])
+
+_IL_TABLE = str.maketrans("I", "L")
+
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def clean_sequence(sequence, upper_case=True):
+    """
+    Removes all characters but upper case letters from the sequence.
+
+    :param sequence: The peptide sequence
+    :param upper_case: If set, lower case letters are converted to upper case. Otherwise, they
+                       are removed as well.
+    :return: The clean sequence
+    """
+    if upper_case:
+        clean = sequence.translate(_UPPER_CASE_TABLE)
+    else:
+        clean = sequence.translate(_REMOVE_LOWER_CASE_TABLE)
+
+    # non-ASCII characters are not covered by the translation tables (str.isascii requires Python 3.7)
+    try:
+        clean.encode("ascii")
+    except UnicodeEncodeError:
+        clean = re.sub(r"[^A-Z]", "", sequence.upper() if upper_case else sequence)
+
+    return sys.intern(clean)
+
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def fold_il(sequence):
+    """
+    Replaces every "I" in the sequence by "L".
+
+    :param sequence: The (clean) peptide sequence
+    :return: The I/L agnostic sequence
+    """
+    return sys.intern(sequence.translate(_IL_TABLE))
+
+
+def clean_il_sequence(sequence):
+    """
+    Removes all characters but upper case letters from the sequence
+    and replaces every "I" by "L".
+
+    :param sequence: The peptide sequence
+    :return: The clean, I/L agnostic sequence
+    """
+    return fold_il(clean_sequence(sequence))
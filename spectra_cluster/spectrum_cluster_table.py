@@ -0,0 +1,410 @@
+"""
+The spectrum cluster table maps every spectrum (identified through its
+id, see Spectrum.get_id) to the cluster it belongs to. In contrast to a
+dict, the table is stored on disk and memory mapped. Therefore, very
+large results can be joined and compared in bounded memory.
+
+Spectrum keys are stored as 128 bit hashes, sorted by their first 64
+bits. Single lookups additionally compare the original key to rule out
+hash collisions, joins compare the full 128 bit hash.
+
+The table is stored as a directory containing the following files:
+
+ * **hashes.npy** / **checks.npy**: The first / second 64 bits of the keys' hashes
+ * **cluster_index.npy**: Position of the spectrum's cluster in **cluster_ids.npy**
+ * **key_offsets.npy** / **key_lengths.npy**: Position of the original key in **keys.bin**
+ * **keys.bin**: The original keys (UTF-8 encoded)
+ * **cluster_ids.npy**: The clusters' ids
+"""
+
+import os
+import shutil
+import struct
+import hashlib
+import tempfile
+import numpy
+
+from . import compression
+
+# the entries are distributed into buckets by the first bits of their hash
+N_BUCKET_BITS = 8
+
+# number of entries that are collected before they are written to the buckets
+BUFFER_SIZE = 100000
+
+ENTRY_DTYPE = numpy.dtype([("hash", "<u8"), ("check", "<u8"), ("key_offset", "<u8"), ("cluster_index", "<u4"),
+                           ("key_length", "<u4")])
+
+
+def hash_key(key):
+    """
+    Creates the 128 bit hash of a spectrum key.
+
+    :param key: The key as string or bytes
+    :return: Tuple of (first 64 bits, second 64 bits)
+    """
+    if isinstance(key, str):
+        key = key.encode()
+
+    return struct.unpack("<QQ", hashlib.blake2b(key, digest_size=16).digest())
+
+
+def get_spectrum_key(title):
+    """
+    Extracts the spectrum's key from its title. This is the
+    spectrum's id (see Spectrum.get_id) or the complete title
+    if the title does not contain an id.
+
+    :param title: The spectrum's title (string or bytes)
+    :return: The key (same type as the title)
+    """
+    id_tag, title_tag = ("#id=", "#title=") if isinstance(title, str) else (b"#id=", b"#title=")
+
+    start = title.find(id_tag)
+
+    if start == -1:
+        return title
+
+    end = title.find(title_tag)
+
+    if end == -1:
+        end = len(title)
+
+    return title[start + 4:end]
+
+
+class SpectrumClusterTableBuilder:
+    """
+    Creates a SpectrumClusterTable in bounded memory. Entries are
+    first distributed into buckets (temporary files) based on their
+    hash. Once all entries were added, every bucket is sorted
+    separately and appended to the final table.
+    """
+    def __init__(self, path):
+        """
+        Creates a new SpectrumClusterTableBuilder.
+
+        :param path: The table's directory. It must not exist yet.
+        """
+        if os.path.exists(path):
+            raise Exception("Spectrum cluster table " + path + " already exists")
+
+        os.makedirs(path)
+
+        self.path = path
+        self._temp_dir = tempfile.mkdtemp(dir=path)
+        self._bucket_files = [open(os.path.join(self._temp_dir, str(bucket)), "wb")
+                              for bucket in range(2 ** N_BUCKET_BITS)]
+        self._keys_file = open(os.path.join(path, "keys.bin"), "wb")
+        self._keys_length = 0
+        self._buffer = list()
+        self._cluster_ids = list()
+        self.n_entries = 0
+
+    def add_cluster(self, cluster_id, keys):
+        """
+        Adds all spectra of a cluster.
+
+        :param cluster_id: The cluster's id
+        :param keys: The keys of the cluster's spectra (strings or bytes)
+        """
+        cluster_index = len(self._cluster_ids)
+        self._cluster_ids.append(cluster_id)
+
+        for key in keys:
+            if isinstance(key, str):
+                key = key.encode()
+
+            key_hash, key_check = hash_key(key)
+            self._buffer.append((key_hash, key_check, self._keys_length, cluster_index, len(key)))
+
+            self._keys_file.write(key)
+            self._keys_length += len(key)
+
+        if len(self._buffer) >= BUFFER_SIZE:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        """
+        Writes the buffered entries to their buckets.
+        """
+        if len(self._buffer) < 1:
+            return
+
+        entries = numpy.array(self._buffer, dtype=ENTRY_DTYPE)
+        self._buffer = list()
+        self.n_entries += len(entries)
+
+        buckets = entries["hash"] >> numpy.uint64(64 - N_BUCKET_BITS)
+        order = numpy.argsort(buckets, kind="stable")
+        entries, buckets = entries[order], buckets[order]
+
+        # the positions at which a new bucket starts
+        bucket_ids, starts = numpy.unique(buckets, return_index=True)
+        ends = list(starts[1:]) + [len(entries)]
+
+        for bucket, start, end in zip(bucket_ids.tolist(), starts.tolist(), ends):
+            entries[start:end].tofile(self._bucket_files[bucket])
+
+    def abort(self):
+        """
+        Stops the creation of the table and removes all of its files.
+        """
+        for bucket_file in self._bucket_files:
+            bucket_file.close()
+        self._keys_file.close()
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def close(self):
+        """
+        Sorts all entries and creates the final table.
+
+        :return: The SpectrumClusterTable
+        """
+        try:
+            self._flush_buffer()
+            self._keys_file.close()
+
+            for bucket_file in self._bucket_files:
+                bucket_file.close()
+
+            numpy.save(os.path.join(self.path, "cluster_ids.npy"), numpy.array(self._cluster_ids, dtype=str))
+
+            columns = dict()
+            for column in ("hash", "check", "key_offset", "cluster_index", "key_length"):
+                columns[column] = numpy.lib.format.open_memmap(
+                    os.path.join(self.path, SpectrumClusterTable.COLUMN_FILES[column]), mode="w+",
+                    dtype=ENTRY_DTYPE[column], shape=(self.n_entries, ))
+
+            # sort every bucket - the buckets themselves are already in the order of the hashes
+            offset = 0
+            for bucket in range(len(self._bucket_files)):
+                entries = numpy.fromfile(os.path.join(self._temp_dir, str(bucket)), dtype=ENTRY_DTYPE)
+                entries = entries[numpy.argsort(entries["hash"], kind="stable")]
+
+                for column in columns:
+                    columns[column][offset:offset + len(entries)] = entries[column]
+
+                offset += len(entries)
+
+            for column in columns.values():
+                column.flush()
+            del columns
+        finally:
+            for bucket_file in self._bucket_files:
+                bucket_file.close()
+            self._keys_file.close()
+
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+        return SpectrumClusterTable(self.path)
+
+
+def build_from_clustering_file(clustering_file, path):
+    """
+    Creates the SpectrumClusterTable of a .clustering file. Only the
+    spectra's titles are extracted from the SPEC lines.
+
+    :param clustering_file: Path to the .clustering file
+    :param path: The table's directory. It must not exist yet.
+    :return: The SpectrumClusterTable
+    """
+    # imported here to prevent a circular import
+    from .clustering_parser import ClusteringParser
+
+    builder = SpectrumClusterTableBuilder(path)
+
+    try:
+        with compression.open_file(clustering_file, "rb") as reader:
+            for offset, length, lines in ClusteringParser._read_cluster_blocks(reader):
+                cluster_id = None
+                keys = list()
+
+                for line in lines:
+                    if line.startswith(b"SPEC"):
+                        fields = line.split(b"\t", 2)
+
+                        if len(fields) < 3:
+                            raise Exception("Invalid SPEC line encountered: " + line.decode())
+
+                        keys.append(get_spectrum_key(fields[1]))
+                    elif line.startswith(b"id="):
+                        cluster_id = line[3:].strip().decode()
+
+                if cluster_id is None:
+                    continue
+
+                # identical SPEC lines represent the same spectrum
+                builder.add_cluster(cluster_id, dict.fromkeys(keys))
+    except Exception:
+        builder.abort()
+        raise
+
+    return builder.close()
+
+
+class SpectrumClusterTable:
+    """
+    Memory-mapped table mapping spectrum keys to cluster ids.
+
+    :ivar path: The table's directory
+    :ivar cluster_ids: Numpy array of all cluster ids
+    """
+    COLUMN_FILES = {"hash": "hashes.npy", "check": "checks.npy", "key_offset": "key_offsets.npy",
+                    "cluster_index": "cluster_index.npy", "key_length": "key_lengths.npy"}
+
+    def __init__(self, path):
+        """
+        Opens an existing table.
+
+        :param path: The table's directory
+        """
+        self.path = path
+
+        for column, filename in SpectrumClusterTable.COLUMN_FILES.items():
+            filename = os.path.join(path, filename)
+
+            if not os.path.isfile(filename):
+                raise Exception("Invalid spectrum cluster table: missing " + filename)
+
+            setattr(self, "_" + column, numpy.load(filename, mmap_mode="r"))
+
+        self.cluster_ids = numpy.load(os.path.join(path, "cluster_ids.npy"))
+        self._keys = open(os.path.join(path, "keys.bin"), "rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._hash)
+
+    def __contains__(self, key):
+        return self.get_cluster_index(key) is not None
+
+    def close(self):
+        """
+        Closes the table's key file.
+        """
+        self._keys.close()
+
+    def _read_key(self, position):
+        """
+        Reads the original key of the entry.
+
+        :param position: The entry's position in the table
+        :return: The key as bytes
+        """
+        self._keys.seek(int(self._key_offset[position]))
+
+        return self._keys.read(int(self._key_length[position]))
+
+    def get_cluster_index(self, key):
+        """
+        Returns the position of the spectrum's cluster in **cluster_ids**.
+        If the spectrum is part of multiple clusters, the first one is
+        returned.
+
+        :param key: The spectrum's key (see get_spectrum_key)
+        :return: The cluster's position or None if the spectrum is not part of the table.
+        """
+        if isinstance(key, str):
+            key = key.encode()
+
+        key_hash, key_check = hash_key(key)
+        start = int(numpy.searchsorted(self._hash, numpy.uint64(key_hash), side="left"))
+
+        # entries with the same hash are compared to the original key
+        for position in range(start, len(self._hash)):
+            if int(self._hash[position]) != key_hash:
+                break
+
+            if int(self._check[position]) == key_check and self._read_key(position) == key:
+                return int(self._cluster_index[position])
+
+        return None
+
+    def get(self, key):
+        """
+        Returns the id of the cluster the spectrum belongs to.
+
+        :param key: The spectrum's key (see get_spectrum_key)
+        :return: The cluster id or None if the spectrum is not part of the table.
+        """
+        cluster_index = self.get_cluster_index(key)
+
+        if cluster_index is None:
+            return None
+
+        return str(self.cluster_ids[cluster_index])
+
+    def get_cluster_sizes(self, chunk_size=1000000):
+        """
+        Counts the spectra of every cluster. The table is processed in
+        chunks so that only the current chunk is held in memory.
+
+        :param chunk_size: Number of entries processed at once
+        :return: A numpy array with the number of spectra of every cluster (same order as **cluster_ids**)
+        """
+        sizes = numpy.zeros(len(self.cluster_ids), dtype=numpy.int64)
+
+        for start in range(0, len(self), chunk_size):
+            sizes += numpy.bincount(self._cluster_index[start:start + chunk_size], minlength=len(self.cluster_ids))
+
+        return sizes
+
+    def join(self, other, chunk_size=1000000):
+        """
+        Finds all spectra that are part of both tables. The tables are
+        processed in chunks so that only the current chunk is held in memory.
+
+        :param other: The other SpectrumClusterTable
+        :param chunk_size: Number of entries processed at once
+        :return: Generator of (cluster indexes, other cluster indexes) numpy arrays, one
+                 pair of arrays per chunk.
+        """
+        for start in range(0, len(self), chunk_size):
+            hashes = numpy.asarray(self._hash[start:start + chunk_size])
+            checks = numpy.asarray(self._check[start:start + chunk_size])
+            cluster_index = numpy.asarray(self._cluster_index[start:start + chunk_size])
+
+            # only the matching part of the other table is loaded
+            other_start = int(numpy.searchsorted(other._hash, hashes[0], side="left"))
+            other_end = int(numpy.searchsorted(other._hash, hashes[-1], side="right"))
+            other_hashes = numpy.asarray(other._hash[other_start:other_end])
+
+            # a hash may occur multiple times in the other table (f.e. if a spectrum is part of multiple clusters)
+            starts = numpy.searchsorted(other_hashes, hashes, side="left")
+            n_matches = numpy.searchsorted(other_hashes, hashes, side="right") - starts
+
+            positions = numpy.repeat(numpy.arange(len(hashes)), n_matches)
+            other_positions = numpy.arange(len(positions)) - numpy.repeat(numpy.cumsum(n_matches) - n_matches,
+                                                                          n_matches)
+            other_positions += numpy.repeat(starts, n_matches) + other_start
+
+            # compare the complete hash
+            matches = numpy.asarray(other._check[other_positions]) == checks[positions]
+
+            yield cluster_index[positions[matches]], numpy.asarray(other._cluster_index[other_positions[matches]])
+
+    def count_shared_spectra(self, other):
+        """
+        Counts the spectra shared by every pair of clusters of the two tables.
+
+        :param other: The other SpectrumClusterTable
+        :return: A dict with (cluster id, other cluster id) as key and the number of shared spectra as value
+        """
+        counts = dict()
+
+        for cluster_index, other_cluster_index in self.join(other):
+            pairs, pair_counts = numpy.unique(numpy.stack([cluster_index, other_cluster_index]), axis=1,
+                                              return_counts=True)
+
+            for (index, other_index), count in zip(pairs.T.tolist(), pair_counts.tolist()):
+                counts[(index, other_index)] = counts.get((index, other_index), 0) + count
+
+        return dict([((str(self.cluster_ids[index]), str(other.cluster_ids[other_index])), count)
+                     for (index, other_index), count in counts.items()])
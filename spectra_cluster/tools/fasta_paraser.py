@@ -2,8 +2,12 @@
 fasta_parser provides the FastaParser class. It allows one to iterate
 over all entries within a FASTA file. Fasta entries are available through
 the FastaEntry class.
+
+FASTA files may also be compressed (see spectra_cluster.compression).
 """
 
+from spectra_cluster import compression
+
 
 class FastaParser:
     """
@@ -19,7 +23,7 @@ class FastaParser:
 
         :yield: FastaEntry objects
         """
-        with open(self.fasta_filename, "r") as in_file:
+        with compression.open_file(self.fasta_filename, "rt") as in_file:
             current_header = None
             current_sequence = list()
 
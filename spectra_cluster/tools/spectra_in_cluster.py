@@ -19,7 +19,8 @@ import os
 
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
-from spectra_cluster import clustering_parser
+from spectra_cluster.analyser.spectra_in_cluster import SpectraInClusterExporter
+from spectra_cluster.analyser.common import process_clustering_file
 
 
 def main():
@@ -35,16 +36,13 @@ def main():
         print("Error: Output file '" + output_file + "' exists.")
         sys.exit(1)
 
-    parser = clustering_parser.ClusteringParser(clustering_file)
-
     print("Processing " + clustering_file + "...")
 
     with open(output_file, "w") as OUT:
-        OUT.write("cluster_id\tspectrum_title\n")
+        analyser = SpectraInClusterExporter(OUT)
+        analyser.write_header()
 
-        for cluster in parser:
-            for spec_ref in cluster.get_spectra():
-                OUT.write(cluster.id + "\t" + spec_ref.get_title() + "\n")
+        process_clustering_file(clustering_file, analyser)
 
     print("Results written to '" + output_file + "'.")
 
@@ -9,7 +9,7 @@ Usage:
   cluster_features_cli.py --input=<results.clustering> --output=<features.txt>
                        [--min_size=<size>] [--min_ratio=<ratio>]
                        [--min_identified=<spectra>] [--max_identified=<spectra>] 
-                       [--output_matrix]
+                       [--output_matrix] [--processes=<n>]
   cluster_features_cli.py (--help | --version)
 
 Options:
@@ -23,6 +23,7 @@ Options:
   --output_matrix                      If set, the resulting file will only contain a matrix, with the first column
                                        as the cluster id, the second column the sample id, and the third column the
                                        number of spectra.
+  --processes=<n>                      Number of processes to use to parse the .clustering file [default: 1]
   -h, --help                           Print this help message.
   -v, --version                        Print the current version.
 """
@@ -35,6 +36,7 @@ from docopt import docopt
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
 from spectra_cluster.analyser.cluster_features import ClusterAsFeatures
+from spectra_cluster.analyser.common import process_clustering_file
 import spectra_cluster.clustering_parser as clustering_parser
 
 
@@ -78,18 +80,26 @@ def main():
         # create the id transferer based on the settings
         analyser = create_analyser(arguments, OUT)
 
-        # process all clusters
-        parser = clustering_parser.ClusteringParser(arguments["--input"])
-
-        print("Parsing input .clustering file...", end="", flush=True)
-        processed_clusters = 0
-        for cluster in parser:
-            analyser.process_cluster(cluster)
+        processes = int(arguments["--processes"])
 
-            processed_clusters += 1
-            if processed_clusters == 1000:
-                print(".", end="", flush=True)
-                processed_clusters = 0
+        # process all clusters
+        if processes > 1:
+            print("Parsing input .clustering file using " + str(processes) + " processes...")
+            process_clustering_file(arguments["--input"], analyser, processes=processes)
+        else:
+            parser = clustering_parser.ClusteringParser(arguments["--input"])
+
+            print("Parsing input .clustering file...", end="", flush=True)
+            processed_clusters = 0
+            for cluster in parser:
+                analyser.process_cluster(cluster)
+
+                processed_clusters += 1
+                if processed_clusters == 1000:
+                    print(".", end="", flush=True)
+                    processed_clusters = 0
+
+            analyser.finalize()
 
     # add the header to the output file
     print("Adding header line...")
@@ -20,6 +20,7 @@ Options:
 
 import sys
 import os
+import numpy
 from docopt import docopt
 
 # make the spectra_cluster packages available
@@ -146,14 +147,17 @@ def process_cluster(cluster):
 
     # max consensus peak tic
     try:
-        if sum(cluster.consensus_intens) > 0:
-            rel_max_intens = max(cluster.consensus_intens) / sum(cluster.consensus_intens)
+        consensus_intens = numpy.asarray(cluster.consensus_intens)
+        total_intens = float(numpy.sum(consensus_intens))
+
+        if total_intens > 0:
+            rel_max_intens = float(numpy.max(consensus_intens)) / total_intens
         else:
             rel_max_intens = 0
         result_fields.append(str(rel_max_intens))
         # max consensus peak m/z
-        max_peak_index = max(range(len(cluster.consensus_intens)), key=cluster.consensus_intens.__getitem__)
-        result_fields.append(str(cluster.consensus_mz[max_peak_index]))
+        max_peak_index = int(numpy.argmax(consensus_intens))
+        result_fields.append(str(float(cluster.consensus_mz[max_peak_index])))
     except ValueError:
         print("Error: Failed to process consensus spectrum of cluster " + cluster.id)
         sys.exit(1)
@@ -18,6 +18,7 @@ Options:
 
 import os
 import sys
+import tempfile
 
 import networkx as nx
 from docopt import docopt
@@ -28,57 +29,42 @@ from py2cytoscape.data.style import StyleUtil
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
 import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.spectrum_cluster_table as spectrum_cluster_table
 from spectra_cluster.objects import Cluster
 
 
-def load_spectra_to_cluster(result_file: str, before_cluster_id : str = None):
-    """
-    Creates a dict holding the spectra ids as keys and the cluster ids the spectrum belongs to as
-    value.
-    :param result_file: Path to the .clustering file to process
-    :param before_cluster_id: If set this string is prepended to every cluster id.
-    :return: A dict with the spectrum id as key and the cluster id as value
-    """
-    parser = clustering_parser.ClusteringParser(result_file)
-
-    spec_to_cluster = dict()
-
-    for cluster in parser:
-        for spectrum in cluster.get_spectra():
-            if before_cluster_id is not None:
-                spec_to_cluster[spectrum.get_id()] = before_cluster_id + cluster.id
-            else:
-                spec_to_cluster[spectrum.get_id()] = cluster.id
-
-    return spec_to_cluster
-
-
-def build_network(spectra_to_cluster_1: dict, spectra_to_cluster_2: dict, source1: str, source2: str):
+def build_network_from_tables(table_1: spectrum_cluster_table.SpectrumClusterTable,
+                              table_2: spectrum_cluster_table.SpectrumClusterTable, source1: str, source2: str,
+                              label1: str = "", label2: str = ""):
     """
     Builds a network with cluster's as nodes joined together by spectra
-    shared by both clusters
-    :param spectra_to_cluster_1: Spectrum id -> cluster id dict
-    :param spectra_to_cluster_2: Spectrum id -> cluster id dict
+    shared by both clusters. Only clusters with at least one spectrum
+    are added as nodes. The spectra are not loaded into memory.
+
+    Spectra are matched through their id or, if their title does not
+    contain an id, their complete title (see spectrum_cluster_table.get_spectrum_key).
+    A spectrum that is part of multiple clusters of one result connects
+    all of these clusters.
+    :param table_1: SpectrumClusterTable of the first result
+    :param table_2: SpectrumClusterTable of the second result
     :param source1: Name of source 1
     :param source2: Name of source 2
+    :param label1: This string is prepended to every cluster id of the first result
+    :param label2: This string is prepended to every cluster id of the second result
     :return: The networkx object representing this network
     """
     graph = nx.Graph()
 
     # add all clusters as nodes
-    graph.add_nodes_from(set(spectra_to_cluster_1.values()), source="source1", source_label=source1)
-    graph.add_nodes_from(set(spectra_to_cluster_2.values()), source="source2", source_label=source2)
+    for table, label, source, source_label in ((table_1, label1, "source1", source1),
+                                               (table_2, label2, "source2", source2)):
+        cluster_ids = table.cluster_ids[table.get_cluster_sizes() > 0]
+        graph.add_nodes_from([label + cluster_id for cluster_id in cluster_ids.tolist()],
+                             source=source, source_label=source_label)
 
     # add the edges
-    for spec_id_1 in spectra_to_cluster_1.keys():
-        if spec_id_1 in spectra_to_cluster_2:
-            cluster_1 = spectra_to_cluster_1[spec_id_1]
-            cluster_2 = spectra_to_cluster_2[spec_id_1]
-
-            try:
-                graph.edges[cluster_1, cluster_2]["weight"] += 1
-            except KeyError:
-                graph.add_edge(cluster_1, cluster_2, weight=1)
+    for (cluster_1, cluster_2), n_shared in table_1.count_shared_spectra(table_2).items():
+        graph.add_edge(label1 + cluster_1, label2 + cluster_2, weight=n_shared)
 
     return graph
 
@@ -220,18 +206,22 @@ def main():
     label1 = os.path.basename(result_file_1).replace(".clustering", "_")
     label2 = os.path.basename(result_file_2).replace(".clustering", "_")
 
-    # load the spectra to cluster information
-    print("Loading data from " + result_file_1 + "...")
-    spectra_to_cluster_1 = load_spectra_to_cluster(result_file_1, before_cluster_id=label1)
-    print("  " + str(len(spectra_to_cluster_1)) + " spectra loaded")
+    # the spectra to cluster information is stored on disk
+    with tempfile.TemporaryDirectory() as table_dir:
+        print("Loading data from " + result_file_1 + "...")
+        table_1 = spectrum_cluster_table.build_from_clustering_file(result_file_1, os.path.join(table_dir, "1"))
+        print("  " + str(len(table_1)) + " spectra loaded")
+
+        print("Loading data from " + result_file_2 + "...")
+        table_2 = spectrum_cluster_table.build_from_clustering_file(result_file_2, os.path.join(table_dir, "2"))
+        print("  " + str(len(table_2)) + " spectra loaded")
 
-    print("Loading data from " + result_file_2 + "...")
-    spectra_to_cluster_2 = load_spectra_to_cluster(result_file_2, before_cluster_id=label2)
-    print("  " + str(len(spectra_to_cluster_2)) + " spectra loaded")
+        # build the network
+        network = build_network_from_tables(table_1, table_2, source1=os.path.basename(result_file_1),
+                                            source2=os.path.basename(result_file_2), label1=label1, label2=label2)
 
-    # build the network
-    network = build_network(spectra_to_cluster_1, spectra_to_cluster_2, source1=os.path.basename(result_file_1),
-                            source2=os.path.basename(result_file_2))
+        table_1.close()
+        table_2.close()
 
     print("Created network with " + str(len(network.nodes)) + " nodes and " + str(len(network.edges)) + " edges")
 
@@ -28,6 +28,8 @@ import sys
 import pickle
 from docopt import docopt
 from spectra_cluster import clustering_parser
+from spectra_cluster import compression
+from spectra_cluster import clustering_cache
 
 
 # This list is used to make sure that additional parameters
@@ -46,6 +48,10 @@ class MgfFile:
     Represents an MGF file that can be indexed. This class does not
     represent the actual content of an MGF file but only supports
     random retrieval of spectra
+
+    The MGF file may be compressed (see spectra_cluster.compression). Random
+    access is only efficient for uncompressed and BGZF compressed files. For
+    BGZF files the index holds virtual offsets.
     """
     def __init__(self, filename):
         """
@@ -71,6 +77,8 @@ class MgfFile:
         if spec_index < 1:
             raise Exception("MGF spectrum indices are 1-based")
 
+        offset = None
+
         # get the offset
         if self.index:
             if spec_index > len(self.index):
@@ -79,13 +87,13 @@ class MgfFile:
                                 str(spec_index))
             offset = self.index[spec_index - 1]
         else:
-            with open(self.filename, "r") as reader:
+            with compression.open_file(self.filename, "rb", seekable=True) as reader:
                 cur_offset = reader.tell()
                 cur_spec = 0
                 cur_line = reader.readline()
 
                 while cur_line:
-                    if cur_line[:10] == "BEGIN IONS":
+                    if cur_line[:10] == b"BEGIN IONS":
                         cur_spec += 1
 
                     cur_line = reader.readline()
@@ -98,33 +106,49 @@ class MgfFile:
                     # line in non-indexed MGF files
                     cur_offset = reader.tell()
 
-        if not offset:
+        if offset is None:
             raise Exception("Failed to find spectrum " + str(spec_index) + " in " + os.path.basename(self.filename))
 
-        with open(self.filename, "r") as reader:
+        with compression.open_file(self.filename, "rb", seekable=True) as reader:
             reader.seek(offset)
             spec_lines = list()
             line = reader.readline()
 
             while line:
-                spec_lines.append(line)
-                if line[:8] == "END IONS":
+                spec_lines.append(_decode_line(line))
+                if line[:8] == b"END IONS":
                     return spec_lines
 
                 line = reader.readline()
 
 
+def _decode_line(line):
+    """
+    Converts a line read in binary mode to a string with Unix line endings.
+
+    :param line: The line as bytes
+    :return: The line as string
+    """
+    line = line.decode()
+
+    if line.endswith("\r\n"):
+        line = line[:-2] + "\n"
+
+    return line
+
+
 def extract_clusters(cluster_ids, clustering_file):
-    parser = clustering_parser.ClusteringParser(clustering_file)
-    clusters = list()
+    """
+    Loads the clusters with the defined ids from the .clustering file. The file's
+    index is used to load the clusters directly and created if it does not exist.
 
-    for cluster in parser:
-        if cluster.id in cluster_ids:
-            clusters.append(cluster)
-        if len(clusters) == len(cluster_ids):
-            break
+    :param cluster_ids: List of cluster ids to load
+    :param clustering_file: Path to the .clustering file
+    :return: A list of Cluster objects
+    """
+    parser = clustering_parser.ClusteringParser(clustering_file)
 
-    return clusters
+    return parser.get_clusters(cluster_ids)
 
 
 def get_spectra_per_file(cluster):
@@ -173,13 +197,14 @@ def build_mgf_indices(mgf_files):
         # create the index
         index = list()
 
-        with open(mgf_file, "r") as reader:
+        # the offsets of BGZF compressed files are virtual offsets
+        with compression.open_file(mgf_file, "rb", seekable=True) as reader:
             cur_offset = reader.tell()
             cur_line = reader.readline()
 
             while cur_line:
                 # simply store the start of a spectrum
-                if cur_line[:10] == "BEGIN IONS":
+                if cur_line[:10] == b"BEGIN IONS":
                     index.append(cur_offset)
 
                 cur_offset = reader.tell()
@@ -201,8 +226,9 @@ def write_consensus_spectrum(cluster, mgf_file):
         writer.write("PEPMASS=" + str(cluster.precursor_mz) + "\n")
         writer.write("CHARGE=" + str(cluster.charge) + "+\n")
 
-        for i in range(0, len(cluster.consensus_mz)):
-            writer.write(str(cluster.consensus_mz[i]) + " " + str(cluster.consensus_intens[i]) + "\n")
+        # the float32 values of cached clusters are converted first to not write their full float64 expansion
+        writer.writelines(map("{} {}\n".format, clustering_cache.peaks_to_float64(cluster.consensus_mz).tolist(),
+                              clustering_cache.peaks_to_float64(cluster.consensus_intens).tolist()))
 
         writer.write("END IONS\n\n")
 
@@ -257,9 +283,11 @@ def main():
             # check the directories whether they contain the file
             complete_name = None
 
+            # the MGF file may also be compressed
             for peak_dir in peak_dirs:
-                if os.path.isfile(os.path.join(peak_dir, mgf_filename)):
-                    complete_name = os.path.join(peak_dir, mgf_filename)
+                complete_name = compression.find_file(os.path.join(peak_dir, mgf_filename))
+
+                if complete_name is not None:
                     break
 
             if complete_name is None:
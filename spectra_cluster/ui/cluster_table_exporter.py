@@ -0,0 +1,56 @@
+"""cluster_table_exporter
+
+Converts a .clustering file into a columnar table of NumPy arrays. The table contains
+the basic properties of every cluster (id, precursor m/z, charge, size, number of
+identified / unidentified spectra, max ratio, and I/L agnostic max ratio) as well as of
+every spectrum (cluster index, precursor m/z, charge, similarity score, and filename).
+
+If the output path ends with ".npz", the table is stored as a single .npz file. Otherwise,
+a directory is created containing one .npy file per column. These files can be memory
+mapped when the table is loaded using spectra_cluster.cluster_table.load.
+
+Usage:
+  cluster_table_exporter --input=<results.clustering> --output=<table> [--processes=<n>]
+  cluster_table_exporter (--help | --usage)
+
+Options:
+  -i, --input=<clustering file>   Path to the .clustering result file to process.
+  -o, --output=<table>            Path to the .npz file or the directory to create.
+  --processes=<n>                 Number of processes to use to parse the .clustering file [default: 1]
+  -h, --help                      Show this help message.
+  --usage                         Show usage information
+"""
+
+import os
+import sys
+from docopt import docopt
+
+# make the spectra_cluster packages available
+sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
+
+from spectra_cluster import cluster_table
+
+
+def main():
+    args = docopt(__doc__)
+
+    input_file = args["--input"]
+    output_path = args["--output"]
+
+    if not os.path.isfile(input_file):
+        print("Error: Cannot find input file '" + input_file + "'")
+        sys.exit(1)
+
+    if os.path.exists(output_path):
+        print("Error: Output file exists")
+        sys.exit(1)
+
+    print("Processing " + input_file + "...")
+    table = cluster_table.convert_clustering_file(input_file, processes=int(args["--processes"]))
+    table.save(output_path)
+
+    print("Table of " + str(len(table)) + " clusters written to " + output_path)
+
+
+if __name__ == "__main__":
+    main()
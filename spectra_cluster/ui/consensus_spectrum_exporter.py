@@ -6,9 +6,9 @@ format.
 Usage:
   consensus_spectrum_exporter.py --input=<results.clustering> --output=<spectra.mgf> [--format=<MGF>]
                        [--min_size=<size>] [--max_size=<size>] [--min_ratio=<ratio>] [--max_ratio=<ratio>]
-                       [--min_identified=<spectra>] [--max_identified=<spectra>]
+                       [--min_identified=<spectra>] [--max_identified=<spectra>] [--processes=<n>]
   consensus_spectrum_exporter.py --cluster_ids=<ids.txt> --input=<results.clustering> --output=<spectra.mgf>
-                                 [--format=<MGF>]
+                                 [--format=<MGF>] [--processes=<n>]
   consensus_spectrum_exporter.py (--help | --version)
 
 Options:
@@ -27,6 +27,7 @@ Options:
   --max_ratio=<ratio>                  The maximum ratio a cluster must have to be reported.
   --min_identified=<spectra>           May specify the minimum number of identified spectra a cluster must have.
   --max_identified=<spectra>           May specify the maximum number of identified spectra a cluster must have.
+  --processes=<n>                      Number of processes to use to parse the .clustering file [default: 1]
   -h, --help                           Print this help message.
   -v, --version                        Print the current version.
 """
@@ -39,7 +40,7 @@ from docopt import docopt
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
 from spectra_cluster.analyser.exporter.mgf_exporter import MgfExporter
-import spectra_cluster.clustering_parser as clustering_parser
+from spectra_cluster.analyser.common import process_clustering_file
 
 
 def create_analyser(arguments, output_file, set_params=True):
@@ -102,19 +103,17 @@ def main():
 
     with open(arguments["--output"], "w") as OUT:
         # create the id transferer based on the settings
-        analyser = create_analyser(arguments, OUT)
+        analyser = create_analyser(arguments, OUT, set_params=cluster_ids is None)
 
-        # process all clusters
-        parser = clustering_parser.ClusteringParser(arguments["--input"])
+        # the parser skips all other clusters without creating them
+        if cluster_ids is not None:
+            analyser.selected_cluster_ids = set(cluster_ids)
 
         print("Parsing input .clustering file...")
-        for cluster in parser:
-            # filter based on cluster ids if set
-            if cluster_ids is not None:
-                if cluster.id not in cluster_ids:
-                    continue
 
-            analyser.process_cluster(cluster)
+        # the exporter only uses cluster-level properties
+        process_clustering_file(arguments["--input"], analyser, processes=int(arguments["--processes"]),
+                                lazy=True)
 
     print("Results written to " + arguments["--output"])
 
@@ -9,6 +9,9 @@ it is possible to specify the minimum number of identified spectra a cluster mus
 
 The tool then writes out all spectra references from the clusters that match the criteria
 together with the most common peptide identification (PSM) of the respective cluster.
+Results are written while the .clustering file is processed. Therefore, the memory usage
+does not depend on the size of the .clustering file. If a FASTA file is supplied, only the
+unique peptides are kept in memory until they are mapped to their proteins.
 
 Usage:
   id_transferer_cli.py --input=<results.clustering> --output=<identifications.txt>
@@ -17,7 +20,7 @@ Usage:
                        [--min_size=<size>] [--min_ratio=<ratio>]
                        [--min_identified=<spectra>]
                        [(--only_identified | --only_unidentified)]
-                       [--return_all_identified]
+                       [--return_all_identified] [--processes=<n>]
   id_transferer_cli.py (--help | --version)
 
 Options:
@@ -41,12 +44,15 @@ Options:
                                        cluster they are present. Additionally, if this option is set together with
                                        the --only_unidentified option, all originally identified spectra are returned
                                        unchanged.
+  --processes=<n>                      Number of processes to use to parse the .clustering file [default: 1]
   -h, --help                           Print this help message.
   -v, --version                        Print the current version.
 """
 
 import sys
 import os
+import tempfile
+import contextlib
 from docopt import docopt
 from maspy_resources import peptide_mapping
 
@@ -54,7 +60,7 @@ from maspy_resources import peptide_mapping
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
 import spectra_cluster.analyser.id_transferer as id_transferer
-import spectra_cluster.clustering_parser as clustering_parser
+from spectra_cluster.analyser.common import process_clustering_file
 
 
 def create_analyser(arguments):
@@ -83,6 +89,72 @@ def create_analyser(arguments):
     return analyser
 
 
+def get_header(moff_compatible=False, with_proteins=False):
+    """
+    Returns the header line of the result file.
+
+    :param moff_compatible: If set, the "Modest Feature Finder" compatible header is returned.
+    :param with_proteins: If set, the "protein" column is added to the (standard) header
+    :return: The header line including the trailing newline
+    """
+    if moff_compatible:
+        return "peptide\tprot\tmod_peptide\trt\tmz\tmass\tcharge\tfilename\tchanged_by_clustering\n"
+
+    if with_proteins:
+        return "filename\tspec_id\tsequence\tchanged_by_clustering\tprotein\n"
+
+    return "filename\tspec_id\tsequence\tchanged_by_clustering\n"
+
+
+def get_result_fields(id_ref, moff_compatible=False):
+    """
+    Returns the fields of the identification reference's result line
+    without the protein column.
+
+    :param id_ref: The identification reference
+    :param moff_compatible: If set, the "Modest Feature Finder" compatible fields are returned.
+    :return: A list of strings
+    """
+    changed_by_clustering = "false"
+    if id_ref.changed_through_clustering:
+        changed_by_clustering = "true"
+
+    if not moff_compatible:
+        psm_string = ";".join([str(p) for p in id_ref.psms])
+
+        return [id_ref.filename, id_ref.spec_id, psm_string, changed_by_clustering]
+
+    # only report the first PSM
+    psm = id_ref.psms[0]
+
+    rt = id_ref.spectrum.get_property("RT")
+    if rt is None:
+        raise Exception("Missing retention time information for spectrum object. "
+                        "Please cluster your data with the spectra-cluster-cli tool "
+                        "version >= 1.0.4")
+
+    return [psm.sequence, str(psm), rt, str(id_ref.spectrum.precursor_mz), str(id_ref.spectrum.get_mass()),
+            str(id_ref.spectrum.charge), str(id_ref.spectrum.get_filename()), changed_by_clustering]
+
+
+def add_protein_field(fields, sequence, peptide_mappings, moff_compatible=False):
+    """
+    Adds the proteins the sequence maps to as protein column to
+    the result line's fields.
+
+    :param fields: The fields as returned by get_result_fields
+    :param sequence: The (first) sequence of the identification reference
+    :param peptide_mappings: Mappings of peptides to proteins (dict with peptide sequence as key)
+    :param moff_compatible: If set, the fields are in the "Modest Feature Finder" compatible format.
+    """
+    proteins = list(peptide_mappings[sequence]) if sequence in peptide_mappings else list()
+    proteins.sort()
+
+    # the MoFF format has the protein column in second place
+    position = 1 if moff_compatible else len(fields)
+    fields.insert(position, ";".join(proteins))
+
+
 def write_results(identification_references, peptide_mappings, output_filename):
     """
     Writes the identification references as a tab delimited text file
@@ -93,26 +165,13 @@ def write_results(identification_references, peptide_mappings, output_filename):
     :param output_filename: Path to the output filename
     """
     with open(output_filename, "w") as writer:
-        if peptide_mappings is not None:
-            writer.write("filename\tspec_id\tsequence\tchanged_by_clustering\tprotein\n")
-        else:
-            writer.write("filename\tspec_id\tsequence\tchanged_by_clustering\n")
+        writer.write(get_header(with_proteins=peptide_mappings is not None))
 
         for id_ref in identification_references:
-            psm_string = ";".join([str(p) for p in id_ref.psms])
-
-            changed_by_clustering = "false"
-            if id_ref.changed_through_clustering:
-                changed_by_clustering = "true"
-
-            fields = [id_ref.filename, id_ref.spec_id, psm_string, changed_by_clustering]
+            fields = get_result_fields(id_ref)
 
             if peptide_mappings is not None:
-                sequence = id_ref.psms[0].sequence
-                proteins = peptide_mappings[sequence] if sequence in peptide_mappings else ""
-                sorted_proteins = list(proteins)
-                sorted_proteins.sort()
-                fields.append(";".join(sorted_proteins))
+                add_protein_field(fields, id_ref.psms[0].sequence, peptide_mappings)
 
             writer.write("\t".join(fields) + "\n")
 
@@ -127,50 +186,94 @@ def write_moff_results(identification_references, peptide_mappings, output_filen
     :param output_filename: Path to the output filename
     """
     with open(output_filename, "w") as writer:
-        writer.write("peptide\tprot\tmod_peptide\trt\tmz\tmass\tcharge\tfilename\tchanged_by_clustering\n")
+        writer.write(get_header(moff_compatible=True))
 
         for id_ref in identification_references:
-            fields = list()
+            fields = get_result_fields(id_ref, moff_compatible=True)
+            add_protein_field(fields, id_ref.psms[0].sequence, peptide_mappings or dict(), moff_compatible=True)
 
-            # only report the first PSM
-            psm = id_ref.psms[0]
-            fields.append(psm.sequence)
+            writer.write("\t".join(fields) + "\n")
 
-            # protein mapping
-            if peptide_mappings is not None and psm.sequence in peptide_mappings:
-                proteins = list(peptide_mappings[psm.sequence])
-                proteins.sort()
 
-                fields.append(";".join(proteins))
-            else:
-                fields.append("")
+@contextlib.contextmanager
+def open_result_writer(output_file, moff_compatible=False, fasta_file=None):
+    """
+    Creates a sink for the IdTransferer that writes every identification
+    reference as soon as it is created. Thereby, the references are not
+    kept in memory.
+
+    If a FASTA file is set, the results are first written to a temporary
+    file while the unique peptides are collected. The unique peptides are
+    kept in memory since they are mapped to their proteins at once. Once the
+    sink is closed, the protein column is added in a second pass over the
+    temporary file.
+
+    :param output_file: Path to the result file
+    :param moff_compatible: If set, the output is "Modest Feature Finder" compatible
+    :param fasta_file: If set, the peptides are mapped to the proteins in this FASTA file
+    :return: A context manager returning the sink function
+    """
+    if fasta_file is None:
+        with open(output_file, "w") as writer:
+            writer.write(get_header(moff_compatible=moff_compatible))
 
-            mod_peptide_string = str(psm)
-            fields.append(mod_peptide_string)
+            def write_reference(id_ref):
+                fields = get_result_fields(id_ref, moff_compatible=moff_compatible)
 
-            rt = id_ref.spectrum.get_property("RT")
-            if rt is None:
-                raise Exception("Missing retention time information for spectrum object. "
-                                "Please cluster your data with the spectra-cluster-cli tool "
-                                "version >= 1.0.4")
+                if moff_compatible:
+                    add_protein_field(fields, id_ref.psms[0].sequence, dict(), moff_compatible=True)
 
-            fields.append(rt)
+                writer.write("\t".join(fields) + "\n")
 
-            fields.append(str(id_ref.spectrum.precursor_mz))
+            yield write_reference
 
-            fields.append(str(id_ref.spectrum.get_mass()))
+        return
 
-            fields.append(str(id_ref.spectrum.charge))
+    all_peptides = set()
 
-            fields.append(str(id_ref.spectrum.get_filename()))
+    with tempfile.TemporaryFile(mode="w+") as temp_file:
+        def spill_reference(id_ref):
+            for psm in id_ref.psms:
+                all_peptides.add(psm.sequence)
 
-            changed_by_clustering = "false"
-            if id_ref.changed_through_clustering:
-                changed_by_clustering = "true"
+            # the first sequence is stored in front of the fields to add the proteins later
+            fields = [id_ref.psms[0].sequence] + get_result_fields(id_ref, moff_compatible=moff_compatible)
+            temp_file.write("\t".join(fields) + "\n")
 
-            fields.append(changed_by_clustering)
+        yield spill_reference
 
-            writer.write("\t".join(fields) + "\n")
+        print("Doing protein inference...")
+        peptide_mappings = peptide_mapping.the_magic_mapping_function(all_peptides, fasta_file)
+        all_peptides.clear()
+
+        temp_file.seek(0)
+
+        with open(output_file, "w") as writer:
+            writer.write(get_header(moff_compatible=moff_compatible, with_proteins=True))
+
+            for line in temp_file:
+                sequence, line = line.rstrip("\n").split("\t", 1)
+                fields = line.split("\t")
+
+                add_protein_field(fields, sequence, peptide_mappings, moff_compatible=moff_compatible)
+                writer.write("\t".join(fields) + "\n")
+
+
+def transfer_ids(input_file, analyser, output_file, moff_compatible=False, fasta_file=None, processes=1):
+    """
+    Processes the .clustering file and writes every identification reference
+    as soon as it is created (see open_result_writer).
+
+    :param input_file: Path to the .clustering file
+    :param analyser: The IdTransferer to use
+    :param output_file: Path to the result file
+    :param moff_compatible: If set, the output is "Modest Feature Finder" compatible
+    :param fasta_file: If set, the peptides are mapped to the proteins in this FASTA file
+    :param processes: Number of processes to use to parse the .clustering file
+    """
+    with open_result_writer(output_file, moff_compatible=moff_compatible, fasta_file=fasta_file) as sink:
+        analyser.sink = sink
+        process_clustering_file(input_file, analyser, processes=processes)
 
 
 def main():
@@ -202,34 +305,10 @@ def main():
     # create the id transferer based on the settings
     analyser = create_analyser(arguments)
 
-    # process all clusters
-    parser = clustering_parser.ClusteringParser(input_file)
-
+    # process all clusters and write the results
     print("Parsing input .clustering file...")
-    for cluster in parser:
-        analyser.process_cluster(cluster)
-
-    # perform protein inference
-    if fasta_file is not None:
-        print("Doing protein inference...")
-        all_peptides = set()
-        for id_ref in analyser.identification_references:
-            for psm in id_ref.psms:
-                all_peptides.add(psm.sequence)
-
-        peptide_mappings = peptide_mapping.the_magic_mapping_function(all_peptides, fasta_file)
-    else:
-        peptide_mappings = None
-
-    # create the output file
-    if arguments["--moff_compatible"]:
-        write_moff_results(identification_references=analyser.identification_references,
-                           peptide_mappings=peptide_mappings,
-                           output_filename=output_file)
-    else:
-        write_results(identification_references=analyser.identification_references,
-                      peptide_mappings=peptide_mappings,
-                      output_filename=output_file)
+    transfer_ids(input_file, analyser, output_file, moff_compatible=arguments["--moff_compatible"],
+                 fasta_file=fasta_file, processes=int(arguments["--processes"]))
 
     print("Results written to " + output_file)
 
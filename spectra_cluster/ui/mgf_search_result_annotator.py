@@ -50,6 +50,7 @@ import operator
 import os
 from pyteomics import mzid
 from spectra_cluster import objects
+from spectra_cluster import compression
 
 
 csv.field_size_limit(sys.maxsize)
@@ -414,7 +415,7 @@ def create_title_to_index_dict(mgf_filename):
     :return: A dict with the spectra' titles as keys and their 0-based index as value.
     """
     title_to_index = dict()
-    with open(mgf_filename, "r") as mgf_file:
+    with compression.open_file(mgf_filename, "rt") as mgf_file:
         current_spec_index = 0
         for line in mgf_file:
             # ignore non-title lines
@@ -476,7 +477,7 @@ def write_annotated_mgf(input_mgf, sequence_dictionary, ptm_dictionary, output_m
     :param output_mgf: The path to write the newly created MGF file to.
     """
     with open(output_mgf, "w") as output_file:
-        with open(input_mgf, "r") as mgf_file:
+        with compression.open_file(input_mgf, "rt") as mgf_file:
 
             current_spec_index = 0
 
@@ -0,0 +1,123 @@
+"""peptide_finder
+
+Lists all clusters that contain spectra identified as the specified peptides. The tool uses
+an inverted peptide index which is created during the first run and stored next to the
+.clustering file (".pepindex" extension). Subsequent queries do not require parsing the
+.clustering file again.
+
+Peptides may either be passed directly or in a text file containing one peptide per line.
+Modifications and lower case letters are ignored.
+
+The result is written as a tab-delimited table containing the peptide, the cluster's id,
+the number of spectra identified as the peptide, and the cluster's total number of spectra.
+
+Usage:
+  peptide_finder --input=<results.clustering> [--output=<clusters.tsv>] [--ignore_il] [--rebuild]
+                 [--peptides=<peptides.txt>] [PEPTIDE...]
+  peptide_finder (--help | --usage)
+
+Options:
+  -i, --input=<clustering file>   Path to the .clustering result file to search.
+  -o, --output=<clusters.tsv>     Path to the result file. If not set, the result is written to
+                                  the standard output.
+  -p, --peptides=<peptides.txt>   Text file containing one peptide per line.
+  --ignore_il                     If set, I and L are treated as the same amino acid.
+  --rebuild                       If set, the peptide index is always re-created.
+  -h, --help                      Show this help message.
+  --usage                         Show usage information
+"""
+
+import os
+import sys
+from docopt import docopt
+
+# make the spectra_cluster packages available
+sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
+
+from spectra_cluster import clustering_parser
+
+
+def read_peptides(peptide_file):
+    """
+    Reads the peptides from a text file containing one peptide per line.
+
+    :param peptide_file: Path to the file
+    :return: A list of peptides
+    """
+    with open(peptide_file, "r") as reader:
+        return [line.strip() for line in reader if len(line.strip()) > 0]
+
+
+def find_peptides(peptide_index, peptides, ignore_il=False):
+    """
+    Looks up the clusters of all peptides.
+
+    :param peptide_index: The PeptideIndex to use
+    :param peptides: A list of peptides
+    :param ignore_il: If set, I and L are treated as the same amino acid
+    :return: A list of (peptide, cluster id, n spectra, cluster size) tuples
+    """
+    cluster_sizes = dict(zip(peptide_index.cluster_ids, peptide_index.cluster_sizes))
+    results = list()
+
+    for peptide in peptides:
+        for cluster_id, n_spectra in peptide_index.get_clusters(peptide, ignore_il=ignore_il).items():
+            results.append((peptide, cluster_id, n_spectra, cluster_sizes[cluster_id]))
+
+    return results
+
+
+def write_results(results, writer):
+    """
+    Writes the results as a tab-delimited table.
+
+    :param results: The results as returned by find_peptides
+    :param writer: The file object to write to
+    """
+    writer.write("peptide\tcluster_id\tpeptide_spectra\tcluster_spectra\n")
+
+    for result in results:
+        writer.write("\t".join([str(value) for value in result]) + "\n")
+
+
+def main():
+    args = docopt(__doc__)
+
+    input_file = args["--input"]
+    output_file = args["--output"]
+
+    if not os.path.isfile(input_file):
+        print("Error: Cannot find input file '" + input_file + "'")
+        sys.exit(1)
+
+    if output_file is not None and os.path.isfile(output_file):
+        print("Error: Output file exists")
+        sys.exit(1)
+
+    peptides = list(args["PEPTIDE"])
+
+    if args["--peptides"] is not None:
+        if not os.path.isfile(args["--peptides"]):
+            print("Error: Cannot find peptide file '" + args["--peptides"] + "'")
+            sys.exit(1)
+
+        peptides += read_peptides(args["--peptides"])
+
+    if len(peptides) < 1:
+        print("Error: No peptides specified")
+        sys.exit(1)
+
+    peptide_index = clustering_parser.ClusteringParser(input_file).get_peptide_index(rebuild=args["--rebuild"])
+    results = find_peptides(peptide_index, peptides, ignore_il=args["--ignore_il"])
+
+    if output_file is None:
+        write_results(results, sys.stdout)
+    else:
+        with open(output_file, "w") as writer:
+            write_results(results, writer)
+
+        print("Results written to " + output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""pipeline_cli
+
+Runs several analyses on a .clustering file while only parsing the file once. Every
+analysis is enabled by specifying its output file. The output files are identical to
+the ones created by the respective tools (cluster_features_cli, consensus_spectrum_exporter,
+id_transferer_cli, clustering_stats, and spectra_in_cluster).
+
+The cluster filters (--min_size, --min_ratio, --min_identified) are applied to the cluster
+features, consensus spectra, and identification transfer analyses. If they are not set,
+every analysis uses the default values of its respective tool.
+
+Usage:
+  pipeline_cli.py --input=<results.clustering>
+                  [--features=<features.tsv>] [--consensus_spectra=<spectra.mgf>]
+                  [--identifications=<identifications.tsv>] [--fasta=<species.fasta>]
+                  [--stats=<stats.tsv>] [--stats_min_size=<3>]
+                  [--spectra_in_cluster=<spectra_in_cluster.tsv>]
+                  [--min_size=<size>] [--min_ratio=<ratio>] [--min_identified=<spectra>]
+                  [--processes=<n>]
+  pipeline_cli.py (--help | --version)
+
+Options:
+  -i, --input=<clustering file>                  Path to the .clustering result file to process.
+  --features=<features.tsv>                      Create the cluster features table (see cluster_features_cli).
+  --consensus_spectra=<spectra.mgf>              Export the consensus spectra as MGF file (see
+                                                 consensus_spectrum_exporter).
+  --identifications=<identifications.tsv>        Transfer the identifications to all spectra (see id_transferer_cli).
+  --fasta=<species.fasta>                        If set, the peptides of the transferred identifications are
+                                                 mapped to the proteins in the FASTA file.
+  --stats=<stats.tsv>                            Create the clustering statistics (see clustering_stats).
+  --stats_min_size=<3>                           The minimum size a cluster must have to be evaluated for
+                                                 the clustering statistics [default: 3]
+  --spectra_in_cluster=<spectra_in_cluster.tsv>  Create the cluster id to spectrum table (see spectra_in_cluster).
+  --min_size=<size>                              The minimum size of a cluster to be reported.
+  --min_ratio=<ratio>                            The minimum ratio a cluster must have to be reported.
+  --min_identified=<spectra>                     The minimum number of identified spectra a cluster must have.
+  --processes=<n>                                Number of processes to use to parse the .clustering file
+                                                 [default: 1]
+  -h, --help                                     Print this help message.
+  -v, --version                                  Print the current version.
+"""
+
+import sys
+import os
+import contextlib
+from docopt import docopt
+
+# make the spectra_cluster packages available
+sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
+
+from spectra_cluster.analyser.pipeline import AnalyserPipeline
+from spectra_cluster.analyser.cluster_features import ClusterAsFeatures
+from spectra_cluster.analyser.exporter.mgf_exporter import MgfExporter
+from spectra_cluster.analyser.id_transferer import IdTransferer
+from spectra_cluster.analyser.clustering_stats import ClusteringStatsAnalyser
+from spectra_cluster.analyser.spectra_in_cluster import SpectraInClusterExporter
+from spectra_cluster.ui import clustering_stats
+
+OUTPUT_OPTIONS = ["--features", "--consensus_spectra", "--identifications", "--stats", "--spectra_in_cluster"]
+
+
+def set_filters(arguments, analyser):
+    """
+    Sets the analyser's cluster filters based on the command line
+    parameters. Filters that were not set are not changed.
+
+    :param arguments: The command line parameters
+    :param analyser: The analyser to adapt
+    """
+    if arguments["--min_size"] is not None:
+        analyser.min_size = int(arguments["--min_size"])
+    if arguments["--min_ratio"] is not None:
+        analyser.min_ratio = float(arguments["--min_ratio"])
+    if arguments["--min_identified"] is not None:
+        analyser.min_identified_spectra = int(arguments["--min_identified"])
+
+
+def create_pipeline(arguments, output_files):
+    """
+    Creates the AnalyserPipeline based on the command line parameters.
+
+    :param arguments: The command line parameters
+    :param output_files: A dict with the output option as key and the opened file object as value. The
+                         identifications are written through the sink of the id_transferer_cli.
+    :return: The AnalyserPipeline object
+    """
+    analysers = list()
+
+    if "--features" in output_files:
+        analyser = ClusterAsFeatures(output_files["--features"])
+        set_filters(arguments, analyser)
+        analysers.append(analyser)
+
+    if "--consensus_spectra" in output_files:
+        analyser = MgfExporter(output_files["--consensus_spectra"])
+        set_filters(arguments, analyser)
+        analysers.append(analyser)
+
+    if "--identifications" in output_files:
+        # same defaults as the id_transferer_cli
+        analyser = IdTransferer(True, True, False, sink=output_files["--identifications"])
+        analyser.min_size = 5
+        analyser.min_ratio = 0.7
+        set_filters(arguments, analyser)
+        analysers.append(analyser)
+
+    if arguments["--stats"] is not None:
+        analysers.append(ClusteringStatsAnalyser(min_identified_size=int(arguments["--stats_min_size"])))
+
+    if "--spectra_in_cluster" in output_files:
+        analyser = SpectraInClusterExporter(output_files["--spectra_in_cluster"])
+        analyser.write_header()
+        analysers.append(analyser)
+
+    return AnalyserPipeline(analysers)
+
+
+def main():
+    """
+    Primary entry function for the CLI.
+    """
+    arguments = docopt(__doc__, version='pipeline_cli 1.0 BETA')
+
+    input_file = arguments["--input"]
+
+    # make sure the input file exists
+    if not os.path.isfile(input_file):
+        print("Error: Cannot find input file '" + input_file + "'")
+        sys.exit(1)
+
+    output_options = [option for option in OUTPUT_OPTIONS if arguments[option] is not None]
+
+    if len(output_options) < 1:
+        print("Error: No analysis selected")
+        sys.exit(1)
+
+    # make sure the output files do not exist
+    for option in output_options:
+        if os.path.isfile(arguments[option]):
+            print("Error: Output file exists '" + arguments[option] + "'")
+            sys.exit(1)
+
+    if arguments["--fasta"] is not None and not os.path.isfile(arguments["--fasta"]):
+        print("Error: Cannot find FASTA file '" + arguments["--fasta"] + "'")
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        # the file based analysers write their results directly
+        output_files = dict()
+        for option in ("--features", "--consensus_spectra", "--spectra_in_cluster"):
+            if arguments[option] is not None:
+                output_files[option] = stack.enter_context(open(arguments[option], "w"))
+
+        if arguments["--identifications"] is not None:
+            # only import the id_transferer_cli if needed since it requires additional libraries
+            from spectra_cluster.ui import id_transferer_cli
+
+            # the identifications are written by the same sink as used by the id_transferer_cli
+            output_files["--identifications"] = stack.enter_context(
+                id_transferer_cli.open_result_writer(arguments["--identifications"], fasta_file=arguments["--fasta"]))
+
+        pipeline = create_pipeline(arguments, output_files)
+
+        print("Running " + str(len(pipeline.analysers)) + " analyses on " + input_file + "...")
+        pipeline.run(input_file, processes=int(arguments["--processes"]))
+
+    # write the remaining results
+    for analyser in pipeline.analysers:
+        if isinstance(analyser, ClusterAsFeatures):
+            analyser.add_resultfile_header(arguments["--features"])
+        elif isinstance(analyser, ClusteringStatsAnalyser):
+            clustering_stats.write_statistics([analyser.get_statistics(input_file)], arguments["--stats"])
+
+    for option in output_options:
+        print("Results written to " + arguments[option])
+
+
+if __name__ == "__main__":
+    main()
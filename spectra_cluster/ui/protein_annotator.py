@@ -29,12 +29,12 @@ import sys
 import os
 import csv
 from docopt import docopt
-import re
 
 # make the spectra_cluster packages available
 sys.path.insert(0, os.path.abspath('..') + os.path.sep + "..")
 
 from spectra_cluster.tools import fasta_paraser
+from spectra_cluster import sequences
 
 
 def extract_separator(user_separator):
@@ -70,7 +70,7 @@ def load_peptides(input_file, peptide_column, column_separator):
                 raise Exception("Specified peptide column '" + peptide_column + "' not found in input file.")
 
             sequence = row[peptide_column]
-            clean_sequence = re.sub("[^A-Z]", "", sequence)
+            clean_sequence = sequences.clean_sequence(sequence, upper_case=False)
             peptides.add(clean_sequence)
 
         return peptides
@@ -98,7 +98,7 @@ def map_peptides_to_proteins(peptides, fasta_filename, ignore_il=False):
         for sequence in peptides:
             # replace all I with L if defined
             if ignore_il:
-                comparison_sequence = sequence.replace("I", "L")
+                comparison_sequence = sequences.fold_il(sequence)
             else:
                 comparison_sequence = sequence
 
@@ -152,7 +152,7 @@ def write_extended_file(input_filename, output_filename, peptides_to_protein, co
                     # get the peptide string
                     fields = line.split(column_separator)
                     sequence = fields[peptide_index]
-                    clean_sequence = re.sub("[^A-Z]", "", sequence)
+                    clean_sequence = sequences.clean_sequence(sequence, upper_case=False)
 
                     # write the original line
                     output_file.write(line + column_separator)
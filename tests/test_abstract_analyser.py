@@ -0,0 +1,147 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.clustering_parser as clustering_parser
+from spectra_cluster.analyser.common import process_clustering_file
+from spectra_cluster.analyser.pipeline import AnalyserPipeline
+from spectra_cluster.analyser.clustering_stats import ClusteringStatsAnalyser
+from spectra_cluster.analyser.spectra_in_cluster import SpectraInClusterExporter
+from spectra_cluster.analyser.id_transferer import IdTransferer
+
+
+class AbstractAnalyserTest(unittest.TestCase):
+    """
+    Test case for the filter functions of the AbstractAnalyser
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.clusters = list(clustering_parser.ClusteringParser(self.testfile))
+
+    def test_cluster_mask(self):
+        filters = ({"min_size": 5}, {"max_size": 2}, {"min_ratio": 0.7}, {"max_ratio": 0.5},
+                   {"min_identified_spectra": 3, "max_unidentified_spectra": 0},
+                   {"max_identified_spectra": 2, "max_unidentified_spectra": 1})
+
+        for settings in filters:
+            analyser = IdTransferer()
+
+            for name, value in settings.items():
+                setattr(analyser, name, value)
+
+            mask = analyser.get_clusters_mask(self.clusters)
+            expected = [not analyser._ignore_cluster(cluster) for cluster in self.clusters]
+
+            self.assertEqual(expected, mask.tolist())
+            self.assertTrue(0 < numpy.sum(mask) < len(self.clusters))
+
+        # the maximum filters are not applied to upper bounds
+        analyser = IdTransferer()
+        analyser.min_size = 2
+        analyser.max_size = 3
+
+        self.assertEqual([False, True, True, False], analyser.get_cluster_mask([1, 2, 3, 4]).tolist())
+        self.assertEqual([False, True, True, True], analyser.get_cluster_mask([1, 2, 3, 4], upper_bounds=True).tolist())
+
+    def test_precursor_and_id_filters(self):
+        analyser = IdTransferer()
+        analyser.min_precursor_mz = 400
+        analyser.max_precursor_mz = 600
+        analyser.selected_cluster_ids = set([cluster.id for cluster in self.clusters[0:100]])
+
+        mask = analyser.get_clusters_mask(self.clusters)
+        expected = [not analyser._ignore_cluster(cluster) for cluster in self.clusters]
+
+        # the cluster ids are not tested by the mask
+        selected = [cluster.id in analyser.selected_cluster_ids for cluster in self.clusters]
+        self.assertEqual(expected, (mask & selected).tolist())
+        self.assertTrue(0 < numpy.sum(expected) < 100)
+
+    def test_cluster_filter(self):
+        analyser = IdTransferer()
+        self.assertIsNone(analyser.get_cluster_filter())
+
+        analyser.min_size = 5
+        analyser.min_precursor_mz = 400
+        cluster_filter = analyser.get_cluster_filter()
+
+        self.assertEqual(5, cluster_filter.min_size)
+        self.assertIsNone(cluster_filter.max_size)
+        self.assertEqual(400, cluster_filter.min_precursor_mz)
+
+        # analysers that process all clusters must not filter
+        self.assertIsNone(IdTransferer(include_all_identified=True).get_cluster_filter())
+        self.assertIsNone(ClusteringStatsAnalyser().get_cluster_filter())
+        self.assertIsNone(AnalyserPipeline([analyser, IdTransferer()]).get_cluster_filter())
+
+        other_analyser = IdTransferer()
+        other_analyser.min_size = 3
+        self.assertEqual(3, AnalyserPipeline([analyser, other_analyser]).get_cluster_filter().min_size)
+
+    def test_filter_pushdown(self):
+        results = list()
+
+        for use_filter in (False, True):
+            with tempfile.TemporaryFile(mode="w+") as result_file:
+                analyser = SpectraInClusterExporter(result_file)
+                analyser.min_size = 5
+                analyser.max_precursor_mz = 600
+                analyser.selected_cluster_ids = set([cluster.id for cluster in self.clusters[0:500]])
+
+                if use_filter:
+                    process_clustering_file(self.testfile, analyser)
+                else:
+                    for cluster in self.clusters:
+                        analyser.process_cluster(cluster)
+
+                result_file.seek(0)
+                results.append(result_file.read())
+
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(len(results[0]) > 0)
+
+    def test_custom_masks(self):
+        analyser = IdTransferer(include_all_identified=True)
+        analyser.min_size = 5
+        stats = ClusteringStatsAnalyser()
+        stats.min_size = 5
+        other_analyser = IdTransferer()
+        other_analyser.min_size = 1000
+
+        self.assertTrue(numpy.all(analyser.get_clusters_mask(self.clusters)))
+        self.assertTrue(numpy.all(stats.get_clusters_mask(self.clusters)))
+        self.assertFalse(numpy.any(other_analyser.get_clusters_mask(self.clusters)))
+
+        pipeline = AnalyserPipeline([analyser, other_analyser])
+        self.assertTrue(numpy.all(pipeline.get_clusters_mask(self.clusters)))
+
+    def test_use_cache(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            clustering_file = os.path.join(temp_dir, "test.clustering")
+            shutil.copy(self.testfile, clustering_file)
+
+            results = list()
+
+            for use_cache in (False, True):
+                with tempfile.TemporaryFile(mode="w+") as result_file:
+                    analyser = SpectraInClusterExporter(result_file)
+                    analyser.min_size = 5
+                    analyser.min_ratio = 0.7
+                    process_clustering_file(clustering_file, analyser, use_cache=use_cache)
+
+                    result_file.seek(0)
+                    results.append(result_file.read())
+
+            self.assertEqual(results[0], results[1])
+            self.assertTrue(len(results[0]) > 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
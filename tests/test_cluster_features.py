@@ -5,6 +5,7 @@ import tempfile
 sys.path.insert(0, os.path.abspath('..'))
 import spectra_cluster.analyser.cluster_features as cluster_features
 import spectra_cluster.clustering_parser as clustering_parser
+from spectra_cluster.analyser.common import process_clustering_file
 
 
 class ClusterAsFeaturesTest(unittest.TestCase):
@@ -78,6 +79,29 @@ class ClusterAsFeaturesTest(unittest.TestCase):
 
         self.assertEqual(838, total_lines)
 
+    def testParallelClusterAsFeatures(self):
+        for save_coo in (False, True):
+            results = list()
+
+            for processes in (1, 3):
+                result_file = tempfile.TemporaryFile(mode="w+")
+                analyser = cluster_features.ClusterAsFeatures(
+                    result_file=result_file,
+                    sample_name_extractor=ClusterAsFeaturesTest.extract_filename,
+                    save_coo=save_coo)
+
+                process_clustering_file(self.testfile, analyser, processes=processes)
+
+                result_file.seek(0)
+                results.append((analyser.sample_ids, result_file.read()))
+                result_file.close()
+
+            self.assertEqual(results[0], results[1])
+
+    @staticmethod
+    def extract_filename(spectrum):
+        return spectrum.get_filename()
+
     @staticmethod
     def pride_project_extractor(spectrum):
         filename = spectrum.get_filename()
@@ -1,9 +1,12 @@
 import os
 import sys
 import unittest
+import shutil
+import tempfile
 
 sys.path.insert(0, os.path.abspath('..'))
 import spectra_cluster.ui.cluster_result_comparator as rc
+import spectra_cluster.spectrum_cluster_table as spectrum_cluster_table
 
 
 class ClusterAsFeaturesTest(unittest.TestCase):
@@ -11,23 +14,24 @@ class ClusterAsFeaturesTest(unittest.TestCase):
         self.testfile1 = os.path.join(os.path.dirname(__file__), "testfiles", "kuester_test_short.clustering")
         self.testfile2 = os.path.join(os.path.dirname(__file__), "testfiles", "kuester_test_short_adapted.clustering")
 
-    def testLoadSpectra(self):
-        spec1 = rc.load_spectra_to_cluster(self.testfile1)
+    def testBuildNetworkFromTables(self):
+        table_dir = tempfile.mkdtemp()
 
-        self.assertEqual(10, len(spec1))
+        try:
+            table1 = spectrum_cluster_table.build_from_clustering_file(self.testfile1, os.path.join(table_dir, "1"))
+            table2 = spectrum_cluster_table.build_from_clustering_file(self.testfile2, os.path.join(table_dir, "2"))
 
-        # only one cluster should be loaded
-        for cluster_id in spec1.values():
-            self.assertEqual("7549a1a6-8307-45a5-b351-16182d2daa82", cluster_id)
+            graph = rc.build_network_from_tables(table1, table2, source1="t1", source2="t2", label1="t1",
+                                                 label2="t2")
 
-    def testBuildNetwork(self):
-        spec1 = rc.load_spectra_to_cluster(self.testfile1, before_cluster_id="t1")
-        spec2 = rc.load_spectra_to_cluster(self.testfile2, before_cluster_id="t2")
-
-        graph = rc.build_network(spec1, spec2, source1="t1", source2="t2")
+            table1.close()
+            table2.close()
+        finally:
+            shutil.rmtree(table_dir)
 
         self.assertEqual(2, len(graph.nodes))
         self.assertEqual(1, len(graph.edges))
+        self.assertTrue("t17549a1a6-8307-45a5-b351-16182d2daa82" in graph.nodes)
 
         for e in graph.edges:
             self.assertEqual(10, graph.edges[e]["weight"])
@@ -37,9 +41,38 @@ class ClusterAsFeaturesTest(unittest.TestCase):
 
         # make sure the node properties worked
         for node in graph.nodes:
-            self.assertTrue("source" in graph.node[node])
-            self.assertEqual(10, graph.node[node]["size"])
-            if graph.node[node]["source"] == "source1":
-                self.assertEqual("7549a1a6-8307-45a5-b351-16182d2daa82", graph.node[node]["id"])
+            self.assertTrue("source" in graph.nodes[node])
+            self.assertEqual(10, graph.nodes[node]["size"])
+            if graph.nodes[node]["source"] == "source1":
+                self.assertEqual("7549a1a6-8307-45a5-b351-16182d2daa82", graph.nodes[node]["id"])
             else:
-                self.assertEqual("8549a1a6-8307-45a5-b351-16182d2daa82", graph.node[node]["id"])
\ No newline at end of file
+                self.assertEqual("8549a1a6-8307-45a5-b351-16182d2daa82", graph.nodes[node]["id"])
+
+    def testBuildNetworkNodes(self):
+        table_dir = tempfile.mkdtemp()
+
+        try:
+            builder = spectrum_cluster_table.SpectrumClusterTableBuilder(os.path.join(table_dir, "1"))
+            builder.add_cluster("A", ["index=1", "Spectrum without id"])
+            builder.add_cluster("Empty", [])
+            table1 = builder.close()
+
+            builder = spectrum_cluster_table.SpectrumClusterTableBuilder(os.path.join(table_dir, "2"))
+            builder.add_cluster("B", ["index=1", "Spectrum without id"])
+            builder.add_cluster("C", ["Another spectrum without id"])
+            table2 = builder.close()
+
+            graph = rc.build_network_from_tables(table1, table2, source1="t1", source2="t2", label1="t1",
+                                                 label2="t2")
+
+            table1.close()
+            table2.close()
+        finally:
+            shutil.rmtree(table_dir)
+
+        # clusters without spectra are not added
+        self.assertEqual(["t1A", "t2B", "t2C"], sorted(graph.nodes))
+
+        # spectra without an id are matched through their title
+        self.assertEqual([("t1A", "t2B")], list(graph.edges))
+        self.assertEqual(2, graph.edges["t1A", "t2B"]["weight"])
@@ -1,8 +1,11 @@
 import unittest
 import os
 import sys
+import tempfile
+import numpy
 sys.path.insert(0, os.path.abspath('..'))
 import spectra_cluster.ui.cluster_spectra_extractor as cluster_spectra_extractor
+import spectra_cluster.objects as objects
 import pickle
 
 
@@ -33,3 +36,21 @@ class ClusterSpectraExtractorTest(unittest.TestCase):
 
         os.remove(index_file)
         # TODO: test append_spectra_to_file with and without index
+
+    def test_write_consensus_spectrum(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mgf_file = os.path.join(temp_dir, "consensus.mgf")
+
+            # float64 values are written unchanged, float32 values (of cached clusters) without artefacts
+            for dtype, expected_peaks in ((numpy.float64, ["70.061234 38.55", "1250.12345678 118.4"]),
+                                          (numpy.float32, ["70.06123 38.55", "1250.1234 118.4"])):
+                cluster = objects.Cluster("cluster1", 400.1, numpy.array([70.061234, 1250.12345678], dtype=dtype),
+                                          numpy.array([38.55, 118.40], dtype=dtype), [])
+                cluster_spectra_extractor.write_consensus_spectrum(cluster, mgf_file)
+
+                with open(mgf_file, "r") as reader:
+                    lines = reader.read().splitlines()
+
+                self.assertEqual("TITLE=Consensus;cluster_id=cluster1", lines[1])
+                self.assertEqual(expected_peaks, lines[4:6])
+                self.assertEqual("END IONS", lines[6])
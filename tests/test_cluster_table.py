@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import tempfile
+import numpy
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.cluster_table as cluster_table
+import spectra_cluster.analyser.common as common
+
+
+class ClusterTableTest(unittest.TestCase):
+    """
+    Test case for the ClusterTable class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.clusters = list(clustering_parser.ClusteringParser(self.testfile))
+
+    def test_convert(self):
+        table = cluster_table.convert_clustering_file(self.testfile)
+
+        self.assertEqual(838, len(table))
+        self.assertEqual([c.id for c in self.clusters], list(table.cluster_ids))
+        self.assertEqual([c.n_spectra for c in self.clusters], list(table.n_spectra))
+        self.assertEqual(sum([c.n_spectra for c in self.clusters]), len(table.spectrum_precursor_mz))
+
+        cluster = self.clusters[2]
+        self.assertAlmostEqual(cluster.precursor_mz, table.precursor_mz[2])
+        self.assertEqual(cluster.identified_spectra, table.identified_spectra[2])
+        self.assertAlmostEqual(cluster.max_il_ratio, table.max_il_ratio[2], places=5)
+
+        spectra = cluster.get_spectra()
+        spectrum_mask = table.spectrum_cluster_index == 2
+        self.assertEqual(len(spectra), numpy.sum(spectrum_mask))
+        self.assertEqual(set([s.get_filename() for s in spectra]),
+                         set(table.get_spectrum_filenames()[spectrum_mask]))
+
+        # clusters without identifications have a ratio of NaN
+        unidentified = [i for i, c in enumerate(self.clusters) if c.max_il_ratio is None]
+        self.assertTrue(numpy.all(numpy.isnan(table.max_il_ratio[unidentified])))
+
+    def test_parallel_convert(self):
+        table = cluster_table.convert_clustering_file(self.testfile)
+        parallel_table = cluster_table.convert_clustering_file(self.testfile, processes=3)
+
+        self.assertEqual(list(table.cluster_ids), list(parallel_table.cluster_ids))
+        self.assertTrue(numpy.array_equal(table.spectrum_cluster_index, parallel_table.spectrum_cluster_index))
+        self.assertTrue(numpy.array_equal(table.get_spectrum_filenames(), parallel_table.get_spectrum_filenames()))
+
+    def test_mask(self):
+        table = cluster_table.convert_clustering_file(self.testfile)
+        mask = table.get_cluster_mask(min_size=5, min_ratio=0.7)
+
+        self.assertEqual([c.id for c in self.clusters if c.n_spectra >= 5 and c.max_il_ratio is not None and
+                          c.max_il_ratio >= 0.7],
+                         list(table.cluster_ids[mask]))
+        self.assertEqual(numpy.sum(table.n_spectra[mask]), numpy.sum(table.get_spectrum_mask(mask)))
+
+    def test_analyser_mask(self):
+        table = cluster_table.convert_clustering_file(self.testfile)
+
+        analyser = common.AbstractAnalyser()
+        analyser.min_size = 3
+        analyser.max_unidentified_spectra = 2
+        analyser.max_precursor_mz = 600
+
+        self.assertEqual([c.id for c in self.clusters if not analyser._ignore_cluster(c)],
+                         list(table.cluster_ids[table.get_analyser_mask(analyser)]))
+
+    def test_missing_precursor_mz(self):
+        with open(self.testfile, "r") as reader:
+            lines = reader.readlines()
+
+        # remove the precursor m/z of the first cluster
+        first_index = [i for i, line in enumerate(lines) if line.startswith("av_precursor_mz=")][0]
+        del lines[first_index]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "test.clustering")
+
+            with open(filename, "w") as writer:
+                writer.writelines(lines)
+
+            table = cluster_table.convert_clustering_file(filename)
+
+        self.assertEqual(838, len(table))
+        self.assertTrue(numpy.isnan(table.precursor_mz[0]))
+        self.assertFalse(numpy.any(numpy.isnan(table.precursor_mz[1:])))
+
+        # clusters without a precursor m/z never pass a precursor m/z filter
+        self.assertFalse(table.get_cluster_mask(min_precursor_mz=0)[0])
+        self.assertTrue(table.get_cluster_mask()[0])
+
+    def test_save_load(self):
+        table = cluster_table.convert_clustering_file(self.testfile)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for path in (os.path.join(temp_dir, "table.npz"), os.path.join(temp_dir, "table")):
+                table.save(path)
+                loaded_table = cluster_table.load(path)
+
+                for column, values in table.get_columns().items():
+                    self.assertTrue(numpy.array_equal(values, getattr(loaded_table, column),
+                                                      equal_nan=values.dtype.kind == "f"))
+
+            self.assertIsInstance(cluster_table.load(os.path.join(temp_dir, "table")).precursor_mz, numpy.memmap)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.clustering_cache as clustering_cache
+
+
+class ClusteringCacheTest(unittest.TestCase):
+    """
+    Test case for the ClusteringCache class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.clusters = list(clustering_parser.ClusteringParser(self.testfile))
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_read(self):
+        cache_file = clustering_cache.write_cache(self.testfile, os.path.join(self.temp_dir, "test.clustercache"))
+
+        with clustering_cache.ClusteringCache(cache_file) as cache:
+            self.assertEqual("GreedyClustering_0.99", cache.header.name)
+            self.assertEqual(len(self.clusters), len(cache))
+            self.assertTrue(cache.is_up_to_date(self.testfile))
+
+            for cluster, cached_cluster in zip(self.clusters, cache):
+                self.assertEqual(cluster.id, cached_cluster.id)
+                self.assertEqual(cluster.precursor_mz, cached_cluster.precursor_mz)
+                self.assertEqual(cluster.precursor_intens, cached_cluster.precursor_intens)
+                self.assertIsNone(cached_cluster.consensus_counts)
+                self.assertEqual(cluster.n_spectra, cached_cluster.n_spectra)
+                self.assertEqual(cluster.max_il_ratio, cached_cluster.max_il_ratio)
+                self.assertEqual(set(cluster.get_spectra()), set(cached_cluster.get_spectra()))
+
+                # consensus peaks are stored as float32
+                self.assertEqual(len(cluster.consensus_mz), len(cached_cluster.consensus_mz))
+                for mz, cached_mz in zip(cluster.consensus_mz, cached_cluster.consensus_mz):
+                    # the test file contains NaN values
+                    if mz == mz:
+                        self.assertAlmostEqual(mz, cached_mz, places=3)
+
+            cluster = cache.get_cluster(self.clusters[10].id)
+            self.assertEqual(self.clusters[10].id, cluster.id)
+            self.assertEqual(self.clusters[-1].id, cache[-1].id)
+            self.assertIsNone(cache.get_cluster("missing"))
+
+    def test_duplicate_spectra(self):
+        # the second SPEC line only differs in the number format and PTM order
+        spec_lines = ["SPEC\t#file=a.mgf#id=index=1#title=Spectrum 1\ttrue\tPEPTIDEK\t400.1\t2\t9606\t"
+                      "1-MOD:00719,3-MOD:00046\t0.9",
+                      "SPEC\t#file=a.mgf#id=index=1#title=Spectrum 1\ttrue\tPEPTIDEK\t400.10\t2.0\t9606\t"
+                      "3-MOD:00046,1-MOD:00719\t0.8",
+                      "SPEC\t#file=a.mgf#id=index=2#title=Spectrum 2\ttrue\t\t400.1\t2\t\t\t0.5"]
+        clustering_file = os.path.join(self.temp_dir, "duplicates.clustering")
+
+        with open(clustering_file, "w") as writer:
+            writer.write("name=test\n\n=Cluster=\nid=cluster1\nav_precursor_mz=400.1\n"
+                         "sequence=[PEPTIDEK:5]\nconsensus_mz=100.0,200.0\nconsensus_intens=1.0,2.0\n"
+                         "consensus_count=3,1\n" + "\n".join(spec_lines) + "\n")
+
+        cluster = list(clustering_parser.ClusteringParser(clustering_file, parse_consensus_counts=True))[0]
+
+        with clustering_cache.open_cache(clustering_file, use_sequence_summary=True,
+                                         parse_consensus_counts=True) as cache:
+            cached_cluster = cache[0]
+
+            self.assertEqual(2, cluster.n_spectra)
+            self.assertEqual(cluster.n_spectra, cached_cluster.n_spectra)
+            self.assertEqual({"n_spectra": [2], "identified_spectra": [1]},
+                             {key: list(value) for key, value in cache.get_cluster_stats().items()
+                              if key in ("n_spectra", "identified_spectra")})
+            self.assertEqual(list(cluster.consensus_counts), list(cached_cluster.consensus_counts))
+            self.assertEqual({"PEPTIDEK": 5}, cached_cluster.sequence_counts)
+
+        # the options only affect the created clusters, not the cache file
+        with clustering_cache.open_cache(clustering_file) as cache:
+            self.assertIsNone(cache[0].consensus_counts)
+            self.assertEqual({"PEPTIDEK": 1}, cache[0].sequence_counts)
+
+    def test_precursor_index(self):
+        with clustering_cache.open_cache(self.testfile, os.path.join(self.temp_dir, "test.clustercache")) as cache:
+            precursor_index = cache.get_precursor_index()
+            self.assertEqual(len(self.clusters), len(precursor_index))
+
+            for target in (400, 550.5, 700):
+                expected = [c.id for c in self.clusters if abs(c.precursor_mz - target) <= 0.5 and c.charge == 2]
+                positions = precursor_index.query_precursor(target, 0.5, charge=2)
+
+                self.assertEqual(set(expected), set([cache[int(position)].id for position in positions]))
+
+    def test_open_cache(self):
+        clustering_file = os.path.join(self.temp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+
+        cache = clustering_cache.open_cache(clustering_file)
+        self.assertTrue(os.path.isfile(clustering_file + ".clustercache"))
+        self.assertEqual(len(self.clusters), len(cache))
+        cache.close()
+
+        # outdated caches are re-created
+        with open(clustering_file, "r") as reader:
+            lines = reader.readlines()
+        with open(clustering_file, "w") as writer:
+            writer.writelines(lines[:lines.index("=Cluster=\n", 100)])
+
+        with clustering_cache.open_cache(clustering_file) as cache:
+            self.assertTrue(len(cache) < len(self.clusters))
+            self.assertTrue(cache.is_up_to_date(clustering_file))
+
+    def test_rebuild_invalid_cache(self):
+        clustering_file = os.path.join(self.temp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+        cache_file = clustering_file + ".clustercache"
+
+        clustering_cache.open_cache(clustering_file).close()
+
+        with open(cache_file, "rb") as reader:
+            content = reader.read()
+
+        # truncated, empty, and unsupported cache files are re-created
+        for invalid_content in (content[:len(content) // 2], b"", content[:8] + b"\xff" + content[9:]):
+            with open(cache_file, "wb") as writer:
+                writer.write(invalid_content)
+
+            with clustering_cache.open_cache(clustering_file) as cache:
+                self.assertEqual(len(self.clusters), len(cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 import os
 import sys
+import shutil
+import tempfile
 sys.path.insert(0, os.path.abspath('..'))
 import spectra_cluster.clustering_parser as clustering_parser
 
@@ -31,6 +33,31 @@ class ClusteringParserTest(unittest.TestCase):
 
         self.assertEqual("1-MOD:1234", str(ptms[0]))
 
+    def test_parse_ptm_tags(self):
+        ptms = clustering_parser.ClusteringParser._parse_ptms(
+            "0-[PSI-MS, MS:1001524, fragment neutral loss, 63.998283],3-MOD:00425")
+
+        self.assertEqual(2, len(ptms))
+        self.assertEqual("[PSI-MS,MS:1001524,fragment neutral loss,63.998283]", ptms[0].accession)
+        self.assertEqual(3, ptms[1].position)
+
+    def test_ptm_warnings(self):
+        clustering_parser.parse_warnings.reset()
+
+        for i in range(3):
+            ptms = clustering_parser.ClusteringParser._parse_ptms("1-MOD:1234,X-MOD:1,CHEMMOD:12-MOD:2,a=4-MOD:3")
+
+            self.assertEqual([(1, "MOD:1234"), (4, "MOD:3")], [(ptm.position, ptm.accession) for ptm in ptms])
+
+        # every occurrence is counted although the parsed PTMs are cached
+        self.assertEqual(3, clustering_parser.parse_warnings.counts["Ignoring invalid PTM definition"])
+        self.assertEqual("X-MOD:1", clustering_parser.parse_warnings.examples["Ignoring invalid PTM definition"])
+        self.assertEqual(3, clustering_parser.parse_warnings.counts["Ignoring CHEMMOD PTM"])
+
+        warnings = clustering_parser.parse_warnings.pop()
+        self.assertEqual(6, len(warnings))
+        self.assertEqual(0, len(clustering_parser.parse_warnings))
+
     def test_parse_spec_line(self):
         spectrum = clustering_parser.ClusteringParser._parse_spec_line(self.spec_line)
 
@@ -49,6 +76,12 @@ class ClusteringParserTest(unittest.TestCase):
         spectrum_copy = clustering_parser.ClusteringParser._parse_spec_line(self.spec_line)
         self.assertEqual(spectrum, spectrum_copy)
 
+        # the PSMs of identical identifications are shared
+        self.assertIs(list(spectrum.psms)[0], list(spectrum_copy.psms)[0])
+
+        self.assertRaises(Exception, clustering_parser.ClusteringParser._parse_spec_line,
+                          "SPEC\ttitle\ttrue\tPEPTIDE,PEPTIDEK\t382.149\t2\t\t\t0.0")
+
         self.assertEqual("<Spectrum @ 382.149 m/z 2.0+ with 1 PSMs>", str(spectrum))
 
     def test_parse_clustering_file(self):
@@ -141,6 +174,366 @@ class ClusteringParserTest(unittest.TestCase):
         self.assertEqual(13, all_clusters[26].n_spectra)
         self.assertEqual(5, all_clusters[26].identified_spectra)
 
+    def test_get_cluster(self):
+        # work on a copy since the index is stored next to the file
+        tmp_dir = tempfile.mkdtemp()
+        clustering_file = os.path.join(tmp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+
+        try:
+            parser = clustering_parser.ClusteringParser(clustering_file)
+
+            cluster = parser.get_cluster("9a582e74-e8b1-451d-a007-cadc362aa2ce")
+            self.assertTrue(os.path.isfile(clustering_file + ".pyindex"))
+            self.assertEqual("9a582e74-e8b1-451d-a007-cadc362aa2ce", cluster.id)
+            self.assertEqual(382.149, cluster.precursor_mz)
+            self.assertEqual(3, cluster.n_spectra)
+            self.assertEqual(2/3, cluster.max_ratio)
+
+            self.assertIsNone(parser.get_cluster("missing"))
+
+            # the index must be loaded from the file
+            index = clustering_parser.ClusteringParser(clustering_file).get_index()
+            self.assertEqual(838, len(index))
+            self.assertEqual(2, index["1cc813a1-4e75-4c1d-99aa-752312fbe554"].n_spectra)
+            self.assertEqual(359.155, index["1cc813a1-4e75-4c1d-99aa-752312fbe554"].precursor_mz)
+            self.assertFalse("missing" in index)
+            self.assertRaises(KeyError, lambda: index["missing"])
+
+            # all clusters must be identical to the sequentially parsed ones
+            all_clusters = list(parser)
+            self.assertEqual([c.id for c in all_clusters], [entry.cluster_id for entry in index])
+            loaded_clusters = parser.get_clusters([c.id for c in reversed(all_clusters)])
+            self.assertEqual(838, len(loaded_clusters))
+
+            for cluster, loaded_cluster in zip(reversed(all_clusters), loaded_clusters):
+                self.assertEqual(cluster.id, loaded_cluster.id)
+                # some consensus spectra contain NaN values
+                self.assertEqual(str(cluster.consensus_mz), str(loaded_cluster.consensus_mz))
+                self.assertEqual(set(cluster.get_spectra()), set(loaded_cluster.get_spectra()))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_query_precursor(self):
+        tmp_dir = tempfile.mkdtemp()
+        clustering_file = os.path.join(tmp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+
+        try:
+            clusters = list(clustering_parser.ClusteringParser(clustering_file))
+            parser = clustering_parser.ClusteringParser(clustering_file)
+
+            self.assertEqual(["9a582e74-e8b1-451d-a007-cadc362aa2ce"], parser.query_precursor(382.149, 0.0001))
+            self.assertEqual([], parser.query_precursor(382.149, 0.0001, charge=3))
+
+            targets = [400, 550.5, 700, 1000]
+            charges = [None, 2, 3, 2]
+            results = parser.query_precursor(targets, 0.5, charges)
+            self.assertEqual(len(targets), len(results))
+
+            for target, charge, result in zip(targets, charges, results):
+                expected = [c.id for c in clusters if abs(c.precursor_mz - target) <= 0.5 and
+                            (charge is None or c.charge == charge)]
+                self.assertEqual(set(expected), set(result))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_peptide_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        clustering_file = os.path.join(tmp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+
+        try:
+            clusters = list(clustering_parser.ClusteringParser(clustering_file))
+            peptide_index = clustering_parser.ClusteringParser(clustering_file).get_peptide_index()
+            self.assertTrue(os.path.isfile(clustering_file + ".pepindex"))
+            self.assertEqual(len(clusters), len(peptide_index.cluster_ids))
+
+            # the index must be loaded from the file
+            peptide_index = clustering_parser.ClusteringParser(clustering_file).get_peptide_index()
+            self.assertTrue(peptide_index.is_up_to_date())
+
+            for sequence in ("MEGIGLK", "LTGMAFR", "ALDDMISTLK"):
+                self.assertTrue(sequence in peptide_index)
+
+                for ignore_il in (False, True):
+                    expected = dict()
+                    target = sequence.replace("I", "L") if ignore_il else sequence
+
+                    for cluster in clusters:
+                        n_spectra = 0
+                        for spectrum in cluster.get_spectra():
+                            spectrum_sequences = spectrum.get_clean_sequences()
+                            if ignore_il:
+                                spectrum_sequences = set([s.replace("I", "L") for s in spectrum_sequences])
+                            if target in spectrum_sequences:
+                                n_spectra += 1
+
+                        if n_spectra > 0:
+                            expected[cluster.id] = n_spectra
+
+                    self.assertEqual(expected, peptide_index.get_clusters(sequence, ignore_il=ignore_il))
+
+            self.assertEqual(dict(), peptide_index.get_clusters("MISSING"))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_corrupt_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        clustering_file = os.path.join(tmp_dir, "test.clustering")
+        shutil.copy(self.testfile, clustering_file)
+
+        try:
+            parser = clustering_parser.ClusteringParser(clustering_file)
+            parser.get_index()
+            parser.get_peptide_index()
+
+            for extension in (".pyindex", ".pepindex"):
+                index_file = clustering_file + extension
+                index_size = os.path.getsize(index_file)
+
+                with open(index_file, "rb") as reader:
+                    content = reader.read()
+
+                # truncated files, random bytes, and other pickled objects
+                for corrupt_content in (content[:len(content) // 2], b"", b"not a pickle", b"\x80\x03K\x01."):
+                    with open(index_file, "wb") as writer:
+                        writer.write(corrupt_content)
+
+                    parser = clustering_parser.ClusteringParser(clustering_file)
+
+                    if extension == ".pyindex":
+                        self.assertEqual(838, len(parser.get_index()))
+                    else:
+                        self.assertTrue("MEGIGLK" in parser.get_peptide_index())
+
+                    # the index file is rebuilt
+                    self.assertEqual(index_size, os.path.getsize(index_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_lazy_clusters(self):
+        for testfile in (self.testfile, self.testfile2, self.testfile3):
+            clusters = list(clustering_parser.ClusteringParser(testfile))
+            lazy_clusters = list(clustering_parser.ClusteringParser(testfile, lazy=True))
+
+            self.assertEqual(len(clusters), len(lazy_clusters))
+
+            for cluster, lazy_cluster in zip(clusters, lazy_clusters):
+                self.assertFalse(lazy_cluster.is_loaded())
+
+                self.assertEqual(cluster.id, lazy_cluster.id)
+                self.assertEqual(cluster.precursor_mz, lazy_cluster.precursor_mz)
+                self.assertEqual(str(cluster.consensus_intens), str(lazy_cluster.consensus_intens))
+                self.assertEqual(cluster.n_spectra, lazy_cluster.n_spectra)
+                self.assertEqual(cluster.identified_spectra, lazy_cluster.identified_spectra)
+                self.assertEqual(cluster.unidentified_spectra, lazy_cluster.unidentified_spectra)
+                self.assertEqual(cluster.charge, lazy_cluster.charge)
+                self.assertEqual(cluster.max_ratio, lazy_cluster.max_ratio)
+                self.assertEqual(cluster.max_il_ratio, lazy_cluster.max_il_ratio)
+                # ties are reported in the same order
+                self.assertEqual(cluster.max_sequences, lazy_cluster.max_sequences)
+
+                self.assertEqual(set(cluster.get_spectra()), set(lazy_cluster.get_spectra()))
+                self.assertTrue(lazy_cluster.is_loaded())
+
+    @staticmethod
+    def _write_duplicate_spectra_file(temp_dir):
+        """
+        Writes a .clustering file with a single cluster holding a duplicated spectrum.
+        """
+        # the duplicated SPEC line only differs in the number format, PTM order, and whitespace
+        spec_lines = ["SPEC\t#file=a.mgf#id=index=1#title=Spectrum 1\ttrue\tPEPTIDEK\t400.1\t2\t9606\t"
+                      "1-MOD:00719,3-MOD:00046\t0.9",
+                      "SPEC\t#file=a.mgf#id=index=1#title=Spectrum 1\ttrue\tPEPTIDEK\t400.10\t2.0\t9606\t"
+                      "3-MOD:00046,1-MOD:00719\t0.8  ",
+                      "SPEC\t#file=a.mgf#id=index=2#title=Spectrum 2\ttrue\tANOTHERK\t400.1\t2\t9606\t\t0.9",
+                      "SPEC\t#file=a.mgf#id=index=3#title=Spectrum 3\ttrue\t\t400.1\t2\t\t\t0.5"]
+
+        filename = os.path.join(temp_dir, "duplicates.clustering")
+
+        with open(filename, "w") as writer:
+            writer.write("name=test\n\n=Cluster=\nid=cluster1\nav_precursor_mz=400.1\n"
+                         "consensus_mz=100.0,200.0\nconsensus_intens=1.0,2.0\n" + "\n".join(spec_lines) + "\n")
+
+        return filename
+
+    def test_spec_key(self):
+        with open(self.testfile, "r") as reader:
+            spec_lines = [line.strip() for line in reader if line.startswith("SPEC\t")]
+
+        for line in spec_lines[:100]:
+            self.assertEqual(clustering_parser.ClusteringParser._parse_spec_line(line).get_key(),
+                             clustering_parser.ClusteringParser._get_spec_key(line))
+
+    def test_lazy_duplicate_spectra(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = self._write_duplicate_spectra_file(temp_dir)
+
+            cluster = list(clustering_parser.ClusteringParser(filename))[0]
+            lazy_cluster = list(clustering_parser.ClusteringParser(filename, lazy=True))[0]
+
+        self.assertEqual(3, cluster.n_spectra)
+        self.assertEqual(cluster.n_spectra, lazy_cluster.n_spectra)
+        self.assertEqual(cluster.identified_spectra, lazy_cluster.identified_spectra)
+        self.assertEqual(cluster.max_ratio, lazy_cluster.max_ratio)
+        self.assertEqual(cluster.max_il_ratio, lazy_cluster.max_il_ratio)
+        self.assertEqual(set(cluster.get_spectra()), set(lazy_cluster.get_spectra()))
+
+    def test_peptide_index_duplicate_spectra(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = self._write_duplicate_spectra_file(temp_dir)
+            cluster = list(clustering_parser.ClusteringParser(filename))[0]
+
+            parser = clustering_parser.ClusteringParser(filename)
+            peptide_index = parser.get_peptide_index()
+
+            # the index is only loaded once
+            self.assertIs(peptide_index, parser.get_peptide_index())
+
+        self.assertEqual([cluster.n_spectra], peptide_index.cluster_sizes)
+        self.assertEqual({"cluster1": cluster.sequence_counts["PEPTIDEK"]}, peptide_index.get_clusters("PEPTIDEK"))
+        self.assertEqual({"cluster1": 1}, peptide_index.get_clusters("PEPTIDEK"))
+
+    def test_header(self):
+        header = clustering_parser.ClusteringParser(self.testfile).header
+
+        self.assertEqual("GreedyClustering_0.99", header.name)
+        self.assertEqual("CombinedFisherIntensityTest", header.similarity_method)
+        self.assertEqual("1.0.1-SNAPSHOT", header.version)
+        self.assertEqual(0.99, header.threshold)
+        self.assertEqual(0, header.fdr)
+        self.assertEqual("GreedyClustering_0.99", header.get_property("description"))
+
+        header = clustering_parser.ClusteringParser(self.testfile3).header
+        self.assertEqual("5Da/MaRaCluster.clusters_p10.tsv", header.name)
+        self.assertIsNone(header.threshold)
+
+    def test_parse_sequence_summary(self):
+        sequence_counts = clustering_parser.ClusteringParser._parse_sequence_summary("[:1,RKNPAAYENDK:2]")
+        self.assertEqual({"": 1, "RKNPAAYENDK": 2}, sequence_counts)
+
+        sequence_counts = clustering_parser.ClusteringParser._parse_sequence_summary("[]")
+        self.assertEqual(0, len(sequence_counts))
+
+    def test_sequence_summary(self):
+        for lazy in (False, True):
+            parser = clustering_parser.ClusteringParser(self.testfile, lazy=lazy, use_sequence_summary=True)
+            clusters = list(parser)
+
+            self.assertEqual(838, len(clusters))
+
+            # the summary line of the second cluster does not contain the third sequence
+            self.assertEqual({"MEGIGLK": 2}, clusters[1].sequence_counts)
+            self.assertEqual(2/3, clusters[1].max_ratio)
+            self.assertEqual(2/3, clusters[1].max_il_ratio)
+            self.assertEqual(("MEGIGLK", ), clusters[1].max_sequences)
+
+            self.assertEqual("MQEAMTQEVSDVFSDTTTPIK", clusters[837].max_sequences[0])
+            self.assertEqual(1, clusters[837].max_il_ratio)
+
+        # clusters with empty sequences fall back to the SPEC lines
+        clusters = list(clustering_parser.ClusteringParser(self.testfile3, use_sequence_summary=True))
+        self.assertEqual(5, clusters[26].identified_spectra)
+        self.assertIsNone(clusters[1].max_ratio)
+
+    def test_consensus_counts(self):
+        lines = [b"=Cluster=", b"id=test_cluster", b"av_precursor_mz=359.155", b"av_precursor_intens=12.5",
+                 b"consensus_mz=70.061,84.076,110.064", b"consensus_intens=38.55,118.40,163.68",
+                 b"consensus_count=1,2,3", self.spec_line.encode()]
+
+        for lazy in (False, True):
+            cluster = clustering_parser.ClusteringParser._parse_cluster_block(lines, lazy)
+            self.assertEqual(12.5, cluster.precursor_intens)
+            self.assertIsNone(cluster.consensus_counts)
+
+            cluster = clustering_parser.ClusteringParser._parse_cluster_block(lines, lazy,
+                                                                              parse_consensus_counts=True)
+            self.assertEqual([1, 2, 3], cluster.consensus_counts.tolist())
+            self.assertEqual(len(cluster.consensus_mz), len(cluster.consensus_counts))
+
+        # clusters without counts get an empty array
+        clusters = list(clustering_parser.ClusteringParser(self.testfile, parse_consensus_counts=True))
+        self.assertEqual(0, len(clusters[0].consensus_counts))
+        self.assertEqual(1.0, clusters[0].precursor_intens)
+
+    def test_indented_lines(self):
+        with open(self.testfile, "r") as reader:
+            lines = reader.readlines()
+
+        # indent all lines but the cluster starts
+        lines = [line if line.startswith("=Cluster=") else "  " + line for line in lines]
+        clusters = list(clustering_parser.ClusteringParser(self.testfile))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "indented.clustering")
+
+            with open(filename, "w") as writer:
+                writer.writelines(lines)
+
+            for lazy in (False, True):
+                indented_clusters = list(clustering_parser.ClusteringParser(filename, lazy=lazy))
+
+                self.assertEqual([c.id for c in clusters], [c.id for c in indented_clusters])
+                self.assertEqual([c.precursor_mz for c in clusters], [c.precursor_mz for c in indented_clusters])
+                self.assertEqual([c.n_spectra for c in clusters], [c.n_spectra for c in indented_clusters])
+                self.assertEqual([c.max_ratio for c in clusters], [c.max_ratio for c in indented_clusters])
+
+            # the filters and the index use the same lines
+            cluster_filter = clustering_parser.ClusterFilter(min_size=3, min_precursor_mz=400, max_precursor_mz=500)
+            filtered_clusters = list(clustering_parser.ClusteringParser(self.testfile, cluster_filter=cluster_filter))
+            self.assertTrue(0 < len(filtered_clusters) < len(clusters))
+            self.assertEqual([c.id for c in filtered_clusters],
+                             [c.id for c in clustering_parser.ClusteringParser(filename,
+                                                                               cluster_filter=cluster_filter)])
+
+            index = clustering_parser.ClusteringParser(filename).get_index()
+            self.assertEqual(838, len(index))
+            self.assertEqual(359.155, index["1cc813a1-4e75-4c1d-99aa-752312fbe554"].precursor_mz)
+            self.assertEqual(2, index["1cc813a1-4e75-4c1d-99aa-752312fbe554"].n_spectra)
+
+    def test_cluster_filter(self):
+        for testfile in (self.testfile, self.testfile3):
+            clusters = list(clustering_parser.ClusteringParser(testfile))
+            filters = (clustering_parser.ClusterFilter(min_size=5),
+                       clustering_parser.ClusterFilter(max_size=2),
+                       clustering_parser.ClusterFilter(min_precursor_mz=400, max_precursor_mz=500),
+                       clustering_parser.ClusterFilter(cluster_ids=[clusters[3].id, clusters[10].id]))
+
+            for cluster_filter in filters:
+                for lazy in (False, True):
+                    filtered_clusters = list(clustering_parser.ClusteringParser(testfile, lazy=lazy,
+                                                                                cluster_filter=cluster_filter))
+                    filtered_ids = [cluster.id for cluster in filtered_clusters]
+
+                    # the filter must never reject clusters that pass and
+                    # removes all other clusters in the test files
+                    for cluster in clusters:
+                        passes = cluster.n_spectra >= cluster_filter.min_size and \
+                                 (cluster_filter.max_size is None or cluster.n_spectra <= cluster_filter.max_size) and \
+                                 cluster_filter.accepts_precursor_mz(cluster.precursor_mz) and \
+                                 (cluster_filter.cluster_ids is None or cluster.id in cluster_filter.cluster_ids)
+
+                        self.assertEqual(passes, cluster.id in filtered_ids)
+
+            self.assertEqual(2, len(list(clustering_parser.ClusteringParser(testfile, cluster_filter=filters[-1]))))
+
+    def test_combine_cluster_filters(self):
+        combined = clustering_parser.ClusterFilter.combine(
+            [clustering_parser.ClusterFilter(min_size=5, max_size=10, min_precursor_mz=400, cluster_ids=["1"]),
+             clustering_parser.ClusterFilter(min_size=3, max_size=20, min_precursor_mz=300, cluster_ids=["2"])])
+
+        self.assertEqual(3, combined.min_size)
+        self.assertEqual(20, combined.max_size)
+        self.assertEqual(300, combined.min_precursor_mz)
+        self.assertIsNone(combined.max_precursor_mz)
+        self.assertEqual({"1", "2"}, combined.cluster_ids)
+
+        # None represents a filter that accepts all clusters
+        self.assertIsNone(clustering_parser.ClusterFilter.combine([combined, None]))
+        self.assertIsNone(clustering_parser.ClusterFilter.combine(
+            [clustering_parser.ClusterFilter(min_size=5), clustering_parser.ClusterFilter(max_size=5)]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+import os
+import sys
+import bz2
+import gzip
+import zlib
+import shutil
+import struct
+import tempfile
+import subprocess
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.compression as compression
+import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.ui.cluster_spectra_extractor as cluster_spectra_extractor
+
+
+def write_bgzf(data, filename, block_size=10000):
+    """
+    Writes the data as BGZF file (as created by bgzip).
+
+    :param data: The data as bytes
+    :param filename: Path to the file to create
+    :param block_size: Number of uncompressed bytes per block
+    """
+    with open(filename, "wb") as writer:
+        for start in list(range(0, len(data), block_size)) + [len(data)]:
+            block = data[start:start + block_size]
+
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            compressed = compressor.compress(block) + compressor.flush()
+
+            # header with the "BC" extra subfield holding the total block size - 1
+            writer.write(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00")
+            writer.write(struct.pack("<H", len(compressed) + 25))
+            writer.write(compressed)
+            writer.write(struct.pack("<II", zlib.crc32(block), len(block)))
+
+
+class CompressionTest(unittest.TestCase):
+    """
+    Test case for the compression module
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.mgf_file = os.path.join(os.path.dirname(__file__), "testfiles", "msamanda_test_output.mgf")
+        self.temp_dir = tempfile.mkdtemp()
+
+        with open(self.testfile, "rb") as reader:
+            self.data = reader.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_compressed(self, data, name):
+        filename = os.path.join(self.temp_dir, name)
+
+        if name.endswith(".bgz"):
+            write_bgzf(data, filename)
+        elif name.endswith(".gz"):
+            with gzip.open(filename, "wb") as writer:
+                writer.write(data)
+        elif name.endswith(".bz2"):
+            with bz2.open(filename, "wb") as writer:
+                writer.write(data)
+        else:
+            with open(filename, "wb") as writer:
+                writer.write(data)
+
+        return filename
+
+    def test_detect_compression(self):
+        self.assertIsNone(compression.detect_compression(self.testfile))
+        self.assertFalse(compression.is_compressed(self.testfile))
+
+        for name, expected in (("test.clustering.gz", "gzip"), ("test.clustering.bz2", "bz2"),
+                               ("test.clustering.bgz", "bgzf")):
+            filename = self._write_compressed(self.data, name)
+
+            self.assertEqual(expected, compression.detect_compression(filename))
+            self.assertTrue(compression.is_compressed(filename))
+
+    def test_find_file(self):
+        filename = self._write_compressed(self.data, "test.clustering.gz")
+
+        self.assertEqual(filename, compression.find_file(filename[:-3]))
+        self.assertEqual(self.testfile, compression.find_file(self.testfile))
+        self.assertIsNone(compression.find_file(os.path.join(self.temp_dir, "missing.mgf")))
+
+    def test_open_file(self):
+        for name in ("test.clustering.gz", "test.clustering.bz2", "test.clustering.bgz"):
+            filename = self._write_compressed(self.data, name)
+
+            for threads in (1, 3):
+                with compression.open_file(filename, "rb", threads=threads) as reader:
+                    self.assertEqual(self.data, reader.read())
+
+                with compression.open_file(filename, "rb", threads=threads) as reader:
+                    self.assertEqual(self.data.splitlines(keepends=True), list(reader))
+
+                with compression.open_file(filename, "rt", threads=threads) as reader:
+                    self.assertEqual(self.data.decode(), reader.read())
+
+    @unittest.skipUnless(compression.zstandard is not None or shutil.which("zstd") is not None,
+                         "Zstandard is not available")
+    def test_open_zstd(self):
+        filename = os.path.join(self.temp_dir, "test.clustering")
+        shutil.copy(self.testfile, filename)
+
+        if shutil.which("zstd") is not None:
+            subprocess.check_call(["zstd", "-q", filename])
+        else:
+            with open(filename + ".zst", "wb") as writer:
+                writer.write(compression.zstandard.ZstdCompressor().compress(self.data))
+
+        self.assertEqual("zstd", compression.detect_compression(filename + ".zst"))
+
+        with compression.open_file(filename + ".zst", "rb") as reader:
+            self.assertEqual(self.data, reader.read())
+
+    def test_bgzf_seek(self):
+        filename = self._write_compressed(self.data, "test.clustering.bgz")
+
+        for threads in (1, 3):
+            offsets = list()
+
+            with compression.open_file(filename, "rb", threads=threads) as reader:
+                offset = reader.tell()
+
+                for line in iter(reader.readline, b""):
+                    if line.startswith(b"=Cluster="):
+                        offsets.append(offset)
+
+                    offset = reader.tell()
+
+            self.assertEqual(self.data.count(b"=Cluster="), len(offsets))
+
+            with compression.open_file(filename, "rb", threads=threads) as reader:
+                for offset in reversed(offsets):
+                    self.assertEqual(offset, reader.seek(offset))
+                    self.assertEqual(offset, reader.tell())
+                    self.assertEqual(b"=Cluster=\n", reader.readline())
+
+    def test_parse_compressed_clustering_file(self):
+        clusters = list(clustering_parser.ClusteringParser(self.testfile))
+
+        for name in ("test.clustering.gz", "test.clustering.bgz"):
+            filename = self._write_compressed(self.data, name)
+
+            parser = clustering_parser.ClusteringParser(filename)
+            compressed_clusters = list(parser)
+
+            self.assertEqual([c.id for c in clusters], [c.id for c in compressed_clusters])
+            self.assertEqual([c.n_spectra for c in clusters], [c.n_spectra for c in compressed_clusters])
+
+            # clusters are found through a sequential scan
+            cluster_ids = [clusters[10].id, clusters[2].id, "missing"]
+            self.assertEqual(cluster_ids[:2], [c.id for c in parser.get_clusters(cluster_ids)])
+
+            parallel_parser = clustering_parser.ParallelClusteringParser(filename, processes=2, lazy=True,
+                                                                         shard_size=100000)
+            self.assertEqual([c.id for c in clusters], [c.id for c in parallel_parser])
+
+    def test_compressed_mgf_index(self):
+        with open(self.mgf_file, "rb") as reader:
+            mgf_data = reader.read()
+
+        filename = self._write_compressed(mgf_data, "test.mgf.bgz")
+        cluster_spectra_extractor.build_mgf_indices([filename])
+
+        mgf_file = cluster_spectra_extractor.MgfFile(filename)
+
+        self.assertTrue(mgf_file.is_indexed)
+        self.assertEqual(51, len(mgf_file.index))
+
+        spectra = mgf_data.decode().split("BEGIN IONS")
+
+        for spec_index in (1, 2, 50):
+            spec_lines = mgf_file.get_spectrum_string(spec_index)
+
+            self.assertEqual("BEGIN IONS\n", spec_lines[0])
+            self.assertEqual("END IONS", spec_lines[-1].strip())
+            self.assertTrue(spectra[spec_index].startswith("".join(spec_lines)[10:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
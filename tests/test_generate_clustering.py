@@ -0,0 +1,75 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath('..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import generate_clustering
+import spectra_cluster.clustering_parser as clustering_parser
+
+
+class GenerateClusteringTest(unittest.TestCase):
+    """
+    Test case for the synthetic .clustering file generator
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_deterministic(self):
+        filenames = [os.path.join(self.temp_dir, name) for name in ("1.clustering", "2.clustering", "3.clustering")]
+
+        generate_clustering.write_clustering_file(filenames[0], n_clusters=50)
+        generate_clustering.write_clustering_file(filenames[1], n_clusters=50)
+        generate_clustering.write_clustering_file(filenames[2], n_clusters=50, seed=1)
+
+        contents = list()
+
+        for filename in filenames:
+            with open(filename, "rb") as reader:
+                contents.append(reader.read())
+
+        self.assertEqual(contents[0], contents[1])
+        self.assertNotEqual(contents[0], contents[2])
+
+    def test_parse_synthetic_file(self):
+        filename = os.path.join(self.temp_dir, "synthetic.clustering")
+        n_spectra = generate_clustering.write_clustering_file(filename, n_clusters=200, min_size=2, max_size=20,
+                                                              n_peaks=10, ptm_density=0.5)
+
+        parser = clustering_parser.ClusteringParser(filename, parse_consensus_counts=True)
+        clusters = list(parser)
+
+        self.assertEqual(200, len(clusters))
+        self.assertEqual(n_spectra, sum(cluster.n_spectra for cluster in clusters))
+        self.assertEqual(0, len(clustering_parser.parse_warnings))
+
+        n_ptms = 0
+
+        for cluster in clusters:
+            self.assertTrue(2 <= cluster.n_spectra <= 20)
+            self.assertEqual(10, len(cluster.consensus_mz))
+            self.assertEqual(10, len(cluster.consensus_counts))
+
+            for spectrum in cluster.get_spectra():
+                for psm in spectrum.psms:
+                    n_ptms += len(psm.ptms)
+
+        self.assertTrue(n_ptms > 0)
+
+    def test_cluster_sizes(self):
+        filename = os.path.join(self.temp_dir, "synthetic.clustering")
+        generate_clustering.write_clustering_file(filename, n_clusters=500, min_size=1, max_size=100)
+
+        sizes = [cluster.n_spectra for cluster in clustering_parser.ClusteringParser(filename, lazy=True)]
+
+        # the sizes follow a power law
+        self.assertTrue(sizes.count(1) > len(sizes) / 3)
+        self.assertTrue(max(sizes) > 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
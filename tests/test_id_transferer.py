@@ -4,6 +4,7 @@ import sys
 sys.path.insert(0, os.path.abspath('..'))
 import spectra_cluster.clustering_parser as clustering_parser
 import spectra_cluster.analyser.id_transferer as id_transferer
+from spectra_cluster.analyser.common import process_clustering_file
 
 
 class IdTransfererTest(unittest.TestCase):
@@ -30,6 +31,29 @@ class IdTransfererTest(unittest.TestCase):
         self.assertEqual(1, len(ref4.psms))
         self.assertEqual("MEGIGLK", ref4.psms[0].sequence)
 
+    def test_merge(self):
+        serial_analyser = process_clustering_file(self.testfile, id_transferer.IdTransferer(True, True))
+        parallel_analyser = process_clustering_file(self.testfile, id_transferer.IdTransferer(True, True),
+                                                    processes=3)
+
+        self.assertEqual(3149, len(parallel_analyser.identification_references))
+        self.assertEqual([(r.spec_id, r.psms[0].sequence) for r in serial_analyser.identification_references],
+                         [(r.spec_id, r.psms[0].sequence) for r in parallel_analyser.identification_references])
+
+    def test_sink(self):
+        serial_analyser = process_clustering_file(self.testfile, id_transferer.IdTransferer(True, True))
+
+        for processes in (1, 3):
+            references = list()
+            analyser = process_clustering_file(self.testfile,
+                                               id_transferer.IdTransferer(True, True, sink=references.append),
+                                               processes=processes)
+
+            # references are only passed to the sink
+            self.assertEqual(0, len(analyser.identification_references))
+            self.assertEqual([(r.spec_id, r.psms[0].sequence) for r in serial_analyser.identification_references],
+                             [(r.spec_id, r.psms[0].sequence) for r in references])
+
     def test_identify_unidentified(self):
         parser = clustering_parser.ClusteringParser(self.testfile)
         analyser = id_transferer.IdTransferer(add_to_identified=False, add_to_unidentified=True)
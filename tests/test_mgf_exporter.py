@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath('..'))
+from spectra_cluster.analyser.exporter.mgf_exporter import MgfExporter
+from spectra_cluster.analyser.common import process_clustering_file
+
+
+class MgfExporterTest(unittest.TestCase):
+    """
+    Test case for the MgfExporter class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+
+    def test_export(self):
+        with tempfile.TemporaryFile(mode="w+") as result_file:
+            analyser = MgfExporter(result_file)
+            analyser.min_size = 3
+            process_clustering_file(self.testfile, analyser)
+
+            result_file.seek(0)
+            lines = result_file.read().split("\n")
+
+        self.assertEqual(321, len([l for l in lines if l == "BEGIN IONS"]))
+        self.assertEqual("TITLE=9a582e74-e8b1-451d-a007-cadc362aa2ce,sequence=MEGIGLK", lines[1])
+        self.assertEqual("PEPMASS=382.149", lines[2])
+        self.assertEqual("CHARGE=2", lines[3])
+        self.assertEqual("74.053 54.5", lines[5])
+
+    def test_parallel_export(self):
+        results = list()
+
+        for processes in (1, 3):
+            with tempfile.TemporaryFile(mode="w+") as result_file:
+                analyser = MgfExporter(result_file)
+                process_clustering_file(self.testfile, analyser, processes=processes, lazy=True)
+
+                result_file.seek(0)
+                results.append(result_file.read())
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(838, results[1].count("BEGIN IONS"))
+
+    def test_cached_export(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            # the cache is created next to the .clustering file
+            clustering_file = os.path.join(temp_dir, "test.clustering")
+            shutil.copy(self.testfile, clustering_file)
+
+            results = list()
+
+            for use_cache in (False, True):
+                with tempfile.TemporaryFile(mode="w+") as result_file:
+                    process_clustering_file(clustering_file, MgfExporter(result_file), use_cache=use_cache)
+
+                    result_file.seek(0)
+                    results.append(result_file.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+        lines, cached_lines = results[0].split("\n"), results[1].split("\n")
+        self.assertEqual(len(lines), len(cached_lines))
+
+        for line, cached_line in zip(lines, cached_lines):
+            if len(line) < 1 or not line[0].isdigit():
+                self.assertEqual(line, cached_line)
+                continue
+
+            # the float32 values are not written with their full float64 expansion
+            for value, cached_value in zip(line.split(" "), cached_line.split(" ")):
+                self.assertTrue(len(cached_value) <= len(value), msg=cached_line)
+                self.assertAlmostEqual(float(value), float(cached_value), delta=abs(float(value)) * 1e-6)
+
+        # only values with more than 7 significant digits differ
+        self.assertTrue(sum(line != cached_line for line, cached_line in zip(lines, cached_lines)) < 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
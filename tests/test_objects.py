@@ -0,0 +1,207 @@
+import unittest
+import os
+import sys
+import pickle
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.objects as objects
+import spectra_cluster.clustering_parser as clustering_parser
+
+
+class SpectrumTest(unittest.TestCase):
+    """
+    TestCase for the Spectrum, PSM and PTM classes
+    """
+    def setUp(self):
+        self.title = "#file=/tmp/test.mgf#id=index=12#title=Spectrum 12"
+
+    def test_title(self):
+        spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"], None)
+        other_spectrum = objects.Spectrum(self.title.replace("12", "13"), 400.1, 2, ["9606"], None)
+
+        self.assertEqual(self.title, spectrum.title)
+        self.assertEqual("/tmp/test.mgf", spectrum.get_filename())
+        self.assertEqual("index=12", spectrum.get_id())
+        self.assertEqual("Spectrum 12", spectrum.get_title())
+
+        # filenames and taxids are shared
+        self.assertIs(spectrum.get_key()[0], other_spectrum.get_key()[0])
+        self.assertIs(spectrum.taxids, other_spectrum.taxids)
+
+        spectrum = objects.Spectrum("Spectrum 12", 400.1, 2, [], None)
+        self.assertIsNone(spectrum.get_filename())
+        self.assertEqual("Spectrum 12", spectrum.get_title())
+        self.assertIs(objects.EMPTY_FROZENSET, spectrum.psms)
+
+    def test_properties(self):
+        spectrum = objects.Spectrum(self.title, 400.1, 2, [], None, json_properties='{"rt": 12.3}')
+        self.assertIsNone(spectrum._properties)
+        self.assertEqual(12.3, spectrum.properties["rt"])
+
+        spectrum.properties = {"rt": 1}
+        self.assertEqual(1, spectrum.properties["rt"])
+
+        spectrum = objects.Spectrum(self.title, 400.1, 2, [], None)
+        self.assertEqual(dict(), spectrum.properties)
+
+    def test_slots(self):
+        ptm = objects.PTM(1, "MOD:01214")
+        psm = objects.PSM("PEPTIDE", [ptm])
+        spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"], [psm])
+
+        for obj in (ptm, psm, spectrum):
+            self.assertFalse(hasattr(obj, "__dict__"))
+
+        # identical PSMs share the same set
+        other_spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"], [objects.PSM("PEPTIDE", [ptm])])
+        self.assertIs(spectrum.psms, other_spectrum.psms)
+
+        # the shared sets are only cached up to a fixed size
+        for i in range(10):
+            objects.Spectrum(self.title, 400.1, 2, [str(i)], [objects.PSM("PEPTIDE" + "K" * i, [])])
+
+        for cached_function in (objects._create_taxid_set, objects._share_psm_set):
+            self.assertEqual(objects.SHARED_SET_CACHE_SIZE, cached_function.cache_info().maxsize)
+            self.assertTrue(cached_function.cache_info().currsize <= objects.SHARED_SET_CACHE_SIZE)
+
+    def test_identity(self):
+        psm = objects.PSM("PEPTIDE", [objects.PTM(1, "MOD:01214")])
+        spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"], [psm])
+        other_spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"],
+                                          [objects.PSM("PEPTIDE", [objects.PTM(1, "MOD:01214")])])
+
+        self.assertEqual(psm, other_spectrum.psms.__iter__().__next__())
+        self.assertEqual(hash(spectrum), hash(other_spectrum))
+        self.assertEqual(spectrum, other_spectrum)
+        self.assertEqual(1, len(set([spectrum, other_spectrum])))
+
+        self.assertNotEqual(spectrum, objects.Spectrum(self.title, 400.1, 3, ["9606"], [psm]))
+        self.assertNotEqual(psm, objects.PSM("PEPTIDE", []))
+        self.assertNotEqual(objects.PTM(1, "MOD:01214"), objects.PTM(2, "MOD:01214"))
+
+        # the identity cannot be changed
+        with self.assertRaises(AttributeError):
+            spectrum.precursor_mz = 400.2
+        with self.assertRaises(AttributeError):
+            psm.sequence = "PEPTIDER"
+
+    def test_pickle(self):
+        spectrum = objects.Spectrum(self.title, 400.1, 2, ["9606"], [objects.PSM("PEPTIDE", [objects.PTM(1, "MOD:01214")])],
+                                    json_properties='{"rt": 12.3}')
+        copy = pickle.loads(pickle.dumps(spectrum))
+
+        self.assertEqual(spectrum, copy)
+        self.assertEqual(hash(spectrum), hash(copy))
+        self.assertEqual(self.title, copy.title)
+        self.assertEqual(12.3, copy.properties["rt"])
+
+
+class ClusterStatsTest(unittest.TestCase):
+    """
+    TestCase for the ClusterStats class and the Cluster's statistics
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+
+    def assert_same_properties(self, cluster, other_cluster):
+        for attribute in ("n_spectra", "identified_spectra", "unidentified_spectra", "charge", "sequence_counts",
+                          "sequence_ratios", "max_ratio", "max_il_ratio"):
+            self.assertEqual(getattr(cluster, attribute), getattr(other_cluster, attribute))
+        self.assertEqual(set(cluster.max_sequences), set(other_cluster.max_sequences))
+
+    def test_stats(self):
+        spectra = [objects.Spectrum("Spec 1", 400.1, 2, [], [objects.PSM("PEPTIDEK", [])]),
+                   objects.Spectrum("Spec 2", 400.2, 3, [], [objects.PSM("pepTIDEK", []),
+                                                            objects.PSM("PEPTLDEK", [])]),
+                   objects.Spectrum("Spec 3", 400.3, None, [], [])]
+
+        stats = objects.ClusterStats(spectra)
+
+        self.assertEqual(3, stats.n_spectra)
+        self.assertEqual(2, stats.identified_spectra)
+        self.assertEqual(1, stats.unidentified_spectra)
+        self.assertEqual(2, stats.get_charge())
+        self.assertEqual({"PEPTIDEK": 2, "PEPTLDEK": 1}, stats.sequence_counts)
+        self.assertEqual({"PEPTLDEK": 3}, stats.il_sequence_counts)
+        self.assertEqual((2, ("PEPTIDEK", )), stats.get_max_sequences())
+
+        stats.remove_spectrum(spectra[1])
+
+        self.assertEqual(2, stats.n_spectra)
+        self.assertEqual(2, stats.get_charge())
+        self.assertEqual({"PEPTIDEK": 1}, stats.sequence_counts)
+        self.assertEqual(1, stats.get_max_il_count())
+
+        # precomputed sequence counts cannot be changed
+        stats = objects.ClusterStats(spectra, sequence_counts={"PEPTIDEK": 2})
+        self.assertEqual({"PEPTLDEK": 2}, stats.il_sequence_counts)
+        self.assertRaises(Exception, stats.add_spectrum, spectra[0])
+
+    def test_set_spectra(self):
+        clusters = list(clustering_parser.ClusteringParser(self.testfile))
+        cluster = clusters[2]
+        spectra = list(cluster.get_spectra())
+
+        for new_spectra in (spectra[:-2], spectra + list(clusters[3].get_spectra()), spectra[1:2], []):
+            cluster.set_spectra(new_spectra)
+            expected = objects.Cluster(cluster.id, cluster.precursor_mz, None, None, new_spectra)
+
+            self.assert_same_properties(expected, cluster)
+            self.assertEqual(len(new_spectra), len(cluster.get_spectra()))
+
+    def test_set_spectra_summary(self):
+        parser = clustering_parser.ClusteringParser(self.testfile, lazy=True)
+        cluster = next(iter(parser))
+        spectra = list(cluster.get_spectra())
+
+        cluster.set_spectra(spectra[1:])
+        expected = objects.Cluster(cluster.id, cluster.precursor_mz, None, None, spectra[1:])
+
+        self.assert_same_properties(expected, cluster)
+
+    def test_add_remove_spectra(self):
+        clusters = list(clustering_parser.ClusteringParser(self.testfile))
+        cluster, other_cluster = clusters[2], clusters[3]
+        spectra = list(cluster.get_spectra())
+        other_spectra = list(other_cluster.get_spectra())
+
+        cluster.remove_spectra(spectra[:2])
+        self.assert_same_properties(objects.Cluster(cluster.id, 0, None, None, spectra[2:]), cluster)
+
+        # already added spectra are ignored
+        cluster.add_spectra(spectra)
+        self.assert_same_properties(objects.Cluster(cluster.id, 0, None, None, spectra), cluster)
+
+        cluster.merge(other_cluster)
+        self.assert_same_properties(objects.Cluster(cluster.id, 0, None, None, spectra + other_spectra), cluster)
+        self.assertEqual(len(spectra) + len(other_spectra), cluster.n_spectra)
+
+        # spectra that are not part of the cluster are ignored
+        cluster.remove_spectra(other_spectra + [objects.Spectrum("Spec 1", 400.1, 2, [], [])])
+        self.assert_same_properties(objects.Cluster(cluster.id, 0, None, None, spectra), cluster)
+
+    def test_max_sequences(self):
+        spectra = [objects.Spectrum("Spec " + str(i), 400.1, 2, [], [objects.PSM(sequence, [])])
+                   for i, sequence in enumerate(["PEPTIDEK", "PEPTLDEK", "PEPTLDEK", "ANDPEPK"])]
+        cluster = objects.Cluster("1", 400.1, None, None, spectra)
+
+        self.assertEqual(("PEPTLDEK", ), cluster.max_sequences)
+        self.assertEqual(0.5, cluster.max_ratio)
+        self.assertEqual(0.75, cluster.max_il_ratio)
+        self.assertEqual(0.25, cluster.sequence_ratios["ANDPEPK"])
+
+        cluster.remove_spectra(spectra[2:3])
+
+        self.assertEqual({"PEPTIDEK", "PEPTLDEK", "ANDPEPK"}, set(cluster.max_sequences))
+        self.assertEqual(1 / 3, cluster.max_ratio)
+        self.assertEqual(2 / 3, cluster.max_il_ratio)
+
+        cluster.remove_spectra(spectra)
+
+        self.assertEqual(0, cluster.n_spectra)
+        self.assertEqual(tuple(), cluster.max_sequences)
+        self.assertIsNone(cluster.max_ratio)
+        self.assertEqual(dict(), cluster.sequence_ratios)
+
+
+if __name__ == "__main__":
+    unittest.main()
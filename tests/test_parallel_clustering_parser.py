@@ -0,0 +1,127 @@
+import unittest
+import os
+import sys
+import gzip
+import time
+import shutil
+import tempfile
+import multiprocessing
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.analyser.id_transferer as id_transferer
+
+
+def delayed_shard(shard):
+    """
+    Returns the passed shard after a shard-dependent delay. Shard -1 raises an exception.
+    """
+    if shard < 0:
+        raise ValueError("Invalid shard")
+
+    time.sleep(0.5 if shard == 0 else 0)
+
+    return shard
+
+
+class ParallelClusteringParserTest(unittest.TestCase):
+    """
+    Test case for the ParallelClusteringParser class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.clusters = list(clustering_parser.ClusteringParser(self.testfile))
+
+    def test_get_shards(self):
+        parser = clustering_parser.ParallelClusteringParser(self.testfile, shard_size=100000)
+        shards = parser.get_shards()
+
+        self.assertTrue(len(shards) > 5)
+        self.assertEqual(0, shards[0][0])
+        self.assertEqual(os.path.getsize(self.testfile), shards[-1][1])
+
+        with open(self.testfile, "rb") as reader:
+            for i in range(1, len(shards)):
+                self.assertEqual(shards[i - 1][1], shards[i][0])
+
+                reader.seek(shards[i][0])
+                self.assertEqual(b"=Cluster=", reader.readline().strip())
+
+    def test_ordered_parsing(self):
+        for lazy in (False, True):
+            parser = clustering_parser.ParallelClusteringParser(self.testfile, processes=3, lazy=lazy,
+                                                                shard_size=100000)
+            clusters = list(parser)
+
+            self.assertEqual([c.id for c in self.clusters], [c.id for c in clusters])
+
+            for cluster, parallel_cluster in zip(self.clusters, clusters):
+                self.assertEqual(cluster.n_spectra, parallel_cluster.n_spectra)
+                self.assertEqual(cluster.max_il_ratio, parallel_cluster.max_il_ratio)
+                self.assertEqual(set(cluster.get_spectra()), set(parallel_cluster.get_spectra()))
+
+    def test_unordered_parsing(self):
+        parser = clustering_parser.ParallelClusteringParser(self.testfile, processes=3, ordered=False,
+                                                            shard_size=100000)
+        clusters = list(parser)
+
+        self.assertEqual(838, len(clusters))
+        self.assertEqual(set([c.id for c in self.clusters]), set([c.id for c in clusters]))
+
+    def test_unordered_compressed_parsing(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            filename = os.path.join(temp_dir, "test.clustering.gz")
+
+            with open(self.testfile, "rb") as reader, gzip.open(filename, "wb") as writer:
+                writer.write(reader.read())
+
+            parser = clustering_parser.ParallelClusteringParser(filename, processes=3, ordered=False,
+                                                                shard_size=100000)
+            clusters = list(parser)
+
+            self.assertEqual(838, len(clusters))
+            self.assertEqual(set([c.id for c in self.clusters]), set([c.id for c in clusters]))
+
+            # results of compressed files are returned as soon as they are available
+            with multiprocessing.Pool(2) as pool:
+                parser = clustering_parser.ParallelClusteringParser(filename, processes=2, ordered=False)
+                results = list(parser._map_shards(pool, delayed_shard, iter(range(6)), False))
+                self.assertEqual(list(range(6)), sorted(results))
+                self.assertNotEqual(0, results[0])
+
+                self.assertEqual(list(range(6)), list(parser._map_shards(pool, delayed_shard, iter(range(6)), True)))
+
+                # errors of the workers are raised
+                with self.assertRaises(ValueError):
+                    list(parser._map_shards(pool, delayed_shard, iter([1, -1, 2]), False))
+
+                # terminating a pool with pending tasks may block
+                pool.close()
+                pool.join()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_analyse(self):
+        analyser = id_transferer.IdTransferer()
+        for cluster in self.clusters:
+            analyser.process_cluster(cluster)
+
+        parser = clustering_parser.ParallelClusteringParser(self.testfile, processes=3, shard_size=100000)
+        shard_analysers = parser.analyse(id_transferer.IdTransferer())
+
+        self.assertEqual(len(parser.get_shards()), len(shard_analysers))
+        self.assertEqual(len(analyser.identification_references),
+                         sum([len(a.identification_references) for a in shard_analysers]))
+
+        def combine(analyser1, analyser2):
+            analyser1.identification_references += analyser2.identification_references
+            return analyser1
+
+        combined_analyser = parser.analyse(id_transferer.IdTransferer(), reduce_function=combine)
+        self.assertEqual([r.spec_id for r in analyser.identification_references],
+                         [r.spec_id for r in combined_analyser.identification_references])
+
+
+if __name__ == "__main__":
+    unittest.main()
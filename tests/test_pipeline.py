@@ -0,0 +1,73 @@
+import unittest
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.abspath('..'))
+from spectra_cluster.analyser.pipeline import AnalyserPipeline
+from spectra_cluster.analyser.clustering_stats import ClusteringStatsAnalyser
+from spectra_cluster.analyser.spectra_in_cluster import SpectraInClusterExporter
+from spectra_cluster.analyser.exporter.mgf_exporter import MgfExporter
+from spectra_cluster.analyser.id_transferer import IdTransferer
+from spectra_cluster.analyser.common import process_clustering_file
+from spectra_cluster.ui import clustering_stats
+
+
+class AnalyserPipelineTest(unittest.TestCase):
+    """
+    Test case for the AnalyserPipeline class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+
+    def test_pipeline(self):
+        for processes in (1, 3):
+            with tempfile.TemporaryFile(mode="w+") as mgf_file, tempfile.TemporaryFile(mode="w+") as table_file:
+                stats = ClusteringStatsAnalyser()
+                exporter = MgfExporter(mgf_file)
+                exporter.min_size = 3
+                spectra_exporter = SpectraInClusterExporter(table_file)
+                spectra_exporter.write_header()
+                id_transferer = IdTransferer(True, True)
+
+                pipeline = AnalyserPipeline([stats, exporter, spectra_exporter, id_transferer])
+                pipeline.run(self.testfile, processes=processes)
+
+                mgf_file.seek(0)
+                self.assertEqual(321, mgf_file.read().count("BEGIN IONS"))
+
+                table_file.seek(0)
+                lines = table_file.readlines()
+                self.assertEqual("cluster_id\tspectrum_title\n", lines[0])
+                self.assertEqual(stats.total_spectra, len(lines) - 1)
+
+            self.assertEqual(3149, len(id_transferer.identification_references))
+
+            statistics = stats.get_statistics(self.testfile)
+            expected_statistics = clustering_stats.determine_clustering_accuracy(self.testfile)
+
+            self.assertEqual(838, statistics.total_clusters)
+
+            for field in ("total_clusters", "total_spectra", "identified_spectra", "clustered_spectra",
+                          "clustered_identified_spectra", "min_size_clusters"):
+                self.assertEqual(getattr(expected_statistics, field), getattr(statistics, field))
+
+            self.assertAlmostEqual(expected_statistics.correct_spectra, statistics.correct_spectra)
+
+    def test_id_transferer_sink(self):
+        # the pipeline passes the same references to the sink as the id_transferer_cli
+        expected = process_clustering_file(self.testfile, IdTransferer(True, True)).identification_references
+
+        for processes in (1, 3):
+            references = list()
+            id_transferer = IdTransferer(True, True, sink=references.append)
+            AnalyserPipeline([ClusteringStatsAnalyser(), id_transferer]).run(self.testfile, processes=processes)
+
+            self.assertEqual(0, len(id_transferer.identification_references))
+            self.assertEqual([(r.filename, r.spec_id, [str(p) for p in r.psms], r.changed_through_clustering)
+                              for r in expected],
+                             [(r.filename, r.spec_id, [str(p) for p in r.psms], r.changed_through_clustering)
+                              for r in references])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+from spectra_cluster import sequences
+
+
+class SequencesTest(unittest.TestCase):
+    """
+    Test case for the sequence normalization functions
+    """
+    def test_clean_sequence(self):
+        self.assertEqual("PEPTIDEK", sequences.clean_sequence("PEPTIDEK"))
+        self.assertEqual("PEPTIDEK", sequences.clean_sequence("pep(+42.01)TIDE_k"))
+        self.assertEqual("PEPTIDEK", sequences.clean_sequence("+PEP[+15.99]TIDEK.2"))
+        self.assertEqual("", sequences.clean_sequence("123"))
+        self.assertEqual("PEPSSK", sequences.clean_sequence("PEPßKé"))
+
+    def test_clean_sequence_keep_case(self):
+        self.assertEqual("TIDE", sequences.clean_sequence("pepTIDE-k", upper_case=False))
+        self.assertEqual("PK", sequences.clean_sequence("PßK", upper_case=False))
+
+    def test_il(self):
+        self.assertEqual("LLLPEK", sequences.fold_il("ILIPEK"))
+        self.assertEqual("LLLPEK", sequences.clean_il_sequence("iLi(+1)PEK"))
+
+    def test_shared(self):
+        sequence = "".join(["PEP", "TIDEK"])
+        self.assertIs(sequences.clean_sequence("PEPTIDEK"), sequences.clean_sequence(sequence))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath('..'))
+import spectra_cluster.clustering_parser as clustering_parser
+import spectra_cluster.spectrum_cluster_table as spectrum_cluster_table
+
+
+class SpectrumClusterTableTest(unittest.TestCase):
+    """
+    Test case for the SpectrumClusterTable class
+    """
+    def setUp(self):
+        self.testfile = os.path.join(os.path.dirname(__file__), "test.clustering")
+        self.testfile1 = os.path.join(os.path.dirname(__file__), "testfiles", "kuester_test_short.clustering")
+        self.testfile2 = os.path.join(os.path.dirname(__file__), "testfiles",
+                                      "kuester_test_short_adapted.clustering")
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_spectrum_key(self):
+        self.assertEqual("index=3", spectrum_cluster_table.get_spectrum_key("#file=test.mgf#id=index=3#title=Spec 3"))
+        self.assertEqual(b"index=3", spectrum_cluster_table.get_spectrum_key(b"#file=test.mgf#id=index=3"))
+        self.assertEqual("Spec 3", spectrum_cluster_table.get_spectrum_key("Spec 3"))
+
+    def test_build(self):
+        # use small buffers to test the bucketing
+        buffer_size = spectrum_cluster_table.BUFFER_SIZE
+        spectrum_cluster_table.BUFFER_SIZE = 100
+
+        try:
+            table = spectrum_cluster_table.build_from_clustering_file(
+                self.testfile, os.path.join(self.temp_dir, "table"))
+        finally:
+            spectrum_cluster_table.BUFFER_SIZE = buffer_size
+
+        n_spectra = 0
+        for cluster in clustering_parser.ClusteringParser(self.testfile):
+            for spectrum in cluster.get_spectra():
+                self.assertEqual(cluster.id, table.get(spectrum.get_id()))
+                n_spectra += 1
+
+        self.assertEqual(n_spectra, len(table))
+        self.assertEqual(838, len(table.cluster_ids))
+        self.assertFalse("missing" in table)
+        self.assertIsNone(table.get("missing"))
+
+        table.close()
+
+        # the table can be opened again
+        with spectrum_cluster_table.SpectrumClusterTable(os.path.join(self.temp_dir, "table")) as table:
+            self.assertEqual(n_spectra, len(table))
+
+        # existing tables are not overwritten
+        self.assertRaises(Exception, spectrum_cluster_table.SpectrumClusterTableBuilder,
+                          os.path.join(self.temp_dir, "table"))
+
+    def test_count_shared_spectra(self):
+        table1 = spectrum_cluster_table.build_from_clustering_file(self.testfile1, os.path.join(self.temp_dir, "1"))
+        table2 = spectrum_cluster_table.build_from_clustering_file(self.testfile2, os.path.join(self.temp_dir, "2"))
+
+        shared = table1.count_shared_spectra(table2)
+
+        self.assertEqual(1, len(shared))
+        self.assertEqual(10, shared[("7549a1a6-8307-45a5-b351-16182d2daa82",
+                                     "8549a1a6-8307-45a5-b351-16182d2daa82")])
+
+        table1.close()
+        table2.close()
+
+    def test_join_duplicates(self):
+        builder = spectrum_cluster_table.SpectrumClusterTableBuilder(os.path.join(self.temp_dir, "1"))
+        builder.add_cluster("A", ["s1", "s2", "s3"])
+        builder.add_cluster("B", ["s4"])
+        table1 = builder.close()
+
+        # s1 is part of two clusters
+        builder = spectrum_cluster_table.SpectrumClusterTableBuilder(os.path.join(self.temp_dir, "2"))
+        builder.add_cluster("C", ["s1", "s2"])
+        builder.add_cluster("D", ["s1", "s4", "s5"])
+        table2 = builder.close()
+
+        shared = table1.count_shared_spectra(table2)
+
+        self.assertEqual({("A", "C"): 2, ("A", "D"): 1, ("B", "D"): 1}, shared)
+
+        pairs = list()
+        for cluster_index, other_cluster_index in table1.join(table2, chunk_size=1):
+            pairs += zip(cluster_index.tolist(), other_cluster_index.tolist())
+
+        self.assertEqual(4, len(pairs))
+
+        table1.close()
+        table2.close()
+
+    def test_get_cluster_sizes(self):
+        builder = spectrum_cluster_table.SpectrumClusterTableBuilder(os.path.join(self.temp_dir, "1"))
+        builder.add_cluster("A", ["s1", "s2", "s3"])
+        builder.add_cluster("B", [])
+        builder.add_cluster("C", ["s1"])
+
+        with builder.close() as table:
+            self.assertEqual([3, 0, 1], table.get_cluster_sizes().tolist())
+            self.assertEqual([3, 0, 1], table.get_cluster_sizes(chunk_size=1).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()